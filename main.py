@@ -3,18 +3,21 @@ import sys
 import json
 import asyncio
 import logging
+import argparse
 import platform
-from datetime import datetime
 
-from webhook import send_message_async
+from webhook import send_message_async, close_notifier
 
 src_dir = os.path.join(os.path.dirname(__file__), 'src')
 sys.path.append(src_dir)
 
-from config import DATA_DIRS
+from config import DATA_DIRS, DEEPSEEK_AI, AI_BUDGET, DAEMON, PIPELINE
 from src.utils.historical_data import HistoricalDataCollector
 from src.utils.trend_analyzer import TrendAnalyzer
-from src.utils.data_reorganizer import reorganize_data
+from src.utils.data_reorganizer import iter_daily_rows, save_daily_data
+from src.utils.scheduler import Scheduler
+from src.utils.pipeline import Pipeline
+from src.utils import get_artifact_sink
 
 from src.ai.advisor import DeepseekAdvisor
 
@@ -30,24 +33,38 @@ logger = logging.getLogger(__name__)
 
 os.makedirs("reports", exist_ok=True)
 
-async def generate_analysis_report(force_update=False):
+async def _update_historical_data(collector, force_update):
+    if force_update:
+        logger.info("Force update of historical data...")
+        return await collector.collect_historical_data()
+    logger.info("Check and update historical data...")
+    return await collector.update_historical_data()
+
+async def generate_analysis_report(force_update=False, collector=None):
     logger.info("Start generating analysis report...")
     
     os.makedirs(DATA_DIRS['data'], exist_ok=True)
     
-    collector = HistoricalDataCollector(data_dir=DATA_DIRS['data'])
-    
-    if force_update:
-        logger.info("Force update of historical data...")
-        historical_data = await collector.collect_historical_data()
+    if collector is None:
+        async with HistoricalDataCollector(data_dir=DATA_DIRS['data']) as collector:
+            historical_data = await _update_historical_data(collector, force_update)
     else:
-        logger.info("Check and update historical data...")
-        historical_data = await collector.update_historical_data()
+        # A long-lived collector (daemon mode) keeps its session open between runs
+        historical_data = await _update_historical_data(collector, force_update)
     
     if not historical_data:
         logger.error("Failed to obtain historical data and unable to generate analysis report")
         return False
     
+    report = build_analysis_report(historical_data)
+    if report is None:
+        return False
+    
+    report_file = await publish_analysis_report(report)
+    
+    return True, report_file
+
+def build_analysis_report(historical_data):
     btc_count = len(historical_data.get("btc_price", []))
     ahr_count = len(historical_data.get("ahr999", []))
     fg_count = len(historical_data.get("fear_greed", []))
@@ -60,78 +77,104 @@ async def generate_analysis_report(force_update=False):
     
     if advice.get("status") == "error":
         logger.error(f"Failed to generate investment advice: {advice.get('message', 'Unknown error')}")
-        return False
-    
-    report = advice.get("formatted_output", "")
+        return None
     
+    return advice.get("formatted_output", "")
+
+async def publish_analysis_report(report):
     push_message = "🔔 BTCInvestment advice analysis report\n\n"
     push_message += f"{report}"
     
     await send_message_async(push_message)
     
-    report_file = f"{DATA_DIRS['reports']}/report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    with open(report_file, "w", encoding="utf-8") as f:
-        f.write(report)
+    report_file = get_artifact_sink().write('reports', 'report', report, ext='.txt')
     
     logger.info(f"The analysis report has been saved to: {report_file}")
     
     print("\n" + report)
     
-    return True, report_file
+    return report_file
 
-async def get_ai_investment_advice():
+def build_daily_rows(historical_data):
+    # daily_data.json is still written for other readers, the rows themselves are passed on in memory
+    rows = list(iter_daily_rows(historical_data))
+    output_file = os.path.join(DATA_DIRS['data'], "daily_data.json")
+    if rows and save_daily_data(rows, output_file):
+        print(f"Data integration successful! Data files organized by date have been generated: {output_file}\n")
+    return rows
+
+async def get_ai_investment_advice(advisor=None, rows=None):
     print("=== AI Investment Advisor (DeepSeek R1) ===\n")
     
     data_file = "data/daily_data.json"
-    if not os.path.exists(data_file):
+    if rows is None and not os.path.exists(data_file):
         print("Error: The integrated data file was not found.")
         return
     
-    advisor = DeepseekAdvisor()
+    owns_advisor = advisor is None
+    if owns_advisor:
+        advisor = DeepseekAdvisor()
     
-    months = 6
-    print(f"analyze data from the last {months} ​​months")
+    print(f"analyze data within a budget of {AI_BUDGET['max_prompt_tokens']} prompt tokens")
     
     max_retries = 2
     retry_delay = 2.0
     
     try:
-        try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        if rows is None:
+            try:
+                with open(data_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
                 
-            if isinstance(data, list):
-                print("Note: Preparing data format for AI processing...")
-                wrapped_data = {"responses": data}
+                if isinstance(data, list):
+                    print("Note: Preparing data format for AI processing...")
+                    wrapped_data = {"responses": data}
                 
-                temp_file = data_file + ".temp"
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    json.dump(wrapped_data, f, ensure_ascii=False, indent=2)
+                    temp_file = data_file + ".temp"
+                    with open(temp_file, 'w', encoding='utf-8') as f:
+                        json.dump(wrapped_data, f, ensure_ascii=False, indent=2)
                 
-                data_file = temp_file
-                print("The data format has been adjusted, continue processing...")
-        except Exception as e:
-            logger.warning(f"Error reading data file: {str(e)}")
-            print(f"warn: Error reading data file: {str(e)}，")
+                    data_file = temp_file
+                    print("The data format has been adjusted, continue processing...")
+            except Exception as e:
+                logger.warning(f"Error reading data file: {str(e)}")
+                print(f"warn: Error reading data file: {str(e)}，")
         
         print("\nGetting AI investment advice, please wait...\n")
         print(f"Configured maximum number of retries: {max_retries}, retry interval: {retry_delay} seconds")
         
-        advice = advisor.get_investment_advice(
-            data_file=data_file, 
-            months=months, 
-            max_retries=max_retries, 
-            retry_delay=retry_delay
-        )
+        sections_sent = 0
+        
+        async def push_section(section):
+            # In streaming mode each finished report section is pushed as soon as it completes
+            nonlocal sections_sent
+            header = "🤖 AI investment advisor advice\n\n" if sections_sent == 0 else ""
+            # Queued without waiting so the stream keeps flowing; close_notifier() flushes at exit
+            await send_message_async(f"{header}{section}", wait=False)
+            sections_sent += 1
+        
+        try:
+            advice = await advisor.get_investment_advice_async(
+                data_file=data_file, 
+                rows=rows,
+                max_retries=max_retries, 
+                retry_delay=retry_delay,
+                on_section=push_section if DEEPSEEK_AI['stream'] else None
+            )
+        finally:
+            if owns_advisor:
+                await advisor.aclose()
         
         if advice:
             print("\nSuccessfully Obtain AI Investment Advice:")
             print(advice)
             
-            push_message = "🤖 AI investment advisor advice\n\n"
-            push_message += f"{advice}"
-            
-            await send_message_async(push_message)
+            if not sections_sent:
+                push_message = "🤖 AI investment advisor advice\n\n"
+                push_message += f"{advice}"
+                
+                await send_message_async(push_message)
+            return advice
         else:
             print("Error: Failed to obtain AI investment advice")
             print("Possible reasons: API server connection problem, invalid API key, or request timeout")
@@ -154,51 +197,64 @@ async def get_ai_investment_advice():
         logger.debug(error_details)
         print(f"Error details are recorded in the log file")
 
-async def main():
+def build_pipeline(force_update=False):
+    # collect feeds the rule-based report and, concurrently, reorganize -> ai; values are passed in memory
+    pipeline = Pipeline(state_dir=PIPELINE['state_dir'])
+    
+    async def collect():
+        print("Checking for data updates, please wait...\n")
+        async with HistoricalDataCollector(data_dir=DATA_DIRS['data']) as collector:
+            try:
+                historical_data = await _update_historical_data(collector, force_update)
+            except Exception as e:
+                logger.error(f"Error updating historical data: {str(e)}")
+                historical_data = None
+            if not historical_data:
+                # An outage should not stop the run: report and advise on the cached history instead
+                logger.warning("Failed to update historical data, falling back to the cached history")
+                historical_data = collector.load_historical_data()
+        if not historical_data:
+            raise RuntimeError("Failed to obtain historical data")
+        return historical_data
+    
+    async def report(historical_data):
+        report = await asyncio.to_thread(build_analysis_report, historical_data)
+        if report is None:
+            raise RuntimeError("Failed to generate the analysis report")
+        return await publish_analysis_report(report)
+    
+    async def ai(daily_rows):
+        print("AI investment advice being generated...\n")
+        advice = await get_ai_investment_advice(rows=daily_rows)
+        if not advice:
+            raise RuntimeError("No AI investment advice was obtained")
+        return advice
+    
+    def history_without_timestamp(inputs):
+        # last_updated moves on every refresh even when no new data arrived
+        return {key: value for key, value in inputs['historical_data'].items() if key != 'last_updated'}
+    
+    pipeline.add_stage('collect', collect, outputs=['historical_data'])
+    pipeline.add_stage('report', report, inputs=['historical_data'], outputs=['report_file'],
+                       fingerprint=history_without_timestamp)
+    pipeline.add_stage('reorganize', build_daily_rows, inputs=['historical_data'], outputs=['daily_rows'],
+                       fingerprint=history_without_timestamp)
+    pipeline.add_stage('ai', ai, inputs=['daily_rows'], outputs=['advice'])
+    return pipeline
+
+async def main(only_changed=False):
 
     try:
 
         print("\n====== Cryptocurrency Monitoring System ======")
         print("Support analysis: BTC price, AHR999 index and fear and greed index")
 
-        print("Checking for data updates, please wait...\n")
-        
-        try:
-            await generate_analysis_report(force_update=False)
-        except Exception as e:
-            logger.error(f"Error generating analysis report: {str(e)}")
-            print(f"Error generating analysis report: {str(e)}")
-        
-        try:
-            data_dir = DATA_DIRS['data']
-            input_file = os.path.join(data_dir, "historical_data.json")
-            output_file = os.path.join(data_dir, "daily_data.json")
-            
-            os.makedirs(data_dir, exist_ok=True)
-            
-            if not os.path.exists(input_file):
-                logger.error(f"The input file does not exist: {input_file}")
-                print(f"Error: The input file does not exist: {input_file}")
-                return 1
-            
-            print("Integrating data into a date-organized format...\n")
-            success = reorganize_data(input_file, output_file)
-            
-            if success:
-                print(f"Data integration successful! Data files organized by date have been generated: {output_file}")
-                print(f"Data file processing completed: {output_file}\n")
-            else:
-                print("Data integration failed, please check the log for details\n")
-        except Exception as e:
-            print(f"Errors during data integration: {str(e)}")
-            logger.error(f"Errors during data integration: {str(e)}")
+        pipeline = build_pipeline()
+        values = await pipeline.run(only_changed=only_changed)
         
-        try:
-            print("AI investment advice being generated...\n")
-            await get_ai_investment_advice()
-        except Exception as e:
-            logger.error(f"Errors in generating AI investment advice: {str(e)}")
-            print(f"Errors in generating AI investment advice: {str(e)}")
+        if 'historical_data' not in values:
+            print("Error: Failed to obtain historical data, nothing else could run")
+            return 1
         
         print("\nProcessing completed, program exits")
 
@@ -210,10 +266,72 @@ async def main():
         import traceback
         logger.debug(traceback.format_exc())
         return 1
+    finally:
+        await close_notifier()
 
     return 0
 
+async def run_daemon():
+    # Keeps the collector (and its HTTP pool), the advisor and the notifier alive between runs
+    print("\n====== Cryptocurrency Monitoring System (daemon) ======")
+    
+    collector = HistoricalDataCollector(data_dir=DATA_DIRS['data'])
+    await collector.open_session()
+    advisor = DeepseekAdvisor()
+    # Stages that write or read the data files take turns; the model call itself runs outside the lock
+    data_lock = asyncio.Lock()
+    
+    async def refresh_prices():
+        # The collectors keep daily data for a day; here the schedule decides, so today's open
+        # candle and AHR999 point are fetched again on every run
+        async with data_lock:
+            await collector.refresh_series(["btc_price", "ahr999"], max_age=0)
+    
+    async def refresh_fear_greed():
+        async with data_lock:
+            await collector.refresh_series(["fear_greed"])
+    
+    async def report():
+        async with data_lock:
+            await generate_analysis_report(collector=collector)
+    
+    async def ai_advice():
+        async with data_lock:
+            historical_data = collector.load_historical_data()
+            rows = await asyncio.to_thread(build_daily_rows, historical_data) if historical_data else None
+        if rows:
+            await get_ai_investment_advice(advisor=advisor, rows=rows)
+    
+    stages = {
+        'prices': refresh_prices,
+        'fear_greed': refresh_fear_greed,
+        'report': report,
+        'ai': ai_advice
+    }
+    
+    scheduler = Scheduler(shutdown_timeout=DAEMON['shutdown_timeout'])
+    for name, settings in DAEMON['stages'].items():
+        scheduler.add_job(name, stages[name], **settings)
+    scheduler.install_signal_handlers()
+    
+    try:
+        await scheduler.run()
+    finally:
+        await collector.close_session()
+        await advisor.aclose()
+        await close_notifier()
+        for name, stats in scheduler.get_stats().items():
+            logger.info(f"Stage {name}: {stats['runs']} runs, {stats['failures']} failed, {stats['skipped']} skipped")
+    
+    return 0
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BTC price, AHR999 and fear and greed monitoring")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and execute the stages on the schedules in config.DAEMON")
+    parser.add_argument("--only-changed", action="store_true", default=PIPELINE['only_changed'],
+                        help="skip stages whose inputs are unchanged since their last successful run")
+    args = parser.parse_args()
 
-    exit_code = asyncio.run(main())
+    exit_code = asyncio.run(run_daemon() if args.daemon else main(only_changed=args.only_changed))
     sys.exit(exit_code) 
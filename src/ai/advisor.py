@@ -6,9 +6,12 @@ from typing import Dict, Any, Optional, List, Union
 
 
 from ai.deepseek import DeepseekAPI
+from ai.prompt import get_investment_advice_template, estimate_tokens
+from ai.budget import HistoryBudget
+from utils.artifact_sink import get_artifact_sink
 
 
-from config import DATA_DIRS
+from config import DATA_DIRS, PROMPT_ENCODING, AI_BUDGET
 
 
 logger = logging.getLogger(__name__)
@@ -23,25 +26,47 @@ class DeepseekAdvisor:
         
         logger.info("DeepSeek Advisor initialization completed")
     
-    def get_investment_advice(self, data_file: str, months: int = 3, last_record_id: str = None, 
+    async def aclose(self) -> None:
+        await self.api.aclose()
+    
+    def get_investment_advice(self, data_file: str, months: Optional[int] = None, last_record_id: str = None, 
                             debug: bool = False, max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Optional[str]:
-       
-        filtered_data = self._prepare_data_for_ai(data_file, months)
+        return self.api._run_sync(self.get_investment_advice_async, data_file, months=months, last_record_id=last_record_id,
+                                  debug=debug, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+    
+    async def get_investment_advice_async(self, data_file: Optional[str] = None, months: Optional[int] = None, last_record_id: str = None, 
+                            debug: bool = False, max_retries: int = 2, retry_delay: float = 2.0,
+                            encoding: Dict[str, Any] = None, budget: Dict[str, Any] = None,
+                            rows: Optional[List[Dict]] = None, **kwargs) -> Optional[str]:
+        # Daily rows can be handed over in memory instead of being read back from data_file
+        if rows is not None:
+            filtered_data = self._filter_rows(rows, months)
+        else:
+            filtered_data = self._prepare_data_for_ai(data_file, months)
         if not filtered_data:
             logger.error("Failed to prepare data for AI analysis")
             return None
-            
-        data_json = json.dumps(filtered_data, ensure_ascii=False)
         
-        logger.info(f"Start generating investment recommendations using data from the last {months} ​​months...")
+        # The budget decides how much of the history fits, daily for recent weeks and monthly before that
+        budget = {**AI_BUDGET, **(budget or {})}
+        if months:
+            budget['max_months'] = months
+        selector = HistoryBudget(encoding={**PROMPT_ENCODING, **(encoding or {})}, **budget)
+        
+        overhead = estimate_tokens(get_investment_advice_template(current_date=datetime.now().strftime('%Y-%m-%d')))
+        data_json, data_encoding = selector.select(filtered_data, overhead=overhead)
+        kwargs.setdefault('data_format', HistoryBudget.describe(data_encoding))
+        
+        logger.info(f"Start generating investment recommendations using data since {data_encoding['start_date']}...")
         
         try:
-            result = self.api.generate_and_save_investment_advice(
+            result = await self.api.generate_and_save_investment_advice_async(
                 data_json=data_json,
                 last_record_id=last_record_id,
                 debug=debug,
                 max_retries=max_retries,
                 retry_delay=retry_delay,
+                data_encoding=data_encoding,
                 **kwargs
             )
             
@@ -63,7 +88,22 @@ class DeepseekAdvisor:
             logger.debug(traceback.format_exc())
             return None
     
-    def _prepare_data_for_ai(self, data_file: str, months: int) -> List[Dict]:
+    def _filter_rows(self, rows: List[Dict], months: Optional[int] = None) -> List[Dict]:
+        filtered_data = [item for item in rows if isinstance(item, dict) and isinstance(item.get('date'), str) and item['date']]
+        
+        if months:
+            start_date = (datetime.today() - timedelta(days=30 * months)).strftime('%Y-%m-%d')
+            recent_data = [item for item in filtered_data if item['date'] >= start_date]
+            if recent_data:
+                filtered_data = recent_data
+            else:
+                logger.warning(f"No data found starting from {start_date}, letting the token budget size the history")
+        
+        filtered_data.sort(key=lambda x: x.get('date', ''), reverse=True)
+        
+        return filtered_data
+    
+    def _prepare_data_for_ai(self, data_file: str, months: Optional[int] = None) -> List[Dict]:
         try:
             if not os.path.exists(data_file):
                 logger.error(f"The data file does not exist: {data_file}")
@@ -103,30 +143,7 @@ class DeepseekAdvisor:
                 logger.error("Data format error: Not all items in the list are dictionary types")
                 return []
             
-            today = datetime.today()
-            start_date = (today - timedelta(days=30 * months)).strftime('%Y-%m-%d')
-            
-            filtered_data = []
-            for item in all_data:
-                if not isinstance(item, dict):
-                    continue
-                    
-                date_str = item.get('date')
-                if not date_str or not isinstance(date_str, str):
-                    continue
-                    
-                if date_str >= start_date:
-                    filtered_data.append(item)
-            
-            if not filtered_data:
-                logger.warning(f"No data found starting from {start_date}")
-
-                filtered_data = all_data[:min(100, len(all_data))]
-                logger.info(f"Return all available data (up to 100 records)")
-            
-            filtered_data.sort(key=lambda x: x.get('date', ''), reverse=True)
-            
-            return filtered_data
+            return self._filter_rows(all_data, months)
             
         except Exception as e:
             logger.error(f"Errors in preparing data for AI analysis: {str(e)}")
@@ -136,15 +153,8 @@ class DeepseekAdvisor:
     
     def _save_advice_to_file(self, advice: str) -> bool:
         try:
-
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"advice_{timestamp}.md"
-            filepath = os.path.join(self.advice_dir, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(advice)
-            
-            logger.info(f"Investment advice has been saved to: {filepath}")
+            filepath = get_artifact_sink().write('advices', 'advice', advice, ext='.md')
+            logger.info(f"Investment advice will be saved to: {filepath}")
             return True
             
         except Exception as e:
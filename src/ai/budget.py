@@ -0,0 +1,191 @@
+import os
+import json
+import logging
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+from ai.prompt import encode_market_data, estimate_tokens, describe_market_data_encoding
+from utils.indicators import IndicatorEngine
+
+logger = logging.getLogger(__name__)
+
+# Indicators reported at the end of every summarized month and for the latest day
+SUMMARY_INDICATORS = ("sma_30", "sma_90", "rsi_14", "volatility_30")
+LATEST_INDICATORS = ("sma_7", "sma_30", "sma_90", "rsi_14", "volatility_30", "change_30d", "percentile")
+
+SUMMARY_PRECISION = {
+    "open": 0, "close": 0, "low": 0, "high": 0, "ahr999": 3, "fear_greed_value": 0,
+    "sma_30": 0, "sma_90": 0, "rsi_14": 1, "volatility_30": 2,
+}
+
+
+def _mean(values: List[Any]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+
+class HistoryBudget:
+    # Picks how much history goes into the prompt: daily rows for the most recent days,
+    # monthly summaries with indicators before that, as much of both as the token budget allows
+
+    def __init__(self, max_prompt_tokens: int = 6000, latency_target: Optional[float] = None,
+                 prompt_tokens_per_second: float = 1500.0, min_daily_days: int = 14, max_daily_days: int = 120,
+                 max_months: Optional[int] = 36, encoding: Dict[str, Any] = None):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.latency_target = latency_target
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.min_daily_days = min_daily_days
+        self.max_daily_days = max_daily_days
+        self.max_months = max_months
+        self.encoding = encoding or {}
+
+    def token_limit(self, overhead: int = 0) -> int:
+        limit = self.max_prompt_tokens
+        if self.latency_target:
+            limit = min(limit, int(self.latency_target * self.prompt_tokens_per_second))
+        return max(limit - overhead, 0)
+
+    def select(self, rows: List[Dict[str, Any]], overhead: int = 0) -> Tuple[str, Dict[str, Any]]:
+        rows = sorted((row for row in rows if row.get('date')), key=lambda row: row['date'])
+        if not rows:
+            return "", {}
+        limit = self.token_limit(overhead)
+        engine = IndicatorEngine.from_records(rows, 'price')
+
+        # Largest daily window that still leaves room for the monthly summaries
+        low = min(self.min_daily_days, len(rows))
+        high = min(self.max_daily_days, len(rows))
+        best = self._build(rows, engine, low)
+        if best[1]["estimated_tokens"] > limit:
+            best = self._trim_months(rows, engine, low, limit)
+        else:
+            while low < high:
+                middle = (low + high + 1) // 2
+                candidate = self._build(rows, engine, middle)
+                if candidate[1]["estimated_tokens"] <= limit:
+                    best, low = candidate, middle
+                else:
+                    high = middle - 1
+
+        text, selection = best
+        selection["token_limit"] = limit
+        logger.info(f"Selected {selection['daily_days']} daily rows and {selection['summary_months']} monthly summaries, "
+                    f"about {selection['estimated_tokens']} of {limit} tokens")
+        return text, selection
+
+    def _trim_months(self, rows, engine, daily_days: int, limit: int) -> Tuple[str, Dict[str, Any]]:
+        months = self._build(rows, engine, daily_days)[1]["summary_months"]
+        while months > 0:
+            months -= 1
+            candidate = self._build(rows, engine, daily_days, max_months=months)
+            if candidate[1]["estimated_tokens"] <= limit:
+                return candidate
+        logger.warning(f"Even {daily_days} daily rows exceed the budget of {limit} tokens")
+        return self._build(rows, engine, daily_days, max_months=0)
+
+    def _build(self, rows, engine, daily_days: int, max_months: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+        if max_months is None:
+            max_months = self.max_months
+        fmt = self.encoding.get('format', 'csv')
+        split = len(rows) - daily_days
+
+        daily = rows[split:][::-1]
+        summary = self.summarize_months(rows[:split], engine, max_months)
+
+        parts = [self._latest_line(rows[-1]['date'], engine)]
+        if summary:
+            parts.append("Monthly summary (newest first):")
+            parts.append(encode_market_data(summary, fmt=fmt, delta_dates=False, precision=SUMMARY_PRECISION))
+        parts.append("Daily data (newest first):")
+        parts.append(encode_market_data(
+            daily,
+            fmt=fmt,
+            delta_dates=self.encoding.get('delta_dates', True),
+            precision=self.encoding.get('precision'),
+            weekly_after_days=self.encoding.get('weekly_after_days')
+        ))
+        text = "\n".join(parts)
+
+        return text, {
+            "fmt": fmt,
+            "delta_dates": self.encoding.get('delta_dates', True),
+            "precision": self.encoding.get('precision'),
+            "weekly_after_days": self.encoding.get('weekly_after_days'),
+            "daily_days": len(daily),
+            "summary_months": len(summary),
+            "start_date": summary[-1]["month"] if summary else daily[-1]["date"],
+            "estimated_tokens": estimate_tokens(text),
+        }
+
+    def summarize_months(self, rows: List[Dict[str, Any]], engine: IndicatorEngine,
+                         max_months: Optional[int] = None) -> List[Dict[str, Any]]:
+        months: Dict[str, List[int]] = {}
+        for index, row in enumerate(rows):
+            if row.get('price') is not None:
+                months.setdefault(row['date'][:7], []).append(index)
+
+        summary = []
+        for month in sorted(months, reverse=True)[:max_months]:
+            indexes = months[month]
+            prices = [rows[i]['price'] for i in indexes]
+            entry = {
+                "month": month,
+                "open": prices[0],
+                "close": prices[-1],
+                "low": min(prices),
+                "high": max(prices),
+                "ahr999": _mean([rows[i].get('ahr999') for i in indexes]),
+                "fear_greed_value": _mean([rows[i].get('fear_greed_value') for i in indexes]),
+            }
+            month_end = engine.index_of(rows[indexes[-1]]['date'])
+            for name in SUMMARY_INDICATORS:
+                entry[name] = engine.value_at(name, month_end) if month_end is not None else None
+            summary.append(entry)
+        return summary
+
+    def _latest_line(self, date: str, engine: IndicatorEngine) -> str:
+        values = []
+        for name in LATEST_INDICATORS:
+            value = engine.latest(name)
+            if value is not None:
+                values.append(f"{name}={value:.2f}")
+        return f"Price indicators as of {date}: " + ", ".join(values)
+
+    @staticmethod
+    def describe(selection: Dict[str, Any]) -> str:
+        label = describe_market_data_encoding(**selection)
+        if selection.get("summary_months"):
+            label = (f"latest price indicators, {selection['summary_months']} monthly summaries with month-end "
+                     f"indicators, then {selection['daily_days']} daily rows; the daily rows are a {label}")
+        return label
+
+
+def benchmark_history_sizes(rows: List[Dict[str, Any]], months_list=(1, 3, 6, 12, 24, 36),
+                            encoding: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    # Prompt payload size for growing amounts of history, raw JSON against the budgeted encoding
+    rows = sorted((row for row in rows if row.get('date')), key=lambda row: row['date'])
+    results = []
+    for months in months_list:
+        window = rows[-months * 30:]
+        raw = json.dumps(window[::-1], ensure_ascii=False)
+        budget = HistoryBudget(max_prompt_tokens=10 ** 9, max_daily_days=len(window), max_months=months, encoding=encoding)
+        daily_only, _ = budget.select(window)
+        budget.max_daily_days = min(len(window), 60)
+        compact, selection = budget.select(window)
+        results.append({
+            "months": months,
+            "rows": len(window),
+            "json_tokens": estimate_tokens(raw),
+            "daily_tokens": estimate_tokens(daily_only),
+            "summarized_tokens": selection["estimated_tokens"],
+        })
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(os.path.join("data", "daily_data.json"), 'r', encoding='utf-8') as f:
+        daily_rows = json.load(f)["data"]
+    for result in benchmark_history_sizes(daily_rows):
+        print(result)
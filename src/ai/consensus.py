@@ -0,0 +1,51 @@
+import json
+import logging
+from collections import Counter
+from statistics import median
+from typing import Dict, Any, List
+
+from ai.prompt import locate_json_object, parse_number
+
+logger = logging.getLogger(__name__)
+
+# Fields of the structured decision block merged across models
+NUMERIC_FIELDS = ("position", "stop_loss", "target_short", "target_mid", "cost_basis")
+CATEGORICAL_FIELDS = ("market_state", "decision_keyword", "action", "market_cycle")
+
+
+def merge_advice_data(answers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Median of the numbers and majority of the keywords; the first answer breaks ties
+    # and supplies every field that is not merged
+    merged = dict(answers[0])
+
+    for field in NUMERIC_FIELDS:
+        values = [number for number in (parse_number(answer.get(field)) for answer in answers) if number is not None]
+        if values:
+            value = median(values)
+            merged[field] = int(value) if value.is_integer() else round(value, 2)
+
+    for field in CATEGORICAL_FIELDS:
+        values = [answer.get(field) for answer in answers if isinstance(answer.get(field), str)]
+        if values:
+            counts = Counter(values)
+            top = max(counts.values())
+            merged[field] = next(value for value in values if counts[value] == top)
+
+    return merged
+
+
+def representative_index(answers: List[Dict[str, Any]], merged: Dict[str, Any]) -> int:
+    # The answer whose position is closest to the consensus position
+    target = parse_number(merged.get("position"))
+    if target is None:
+        return 0
+    distances = [abs((parse_number(answer.get("position")) or 0.0) - target) for answer in answers]
+    return distances.index(min(distances))
+
+
+def replace_json_block(text: str, data: Dict[str, Any]) -> str:
+    located = locate_json_object(text)
+    if located is None:
+        return f"{text}\n\n```json\n{json.dumps(data, ensure_ascii=False, indent=2)}\n```"
+    start, end, _ = located
+    return text[:start] + json.dumps(data, ensure_ascii=False, indent=2) + text[end:]
@@ -1,35 +1,114 @@
 import os
 import json
+import time
 import uuid
 import yaml
+import asyncio
+import aiohttp
+import contextlib
 import logging
-import requests
-import time
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, AsyncIterator, Awaitable, Callable
 
-from config import DEEPSEEK_AI, DATA_DIRS
+from config import DEEPSEEK_AI, DATA_DIRS, HTTP_POOL, LLM_CACHE
+from utils.resilience import (
+    RETRYABLE_STATUSES,
+    CircuitOpenError,
+    RetryableError,
+    call_with_retries,
+    get_host_guard,
+    parse_retry_after
+)
+from utils.artifact_sink import get_artifact_sink
 
 from ai.prompt import (
     get_investment_advice_template, 
     prepare_investment_advice_params,
     save_prompt_for_debug,
-    extract_json_from_text
+    extract_advice_data,
+    describe_market_data_encoding,
+    ADVICE_SCHEMA,
+    SectionBuffer
 )
+from ai.response_cache import ResponseCache
+from ai.consensus import merge_advice_data, representative_index, replace_json_block
+from ai.record_store import InvestmentRecordStore
 
 logger = logging.getLogger(__name__)
 
+FANOUT_MODES = ('first', 'quorum')
+
+INCOMPLETE_NOTICE = "⚠️ The advice stream was interrupted, the sections above are incomplete and were not saved."
+
+
+class IncompleteStreamError(Exception):
+    # The stream stopped before [DONE] or a finish_reason, so the text received so far is truncated
+    pass
+
+
 class DeepseekAPI:
     
-    def __init__(self, api_key: str = None, api_url: str = None):
+    def __init__(self, api_key: str = None, api_url: str = None, session: aiohttp.ClientSession = None):
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
         self.api_url = api_url or DEEPSEEK_AI['api_url']
         self.key_url = DEEPSEEK_AI['key_url']
+        
+        # Pooled session reused by every request; created lazily inside the running loop
+        self._session = session
+        self._owns_session = session is None
+        
+        self._record_stores: Dict[str, InvestmentRecordStore] = {}
+        self.latency_stats: Dict[str, Dict[str, Any]] = {}
+        
+        self.response_cache = None
+        if LLM_CACHE['enabled']:
+            self.response_cache = ResponseCache(
+                DATA_DIRS['cache'],
+                ttl_seconds=LLM_CACHE['ttl_hours'] * 3600,
+                max_bytes=LLM_CACHE['max_mb'] * 1024 * 1024
+            )
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL['limit'],
+                limit_per_host=HTTP_POOL['limit_per_host'],
+                ttl_dns_cache=HTTP_POOL['ttl_dns_cache'],
+                keepalive_timeout=HTTP_POOL['keepalive_timeout']
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._owns_session = True
+        return self._session
+    
+    async def aclose(self) -> None:
+        if self._owns_session and self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._owns_session:
+            self._session = None
+    
+    async def __aenter__(self):
+        await self._get_session()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    def _run_sync(self, coro_func, *args, **kwargs):
+        # Blocking entry points for synchronous callers; not for use inside a running event loop
+        async def runner():
+            try:
+                return await coro_func(*args, **kwargs)
+            finally:
+                await self.aclose()
+        return asyncio.run(runner())
     
     def validate_api_key(self) -> bool:
         return bool(self.api_key)
     
-    def chat_completion(self, 
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> Optional[Dict[str, Any]]:
+        return self._run_sync(self.chat_completion_async, messages, **kwargs)
+    
+    async def chat_completion_async(self, 
                         messages: List[Dict[str, str]], 
                         model: str = None,
                         temperature: float = None,
@@ -38,12 +117,16 @@ class DeepseekAPI:
                         stream: bool = None,
                         max_retries: int = 2,
                         retry_delay: float = 2.0,
+                        request_timeout: float = None,
+                        deadline: float = None,
+                        api_url: str = None,
+                        api_key: str = None,
                         **kwargs) -> Optional[Dict[str, Any]]:
 
-        if not self.validate_api_key():
-            self.api_key = self.get_api_key(max_retries=max_retries, retry_delay=retry_delay)
+        if not api_key and not self.validate_api_key():
+            self.api_key = await self.get_api_key_async(max_retries=max_retries, retry_delay=retry_delay)
 
-        if not self.api_key:
+        if not api_key and not self.api_key:
             logger.warning("DeepSeek API key is not set, please provide it via environment variable DEEPSEEK_API_KEY or initialization parameter")
             return None
 
@@ -58,92 +141,186 @@ class DeepseekAPI:
         
         payload.update(kwargs)
         
+        request_timeout = request_timeout if request_timeout is not None else DEEPSEEK_AI['request_timeout']
+        deadline = deadline if deadline is not None else DEEPSEEK_AI['deadline']
+        
+        # The deadline bounds the whole call, retries and backoff included
+        try:
+            return await asyncio.wait_for(
+                self._post_with_retries(payload, max_retries, retry_delay, request_timeout,
+                                        api_url=api_url, api_key=api_key),
+                timeout=deadline
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"DeepSeek API call exceeded its deadline of {deadline} seconds")
+            return None
+    
+    async def _post_with_retries(self, payload: Dict[str, Any], max_retries: int, retry_delay: float,
+                                 request_timeout: float, api_url: str = None, api_key: str = None) -> Optional[Dict[str, Any]]:
+        api_url = api_url or self.api_url
         headers = {
             "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key or self.api_key}"
+        }
+        session = await self._get_session()
+        timeout = aiohttp.ClientTimeout(total=request_timeout)
+        
+        async def attempt():
+            logger.info(f"Calling DeepSeek API, model: {payload['model']}")
+            async with session.post(api_url, headers=headers, json=payload, timeout=timeout) as response:
+                if response.status == 200:
+                    try:
+                        result = await response.json(content_type=None)
+                    except ValueError as e:
+                        raise RetryableError(f"invalid JSON in API response: {str(e)}")
+                    logger.info("DeepSeek API call succeeded")
+                    return result
+                
+                text = await response.text()
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableError(f"{response.status} - {text}", status=response.status,
+                                         retry_after=parse_retry_after(response.headers.get("Retry-After")))
+                logger.error(f"API call failed: {response.status} - {text}")
+                return None
+        
+        try:
+            return await call_with_retries(api_url, attempt, max_retries, retry_delay, description="DeepSeek API call")
+        except CircuitOpenError as e:
+            logger.error(f"Skipping DeepSeek API call: {str(e)}")
+            return None
+    
+    def generate_text(self, prompt: str, max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Optional[str]:
+        return self._run_sync(self.generate_text_async, prompt, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+    
+    async def stream_chat_completion(self, 
+                        messages: List[Dict[str, str]], 
+                        model: str = None,
+                        temperature: float = None,
+                        max_tokens: int = None,
+                        top_p: float = None,
+                        max_retries: int = 2,
+                        retry_delay: float = 2.0,
+                        request_timeout: float = None,
+                        **kwargs) -> AsyncIterator[str]:
+        # Yields content deltas from a server-sent-event stream as they arrive
+
+        if not self.validate_api_key():
+            self.api_key = await self.get_api_key_async(max_retries=max_retries, retry_delay=retry_delay)
+
+        if not self.api_key:
+            logger.warning("DeepSeek API key is not set, please provide it via environment variable DEEPSEEK_API_KEY or initialization parameter")
+            return
+
+        payload = {
+            "model": model or DEEPSEEK_AI['model'],
+            "messages": messages,
+            "temperature": temperature if temperature is not None else DEEPSEEK_AI['temperature'],
+            "max_tokens": max_tokens if max_tokens is not None else DEEPSEEK_AI['max_tokens'],
+            "top_p": top_p if top_p is not None else DEEPSEEK_AI['top_p'],
+            "stream": True
+        }
+        payload.update(kwargs)
+        
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
             "Authorization": f"Bearer {self.api_key}"
         }
+        request_timeout = request_timeout if request_timeout is not None else DEEPSEEK_AI['request_timeout']
+        # Long generations are fine as long as chunks keep arriving
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=request_timeout, sock_read=request_timeout)
+        session = await self._get_session()
+        guard = get_host_guard(self.api_url)
         
-        retries = 1
-        while retries <= max_retries:
+        for attempt in range(1, max_retries + 1):
+            started = False
             try:
-                logger.info(f"Calling DeepSeek API, model: {payload['model']}, number of attempts: {retries}/{max_retries}")
-                response = requests.post(self.api_url, headers=headers, json=payload, timeout=60)
-                
-                if response.status_code == 200:
-                    logger.info("DeepSeek API call succeeded")
-                    return response.json()
-                elif response.status_code == 429:
-                    logger.warning(f"The API call is restricted (429), waiting to retry...")
-                    retries += 1
-                    if retries <= max_retries:
-                        wait_time = retry_delay * (2 ** (retries - 1))
-                        logger.info(f"Wait {wait_time} seconds before trying again...")
-                        time.sleep(wait_time)
-                    else:
-                        logger.error(f"The maximum number of retries has been reached and the API call failed: {response.status_code} - {response.text}")
-                        return None
-                elif response.status_code >= 500:
-                    logger.warning(f"Server error ({response.status_code}), try again...")
-                    retries += 1
-                    if retries <= max_retries:
-                        wait_time = retry_delay * (2 ** (retries - 1))
-                        logger.info(f"Wait {wait_time} seconds before trying again...")
-                        time.sleep(wait_time)
-                    else:
-                        logger.error(f"The maximum number of retries has been reached and the API call failed: {response.status_code} - {response.text}")
-                        return None
-                else:
-                    logger.error(f"API call failed: {response.status_code} - {response.text}")
-                    return None
+                await guard.before_request()
+            except CircuitOpenError as e:
+                logger.error(f"Skipping DeepSeek API stream: {str(e)}")
+                return
+            try:
+                logger.info(f"Streaming DeepSeek API, model: {payload['model']}, number of attempts: {attempt}/{max_retries}")
+                async with session.post(self.api_url, headers=headers, json=payload, timeout=timeout) as response:
+                    if response.status == 200:
+                        async for delta in self._iter_sse_content(response):
+                            started = True
+                            yield delta
+                        # Only a stream that reached [DONE] or a finish_reason counts for the breaker
+                        guard.record_success()
+                        logger.info("DeepSeek API stream completed")
+                        return
+                    
+                    text = await response.text()
+                    if response.status not in RETRYABLE_STATUSES:
+                        logger.error(f"Streaming request failed with non-retryable status {response.status}, "
+                                     f"nothing was streamed: {text}")
+                        return
+                    guard.record_failure(response.status, parse_retry_after(response.headers.get("Retry-After")))
+                    logger.warning(f"Streaming request failed ({response.status}), try again...")
+            except (asyncio.TimeoutError, aiohttp.ClientError, IncompleteStreamError) as e:
+                guard.record_failure()
+                # Text already handed to the caller cannot be taken back, so only retry before the first chunk
+                if started:
+                    raise IncompleteStreamError(f"DeepSeek API stream interrupted: {str(e) or type(e).__name__}") from e
+                logger.warning(f"Streaming request error: {str(e) or type(e).__name__}, try again...")
             
-            except requests.exceptions.Timeout:
-                logger.warning("API request timed out, try again...")
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = retry_delay * (2 ** (retries - 1))
-                    logger.info(f"Wait {wait_time} seconds before trying again...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error("The maximum number of retries has been reached and the API request has timed out.")
-                    return None
-            except requests.exceptions.ConnectionError:
-                logger.warning("API connection error, try again...")
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = retry_delay * (2 ** (retries - 1))
-                    logger.info(f"Wait {wait_time} seconds before trying again...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error("The maximum number of retries has been reached and the API connection has failed.")
-                    return None
-            except requests.exceptions.RequestException as e:
-
-                logger.error(f"API request exception: {str(e)}")
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = retry_delay * (2 ** (retries - 1))
-                    logger.info(f"Wait {wait_time} seconds before trying again...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"The maximum number of retries has been reached and the API request has failed: {str(e)}")
-                    return None
-            except Exception as e:
-                logger.error(f"Error calling DeepSeek API: {str(e)}")
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = retry_delay * (2 ** (retries - 1))
-                    logger.info(f"Wait {wait_time} seconds before trying again...")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"The maximum number of retries has been reached and an unknown error has occurred: {str(e)}")
-                    return None
+            if attempt < max_retries:
+                await asyncio.sleep(retry_delay * (2 ** attempt))
         
-        return None
+        logger.error("The maximum number of retries has been reached and the streaming API call failed")
     
-    def generate_text(self, prompt: str, max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Optional[str]:
+    @staticmethod
+    async def _iter_sse_events(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        # Yields the data of each server-sent event
+        data_lines = []
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').rstrip('\r\n')
+            if line.startswith(':'):
+                # Comment / keep-alive line
+                continue
+            if line.startswith('data:'):
+                data_lines.append(line[5:].lstrip())
+                continue
+            if line or not data_lines:
+                continue
+            
+            yield "\n".join(data_lines)
+            data_lines = []
+        
+        # The stream may close right after its last data line, without the blank line ending the event
+        if data_lines:
+            yield "\n".join(data_lines)
+    
+    async def _iter_sse_content(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        # Raises IncompleteStreamError when the stream ends without [DONE] or a finish_reason
+        finished = False
+        async for data in self._iter_sse_events(response):
+            if data == "[DONE]":
+                return
+            try:
+                choice = json.loads(data)["choices"][0]
+                delta = choice.get("delta", {}).get("content")
+                finished = finished or bool(choice.get("finish_reason"))
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                logger.warning(f"Skipping malformed stream chunk: {str(e)}")
+                continue
+            if delta:
+                yield delta
+        
+        if not finished:
+            raise IncompleteStreamError("the stream closed before [DONE] or a finish_reason")
+    
+    async def generate_text_async(self, prompt: str, max_retries: int = 2, retry_delay: float = 2.0,
+                                  on_section: Callable[[str], Awaitable[Any]] = None, **kwargs) -> Optional[str]:
 
         messages = [{"role": "user", "content": prompt}]
-        response = self.chat_completion(messages, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+        
+        stream = kwargs.pop('stream', None)
+        if stream if stream is not None else DEEPSEEK_AI['stream']:
+            return await self._generate_streamed_text(messages, max_retries, retry_delay, on_section, **kwargs)
+        
+        response = await self.chat_completion_async(messages, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
         
         if response:
             
@@ -158,7 +335,175 @@ class DeepseekAPI:
         
         return None
     
+    async def _generate_streamed_text(self, messages: List[Dict[str, str]], max_retries: int, retry_delay: float,
+                                      on_section: Callable[[str], Awaitable[Any]] = None, **kwargs) -> Optional[str]:
+        parts = []
+        sections = SectionBuffer()
+        emitted = 0
+        
+        async def emit(section):
+            nonlocal emitted
+            if on_section is None:
+                return
+            try:
+                await on_section(section)
+                emitted += 1
+            except Exception as e:
+                logger.error(f"Failed to deliver streamed section: {str(e)}")
+        
+        try:
+            async for delta in self.stream_chat_completion(messages, max_retries=max_retries, retry_delay=retry_delay, **kwargs):
+                parts.append(delta)
+                for section in sections.feed(delta):
+                    await emit(section)
+        except IncompleteStreamError as e:
+            # Truncated advice is neither returned nor saved; sections already pushed get a notice
+            logger.error(f"Discarding truncated streamed output ({len(''.join(parts))} characters): {str(e)}")
+            if emitted:
+                await emit(INCOMPLETE_NOTICE)
+            return None
+        
+        content = "".join(parts)
+        if not content:
+            return None
+        
+        remainder = sections.flush()
+        if remainder:
+            await emit(remainder)
+        
+        self.save_response_to_file({
+            "model": kwargs.get("model") or DEEPSEEK_AI['model'],
+            "stream": True,
+            "choices": [{"message": {"role": "assistant", "content": content}}]
+        })
+        return content
+    
+    def _fanout_targets(self, targets: List[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        # Targets are model names on the default endpoint or dicts with model, api_url and api_key
+        normalized = []
+        for target in targets:
+            target = {"model": target} if isinstance(target, str) else dict(target)
+            target.setdefault("api_url", self.api_url)
+            if "name" not in target:
+                same_endpoint = target["api_url"] == self.api_url
+                target["name"] = target["model"] if same_endpoint else f"{target['model']}@{target['api_url']}"
+            normalized.append(target)
+        return normalized
+    
+    def _record_latency(self, name: str, outcome: str, latency: float = None) -> None:
+        stats = self.latency_stats.setdefault(name, {
+            "calls": 0, "valid": 0, "invalid": 0, "cancelled": 0,
+            "total_seconds": 0.0, "last_seconds": None
+        })
+        stats["calls"] += 1
+        stats[outcome] += 1
+        if latency is not None:
+            stats["total_seconds"] += latency
+            stats["last_seconds"] = latency
+    
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for name, stats in self.latency_stats.items():
+            timed = stats["valid"] + stats["invalid"]
+            result[name] = dict(stats, mean_seconds=stats["total_seconds"] / timed if timed else None)
+        return result
+    
+    async def _complete_for_target(self, messages: List[Dict[str, str]], target: Dict[str, Any],
+                                   max_retries: int, retry_delay: float, **kwargs) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        content = None
+        try:
+            response = await self.chat_completion_async(
+                messages,
+                model=target["model"],
+                api_url=target["api_url"],
+                api_key=target.get("api_key"),
+                max_retries=max_retries,
+                retry_delay=retry_delay,
+                stream=False,
+                **kwargs
+            )
+            if response:
+                self.save_response_to_file(response)
+                content = response["choices"][0]["message"]["content"]
+        except asyncio.CancelledError:
+            self._record_latency(target["name"], "cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Fan-out call to {target['name']} failed: {str(e)}")
+        
+        latency = loop.time() - started
+        advice_data, errors = extract_advice_data(content) if content else (None, ["no answer"])
+        valid = not errors
+        self._record_latency(target["name"], "valid" if valid else "invalid", latency)
+        logger.info(f"Fan-out answer from {target['name']} after {latency:.1f}s: {'valid' if valid else ', '.join(errors)}")
+        return {"name": target["name"], "content": content, "advice_data": advice_data, "latency": latency, "valid": valid}
+    
+    async def fanout_generate_text(self, prompt: str, targets: List[Union[str, Dict[str, Any]]] = None, mode: str = None,
+                                   quorum: int = None, max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Optional[str]:
+        # Sends the prompt to every target at once; "first" keeps the first answer with a parsable
+        # decision block, "quorum" waits for ``quorum`` of them and merges their positions
+        targets = self._fanout_targets(targets or DEEPSEEK_AI['fanout_models'])
+        mode = mode or DEEPSEEK_AI['fanout_mode']
+        if mode not in FANOUT_MODES:
+            raise ValueError(f"Unknown fan-out mode: {mode}, expected one of {FANOUT_MODES}")
+        if not targets:
+            raise ValueError("No fan-out targets configured")
+        
+        quorum = quorum or DEEPSEEK_AI['fanout_quorum'] or len(targets) // 2 + 1
+        needed = 1 if mode == 'first' else min(quorum, len(targets))
+        
+        if any(not target.get("api_key") for target in targets) and not self.validate_api_key():
+            self.api_key = await self.get_api_key_async(max_retries=max_retries, retry_delay=retry_delay)
+        
+        messages = [{"role": "user", "content": prompt}]
+        tasks = [
+            asyncio.ensure_future(self._complete_for_target(messages, target, max_retries, retry_delay, **kwargs))
+            for target in targets
+        ]
+        
+        valid = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if result["valid"]:
+                    valid.append(result)
+                    if len(valid) >= needed:
+                        break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if not valid:
+            logger.error(f"None of the {len(targets)} fan-out targets returned a usable answer")
+            return None
+        
+        if len(valid) < needed:
+            logger.warning(f"Only {len(valid)} of the {needed} answers needed for a quorum, using what arrived")
+        
+        if mode == 'first' or len(valid) == 1:
+            logger.info(f"Using the answer from {valid[0]['name']}")
+            return valid[0]["content"]
+        
+        answers = [result["advice_data"] for result in valid]
+        merged = merge_advice_data(answers)
+        merged["consensus"] = {
+            "models": [result["name"] for result in valid],
+            "positions": [answer.get("position") for answer in answers]
+        }
+        representative = valid[representative_index(answers, merged)]
+        logger.info(f"Merged {len(valid)} answers, consensus position {merged.get('position')}%, text from {representative['name']}")
+        return replace_json_block(representative["content"], merged)
+    
     def generate_investment_advice(self, data_json: str, last_advice: Dict = None, max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Optional[str]:
+        return self._run_sync(self.generate_investment_advice_async, data_json, last_advice=last_advice,
+                              max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+    
+    async def generate_investment_advice_async(self, data_json: str, last_advice: Dict = None, max_retries: int = 2, retry_delay: float = 2.0,
+                                               data_format: str = "JSON format", **kwargs) -> Optional[str]:
 
         current_date = kwargs.pop('current_date', None)
         if not current_date:
@@ -172,23 +517,108 @@ class DeepseekAPI:
             last_position=params["last_position"],
             last_cost_basis=params["last_cost_basis"],
             last_action=params["last_action"],
-            data_json=data_json
+            data_json=data_json,
+            data_format=data_format
         )
         
         save_prompt_for_debug(prompt)
         
-        return self.generate_text(prompt, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+        fanout_models = kwargs.pop('fanout_models', None) or DEEPSEEK_AI['fanout_models']
+        fanout_mode = kwargs.pop('fanout_mode', None) or DEEPSEEK_AI['fanout_mode']
+        
+        use_cache = kwargs.pop('use_cache', True) and self.response_cache is not None
+        if use_cache:
+            if fanout_models:
+                names = [target["name"] for target in self._fanout_targets(fanout_models)]
+                model = f"fanout:{fanout_mode}:" + ",".join(names)
+            else:
+                model = kwargs.get('model') or DEEPSEEK_AI['model']
+            temperature = kwargs.get('temperature', DEEPSEEK_AI['temperature'])
+            cache_key = ResponseCache.make_key(model, temperature, prompt)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Using cached investment advice {cache_key[:12]}")
+                return cached
+        
+        if fanout_models:
+            # Fan-out answers are not streamed, the caller gets the whole advice at the end
+            for key in ('model', 'stream', 'on_section'):
+                kwargs.pop(key, None)
+            content = await self.fanout_generate_text(prompt, fanout_models, mode=fanout_mode, max_retries=max_retries,
+                                                      retry_delay=retry_delay, **kwargs)
+        else:
+            content = await self.generate_text_async(prompt, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+        
+        if use_cache and content:
+            # Only complete answers are kept for the TTL; a cut-off reply has no parsable decision block
+            errors = extract_advice_data(content)[1]
+            if errors:
+                logger.warning(f"Not caching the investment advice: {', '.join(errors)}")
+            else:
+                self.response_cache.put(cache_key, content, model=model, temperature=temperature, date=params["current_date"])
+        
+        return content
     
-    def save_investment_record(self, recommendation: str, data_json: str = None, **kwargs) -> Dict[str, Any]:
-
-        records_dir = kwargs.get('records_dir', DATA_DIRS['records'])
-        os.makedirs(records_dir, exist_ok=True)
+    def get_record_store(self, records_dir: str = None) -> InvestmentRecordStore:
+        records_dir = records_dir or DATA_DIRS['records']
+        if records_dir not in self._record_stores:
+            self._record_stores[records_dir] = InvestmentRecordStore(records_dir)
+        return self._record_stores[records_dir]
+    
+    async def extract_advice_data_async(self, advice: str, max_retries: int = 2, retry_delay: float = 2.0,
+                                        **kwargs) -> Dict[str, Any]:
+        advice_data, errors = extract_advice_data(advice)
+        if not errors:
+            return advice_data
+        
+        logger.warning(f"Decision data in the advice is unusable: {', '.join(errors)}")
+        if not DEEPSEEK_AI['json_mode_fallback']:
+            return advice_data or {}
         
+        # Ask for the decision block alone in JSON mode; endpoints without it reject the request
+        # and the partial data is kept
+        fields = ", ".join(ADVICE_SCHEMA)
+        messages = [{
+            "role": "user",
+            "content": (
+                f"Extract the structured decision data from the investment advice below as a single JSON object "
+                f"with at least the keys {fields}, plus decision_keyword and action when present. "
+                f"position is a percentage between 0 and 100; prices are plain numbers. Reply with JSON only.\n\n"
+                f"{advice[-DEEPSEEK_AI['json_mode_context_chars']:]}"
+            )
+        }]
+        response = await self.chat_completion_async(
+            messages,
+            model=kwargs.get('model'),
+            max_tokens=1000,
+            stream=False,
+            response_format={"type": "json_object"},
+            max_retries=max_retries,
+            retry_delay=retry_delay
+        )
+        try:
+            content = response["choices"][0]["message"]["content"] if response else None
+        except (KeyError, IndexError, TypeError):
+            content = None
+        
+        repaired, repaired_errors = extract_advice_data(content) if content else (None, ["no answer"])
+        if repaired_errors:
+            logger.error(f"JSON mode did not produce usable decision data: {', '.join(repaired_errors)}")
+            return advice_data or {}
+        
+        logger.info(f"Recovered decision data in JSON mode: Positions {repaired.get('position')}%")
+        return {**(advice_data or {}), **repaired}
+    
+    def save_investment_record(self, recommendation: str, data_json: str = None, advice_data: Dict[str, Any] = None,
+                               **kwargs) -> Dict[str, Any]:
+
+        store = self.get_record_store(kwargs.get('records_dir'))
 
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         record_id = f"BTI-{timestamp}"
         
-        advice_data = extract_json_from_text(recommendation) or {}
+        if advice_data is None:
+            advice_data = extract_advice_data(recommendation)[0] or {}
         
         record = {
             "id": record_id,
@@ -199,92 +629,87 @@ class DeepseekAPI:
             "metadata": kwargs
         }
         
-        filename = f"{record_id}.json"
-        filepath = os.path.join(records_dir, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
+        store.save(record)
         
-        logger.info(f"Investment advice records saved: {filepath}")
+        logger.info(f"Investment advice records saved: {record_id} in {store.path}")
         return {"record_id": record_id, "advice_data": advice_data}
 
 
     def get_api_key(self, max_retries: int = 2, retry_delay: float = 2.0) -> str:
+        return self._run_sync(self.get_api_key_async, max_retries=max_retries, retry_delay=retry_delay)
+    
+    async def get_api_key_async(self, max_retries: int = 2, retry_delay: float = 2.0) -> str:
         
         headers = {
             "client_id": str(uuid.uuid4())
         }
-        retries = 1
-        while retries <= max_retries:
-            try:
-                response = requests.get(self.key_url, headers=headers, params={}, timeout=60)
-                content_type = response.headers["Content-Type"]
-                if response.status_code == 200:
-                    if content_type.startswith("application/json"):
-                        response = json.loads(response.text)
-                    elif content_type.startswith("application/yaml"):
-                        response = yaml.load(response.text, Loader=yaml.Loader)
-                    return response["key"]
-                else:
+        session = await self._get_session()
+        timeout = aiohttp.ClientTimeout(total=DEEPSEEK_AI['request_timeout'])
+        
+        async def attempt():
+            async with session.get(self.key_url, headers=headers, timeout=timeout) as response:
+                if response.status in RETRYABLE_STATUSES:
+                    raise RetryableError(f"key endpoint returned {response.status}", status=response.status,
+                                         retry_after=parse_retry_after(response.headers.get("Retry-After")))
+                if response.status != 200:
                     return None
-            except Exception as e:
-                retries += 1
-                if retries <= max_retries:
-                    wait_time = retry_delay * (2 ** (retries - 1))
-                    time.sleep(wait_time)
-        return None
+                content_type = response.headers.get("Content-Type", "")
+                text = await response.text()
+            try:
+                if content_type.startswith("application/yaml"):
+                    return yaml.load(text, Loader=yaml.Loader)["key"]
+                return json.loads(text)["key"]
+            except (ValueError, KeyError, TypeError, yaml.YAMLError) as e:
+                raise RetryableError(f"malformed key response: {str(e)}")
+        
+        try:
+            return await call_with_retries(self.key_url, attempt, max_retries, retry_delay, description="API key request")
+        except CircuitOpenError as e:
+            logger.warning(f"Failed to fetch API key: {str(e)}")
+            return None
 
     def load_investment_record(self, record_id: str, records_dir: str = None) -> Optional[Dict[str, Any]]:
 
-        if records_dir is None:
-            records_dir = DATA_DIRS['records']
-            
-        filepath = os.path.join(records_dir, f"{record_id}.json")
-        
-        if not os.path.exists(filepath):
-            logger.error(f"Log file not found: {filepath}")
-            return None
-        
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                record = json.load(f)
-            return record
+            record = self.get_record_store(records_dir).get(record_id)
         except Exception as e:
             logger.error(f"Failed to load record: {str(e)}")
             return None
+        
+        if record is None:
+            logger.error(f"Investment record not found: {record_id}")
+        return record
     
     def load_latest_investment_record(self, records_dir: str = None) -> Optional[Dict[str, Any]]:
 
-        records_dir = DATA_DIRS['records']
-            
-        if not os.path.exists(records_dir):
-            logger.warning(f"The record directory does not exist: {records_dir}")
-            return None, None
-        
         try:
-            files = [f for f in os.listdir(records_dir) if f.startswith('BTI-') and f.endswith('.json')]
-            if not files:
-                logger.info(f"No investment advice record found in the directory: {records_dir}")
+            record = self.get_record_store(records_dir).latest()
+            if not record:
+                logger.info(f"No investment advice record found in: {records_dir or DATA_DIRS['records']}")
                 return None, None
             
-            files.sort(reverse=True)
-            latest_file = files[0]
-            record_id = latest_file.split('.')[0] 
-            
-            record = self.load_investment_record(record_id, records_dir)
-            if record:
-                logger.info(f"Successfully loaded the latest investment advice record: {record_id}")
-                return record, record_id
-            else:
-                return None, None
+            record_id = record["id"]
+            logger.info(f"Successfully loaded the latest investment advice record: {record_id}")
+            return record, record_id
         except Exception as e:
             logger.error(f"Error finding latest record: {str(e)}")
             return None, None
     
+    def load_investment_records(self, start_date: str = None, end_date: str = None, records_dir: str = None) -> List[Dict[str, Any]]:
+        return self.get_record_store(records_dir).range(start_date, end_date)
+    
     def generate_and_save_investment_advice(self, data_json: str, last_record_id: str = None, debug: bool = False, 
                                  max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Dict[str, Any]:
+        return self._run_sync(self.generate_and_save_investment_advice_async, data_json, last_record_id=last_record_id,
+                              debug=debug, max_retries=max_retries, retry_delay=retry_delay, **kwargs)
+    
+    async def generate_and_save_investment_advice_async(self, data_json: str, last_record_id: str = None, debug: bool = False, 
+                                 max_retries: int = 2, retry_delay: float = 2.0, **kwargs) -> Dict[str, Any]:
 
         last_advice = None
+        data_encoding = kwargs.pop('data_encoding', None)
+        if data_encoding:
+            kwargs.setdefault('data_format', describe_market_data_encoding(**data_encoding))
         
         if not last_record_id:
             logger.info("No last record ID provided, trying to automatically load the latest record")
@@ -298,13 +723,13 @@ class DeepseekAPI:
                 last_advice = last_record["advice_data"]
                 logger.info(f"Successfully loaded last recommended data: Positions {last_advice.get('position', 'N/A')}%")
             elif "recommendation" in last_record:
-                last_advice = extract_json_from_text(last_record["recommendation"])
+                last_advice = extract_advice_data(last_record["recommendation"])[0]
                 if last_advice:
                     logger.info(f"Reparse last suggested data from text: Positions {last_advice.get('position', 'N/A')}%")
         else:
             logger.info("No previous record found, the first investment suggestion will be generated")
         
-        advice = self.generate_investment_advice(
+        advice = await self.generate_investment_advice_async(
             data_json, 
             last_advice=last_advice, 
             max_retries=max_retries,
@@ -316,12 +741,17 @@ class DeepseekAPI:
             logger.error("Generating investment advice fails, even after retries")
             return {"success": False, "error": "Failed to generate investment advice, please check API connection and configuration"}
         
+        advice_data = await self.extract_advice_data_async(advice, max_retries=max_retries, retry_delay=retry_delay,
+                                                           model=kwargs.get('model'))
+        
         try:
             result = self.save_investment_record(
                 recommendation=advice,
                 data_json=data_json,
+                advice_data=advice_data,
                 last_record_id=last_record_id,
-                user_settings=kwargs.get('user_settings', {})
+                user_settings=kwargs.get('user_settings', {}),
+                data_encoding=data_encoding
             )
             
             return {
@@ -339,23 +769,14 @@ class DeepseekAPI:
                 "success": True,
                 "advice": advice,
                 "record_id": f"temp-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                "advice_data": extract_json_from_text(advice) or {},
+                "advice_data": advice_data,
                 "save_error": str(e)
             }
 
     def save_response_to_file(self, response):
         try:
-            responses_dir = os.path.join(DATA_DIRS['responses'])
-            os.makedirs(responses_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"response_{timestamp}.json"
-            file_path = os.path.join(responses_dir, filename)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(response, f, ensure_ascii=False, indent=2)
-                  
-            logger.info(f"AI original response saved to: {file_path}")
+            file_path = get_artifact_sink().write('responses', 'response', response, ext='.json')
+            logger.info(f"AI original response queued for: {file_path}")
             return True
             
         except Exception as e:
@@ -363,3 +784,162 @@ class DeepseekAPI:
             import traceback
             logger.debug(traceback.format_exc())
             return False
+
+
+@contextlib.asynccontextmanager
+async def _stub_server(routes) -> AsyncIterator[str]:
+    # Local aiohttp server on a free port for the stub checks below, yielding its base URL. Responses
+    # and cache entries go to a scratch directory and the stub host is not rate limited; the global
+    # config is restored afterwards.
+    import socket
+    import tempfile
+    from aiohttp import web
+    from config import RESILIENCE
+
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    await web.SockSite(runner, sock).start()
+    host = f"127.0.0.1:{sock.getsockname()[1]}"
+
+    saved_dirs, saved_hosts = dict(DATA_DIRS), RESILIENCE['hosts']
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            DATA_DIRS.update(responses=directory, cache=directory)
+            RESILIENCE['hosts'] = {**saved_hosts, host: {'rate': 1e6, 'burst': 10 ** 6}}
+            yield f"http://{host}"
+            get_artifact_sink().flush()
+    finally:
+        DATA_DIRS.clear()
+        DATA_DIRS.update(saved_dirs)
+        RESILIENCE['hosts'] = saved_hosts
+        await runner.cleanup()
+
+
+async def check_streaming_against_stub() -> List[Dict[str, Any]]:
+    # Streamed advice against a local SSE stub: a complete stream whose last event has no closing
+    # blank line, a stream cut off before [DONE], a 503 followed by a good stream, and a 400.
+    # Each entry reports what came back and whether it is what the client should do.
+    from aiohttp import web
+
+    text = "## I. Market\nPrice is flat.\n## II. Advice\nHold.\n"
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    requests = {}
+
+    def event(content=None, finish_reason=None) -> bytes:
+        choice = {"delta": {"content": content} if content else {}, "finish_reason": finish_reason}
+        return f"data: {json.dumps({'choices': [choice]})}\r\n\r\n".encode('utf-8')
+
+    async def stream(request, parts, done=True):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(b": keep-alive\r\n\r\n")
+        for part in parts:
+            await response.write(event(part))
+        if done:
+            await response.write(event(finish_reason="stop") + b"data: [DONE]")
+        await response.write_eof()
+        return response
+
+    async def handler(request):
+        scenario = request.match_info['scenario']
+        requests[scenario] = requests.get(scenario, 0) + 1
+        if scenario == "complete":
+            return await stream(request, chunks)
+        if scenario == "truncated":
+            # Cut off inside the second section, after the first one has been pushed
+            cut = text.index("Hold") + 2
+            return await stream(request, [text[i:min(i + 7, cut)] for i in range(0, cut, 7)], done=False)
+        if scenario == "flaky" and requests[scenario] == 1:
+            return web.Response(status=503, text="overloaded")
+        if scenario == "flaky":
+            return await stream(request, chunks)
+        return web.Response(status=400, text='{"error": "bad request"}')
+
+    results = []
+    async with _stub_server([web.post('/{scenario}', handler)]) as base_url:
+        for scenario, expected in (("complete", text), ("truncated", None), ("flaky", text), ("rejected", None)):
+            sections = []
+
+            async def on_section(section):
+                sections.append(section)
+
+            async with DeepseekAPI(api_key="stub", api_url=f"{base_url}/{scenario}") as api:
+                content = await api.generate_text_async("stub", retry_delay=0.01, stream=True, on_section=on_section)
+                breaker = get_host_guard(api.api_url).breaker
+            results.append({
+                "scenario": scenario,
+                "requests": requests.get(scenario, 0),
+                "sections": len(sections),
+                "notice": INCOMPLETE_NOTICE in sections,
+                "breaker_failures": breaker.failures,
+                # Only the cut-off stream may leave a failure on the breaker (the 503 is cleared by the retry)
+                "ok": content == expected and (INCOMPLETE_NOTICE in sections) == (breaker.failures > 0) == (scenario == "truncated"),
+            })
+    return results
+
+
+async def check_fanout_against_stub() -> List[Dict[str, Any]]:
+    # Fan-out against a local stub of a chat completions endpoint with four models: one answers
+    # at once without a decision block, one keeps failing with 500, and two valid ones answer after
+    # 0.1s and 0.6s. "first" must return the 0.1s answer without waiting for the slow one and cancel
+    # it; "quorum" of 2 must merge both valid answers (median position 30).
+    from aiohttp import web
+
+    models = {
+        "fast-invalid": (0.0, "No decision block here."),
+        "mid-valid": (0.1, 20),
+        "slow-valid": (0.6, 40),
+    }
+
+    async def handler(request):
+        model = (await request.json())["model"]
+        if model not in models:
+            return web.Response(status=500, text="upstream error")
+        delay, answer = models[model]
+        await asyncio.sleep(delay)
+        if isinstance(answer, int):
+            block = {"position": answer, "cost_basis": None, "entry_price": None, "stop_loss": None}
+            answer = f"## I. Advice\nPosition {answer}%.\n```json\n{json.dumps(block)}\n```"
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": answer}}]})
+
+    targets = ["fast-invalid", "broken", "mid-valid", "slow-valid"]
+    results = []
+    async with _stub_server([web.post('/chat', handler)]) as base_url:
+        for mode, quorum in (("first", None), ("quorum", 2)):
+            async with DeepseekAPI(api_key="stub", api_url=f"{base_url}/chat") as api:
+                started = time.perf_counter()
+                content = await api.fanout_generate_text("stub", targets=targets, mode=mode, quorum=quorum,
+                                                         max_retries=2, retry_delay=0.01)
+                elapsed = time.perf_counter() - started
+                stats = api.get_latency_stats()
+            advice_data = extract_advice_data(content)[0] if content else None
+            position = advice_data.get("position") if advice_data else None
+            if mode == "first":
+                ok = position == 20 and elapsed < 0.5 and stats["slow-valid"]["cancelled"] == 1
+            else:
+                ok = position == 30 and advice_data.get("consensus", {}).get("models") == ["mid-valid", "slow-valid"]
+            results.append({
+                "mode": mode,
+                "position": position,
+                "elapsed_ms": round(elapsed * 1000),
+                "outcomes": {name: next(key for key in ("valid", "invalid", "cancelled") if stat[key])
+                             for name, stat in stats.items()},
+                "ok": ok,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = asyncio.run(check_streaming_against_stub())
+    results += asyncio.run(check_fanout_against_stub())
+    for result in results:
+        print(result)
+    if not all(result["ok"] for result in results):
+        raise SystemExit("The client did not handle the stub responses as expected")
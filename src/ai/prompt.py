@@ -1,18 +1,40 @@
-import os
+import re
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, date
 from typing import Dict, Any, Optional, List, Union
 
-from config import DATA_DIRS
+from utils.artifact_sink import get_artifact_sink
 
 logger = logging.getLogger(__name__)
 
+# Headings that open a section of the advice report ("# TL;DR", "I、...", "## V. ...", "**VII. ...")
+SECTION_HEADER_PATTERN = re.compile(r'^\s*(?:#{1,6}\s*)?(?:\*\*)?(?:TL;DR|[IVX]{1,4}\s*[、.．])')
+
+# Rough BPE-like split: words, runs of up to 3 digits, and single symbols each count as a token
+TOKEN_PATTERN = re.compile(r'[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]')
+
+MARKET_DATA_FORMATS = {'csv': ',', 'tsv': '\t', 'json': None}
+
+JSON_TOKEN_PATTERN = re.compile(r'[{}"\\]')
+
+# Unfenced JSON is only looked for near the end, where the decision block goes
+BARE_JSON_SCAN_CHARS = 50000
+
+# Fields of the structured decision block the next run depends on
+ADVICE_SCHEMA = {
+    "position": {"type": "number", "min": 0, "max": 100},
+    "cost_basis": {"type": "number", "nullable": True},
+    "entry_price": {"type": "number_or_text", "nullable": True},
+    "stop_loss": {"type": "number", "nullable": True},
+}
+
 def get_investment_advice_template(current_date: str, last_position: int = 0, 
                                   last_cost_basis: str = "No position yet", 
                                   last_action: str = "First time position building advice", 
                                   data_json: str = "", 
-                                  total_budget: float = 1000.0) -> str:
+                                  total_budget: float = 1000.0,
+                                  data_format: str = "JSON format") -> str:
 
     current_invested = (last_position / 100) * total_budget
     available_cash = total_budget - current_invested
@@ -37,7 +59,7 @@ Last investment advice: {last_action}
 
 Please analyze the market conditions based on the following historical data and provide clear operational (trading/investment) recommendations.
 
-Here is the historical market data (JSON format):
+Here is the historical market data ({data_format}):
 {data_json}
 
 Please provide a comprehensive analysis and precise recommendations according to the following structure:
@@ -194,31 +216,295 @@ def calculate_portfolio_metrics(current_position: int, current_cost_basis: float
     }
 
 def save_prompt_for_debug(prompt: str) -> str:
-    prompts_dir = DATA_DIRS['prompts']
-    os.makedirs(prompts_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filename = f"prompt_{timestamp}.txt"
-    
-    prompt_path = os.path.join(prompts_dir, filename)
-    
-    with open(prompt_path, 'w', encoding='utf-8') as f:
-        f.write(prompt)
-    
-    logger.info(f"Saved prompt to: {prompt_path}")
-    return prompt_path
+    # Written in the background; identical prompts share one file when dedup is enabled
+    sink = get_artifact_sink()
+    return sink.write('prompts', 'prompt', prompt, ext='.txt', dedup=sink.dedup_prompts)
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text or ""))
+
+def _format_value(value: Any, digits: Optional[int]) -> str:
+    if value is None:
+        return ""
+    if digits is None or not isinstance(value, (int, float)):
+        return str(value)
+    if digits == 0:
+        return str(int(round(value)))
+    return f"{value:.{digits}f}".rstrip('0').rstrip('.')
+
+def _round_row(row: Dict[str, Any], precision: Dict[str, int]) -> Dict[str, Any]:
+    rounded = dict(row)
+    for key, digits in precision.items():
+        value = rounded.get(key)
+        if isinstance(value, (int, float)):
+            rounded[key] = int(round(value)) if digits == 0 else round(value, digits)
+    return rounded
+
+def downsample_weekly(rows: List[Dict[str, Any]], after_days: int) -> List[Dict[str, Any]]:
+    # Rows older than ``after_days`` before the newest date keep only the last point of each ISO week
+    dated = [row for row in rows if row.get('date')]
+    if not dated:
+        return rows
+    newest = max(date.fromisoformat(row['date']) for row in dated)
+
+    weekly: Dict[tuple, Dict[str, Any]] = {}
+    result = []
+    for row in rows:
+        if not row.get('date'):
+            continue
+        day = date.fromisoformat(row['date'])
+        if (newest - day).days <= after_days:
+            result.append(row)
+            continue
+        week = day.isocalendar()[:2]
+        if week not in weekly or weekly[week]['date'] < row['date']:
+            weekly[week] = row
+
+    kept = {id(row) for row in result} | {id(row) for row in weekly.values()}
+    return [row for row in rows if id(row) in kept]
+
+def encode_market_data(rows: List[Dict[str, Any]], fmt: str = 'csv', delta_dates: bool = True,
+                       precision: Optional[Dict[str, int]] = None, weekly_after_days: Optional[int] = None) -> str:
+    if fmt not in MARKET_DATA_FORMATS:
+        raise ValueError(f"Unknown market data format: {fmt}, expected one of {tuple(MARKET_DATA_FORMATS)}")
+    precision = precision or {}
+
+    if weekly_after_days is not None:
+        rows = downsample_weekly(rows, weekly_after_days)
+
+    if fmt == 'json':
+        return json.dumps([_round_row(row, precision) for row in rows], ensure_ascii=False, separators=(',', ':'))
+
+    columns = ['date'] if any('date' in row for row in rows) else []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+
+    separator = MARKET_DATA_FORMATS[fmt]
+    lines = [separator.join(columns)]
+    previous = None
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column)
+            if column == 'date' and delta_dates and value:
+                day = date.fromisoformat(value)
+                cells.append(f"{(day - previous).days:+d}" if previous else value)
+                previous = day
+            else:
+                cells.append(_format_value(value, precision.get(column)))
+        lines.append(separator.join(cells))
+    return "\n".join(lines)
+
+def describe_market_data_encoding(fmt: str = 'csv', delta_dates: bool = True,
+                                  weekly_after_days: Optional[int] = None, **kwargs) -> str:
+    if fmt == 'json':
+        label = "JSON format"
+    else:
+        label = f"{fmt.upper()} table with a header row, empty cells are missing values"
+        if delta_dates:
+            label += "; the first date is absolute and each later date is the signed day offset from the row above"
+    if weekly_after_days is not None:
+        label += f"; data older than {weekly_after_days} days is reduced to one point per week"
+    return label
+
+def _balanced_objects(text: str, start: int, end: int) -> List[tuple]:
+    # Spans of all brace-balanced objects in text[start:end], found in one pass; quotes only count
+    # inside an object so prose around it cannot confuse the string tracking
+    spans = []
+    stack = []
+    in_string = False
+    escaped_at = -1
+    for match in JSON_TOKEN_PATTERN.finditer(text, start, end):
+        token = match.group()
+        position = match.start()
+        if in_string:
+            if position == escaped_at:
+                continue
+            if token == '\\':
+                escaped_at = position + 1
+            elif token == '"':
+                in_string = False
+            continue
+        if token == '{':
+            stack.append(position)
+        elif token == '}' and stack:
+            spans.append((stack.pop(), position + 1))
+        elif token == '"' and stack:
+            in_string = True
+    # Latest object first, and the outermost one when several end together
+    spans.sort(key=lambda span: (-span[1], span[0]))
+    return spans
+
+def _fenced_blocks_from_end(text: str) -> List[tuple]:
+    fences = [match.start() for match in re.finditer('```', text)]
+    if len(fences) % 2:
+        # Truncated response: the last fence was opened but never closed
+        fences.append(len(text))
+    return [(fences[i] + 3, fences[i + 1]) for i in range(len(fences) - 2, -1, -2)]
+
+def _loads_object(candidate: str) -> Optional[Dict]:
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def locate_json_object(text: str) -> Optional[tuple]:
+    # (start, end, data) of the last JSON object, looking in fenced blocks first and then in bare text
+    if not text:
+        return None
+    regions = _fenced_blocks_from_end(text) + [(max(len(text) - BARE_JSON_SCAN_CHARS, 0), len(text))]
+    for region_start, region_end in regions:
+        for start, end in _balanced_objects(text, region_start, region_end):
+            data = _loads_object(text[start:end])
+            if data is not None:
+                return start, end, data
+    return None
 
 def extract_json_from_text(text: str) -> Optional[Dict]:
-    import re
-    import json
-    
-    json_match = re.search(r'```json\s*({[\s\S]*?})\s*```', text)
-    if not json_match:
+    located = locate_json_object(text)
+    if located is None:
+        logger.warning("No JSON object found in the response")
         return None
-        
+    return located[2]
+
+def parse_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
     try:
-        json_str = json_match.group(1)
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON: {str(e)}")
-        return None 
\ No newline at end of file
+        return float(str(value).replace('$', '').replace(',', '').replace('%', '').strip())
+    except ValueError:
+        return None
+
+def validate_advice_data(data: Optional[Dict]) -> List[str]:
+    if not isinstance(data, dict):
+        return ["no decision data"]
+    errors = []
+    for field, rule in ADVICE_SCHEMA.items():
+        if field not in data:
+            errors.append(f"missing {field}")
+            continue
+        value = data[field]
+        if value is None and rule.get("nullable"):
+            continue
+        number = parse_number(value)
+        if rule["type"] == "number":
+            if number is None:
+                errors.append(f"{field} is not a number: {value!r}")
+            elif not rule.get("min", number) <= number <= rule.get("max", number):
+                errors.append(f"{field} out of range: {number}")
+        elif number is None and not (isinstance(value, str) and value.strip()):
+            errors.append(f"{field} is neither a number nor a price description: {value!r}")
+    return errors
+
+def extract_advice_data(text: str) -> tuple:
+    # Decision block of an advice response with numeric fields normalized, plus the schema errors
+    data = extract_json_from_text(text)
+    errors = validate_advice_data(data)
+    if data is None:
+        return None, errors
+    normalized = dict(data)
+    for field, rule in ADVICE_SCHEMA.items():
+        if rule["type"] == "number" and field in normalized:
+            number = parse_number(normalized[field])
+            if number is not None:
+                normalized[field] = int(number) if number.is_integer() else number
+    return normalized, errors
+
+class SectionBuffer:
+    # Accumulates streamed text and hands back each report section once the next one starts
+
+    def __init__(self):
+        self._lines: List[str] = []
+        self._partial: List[str] = []
+
+    def feed(self, delta: str) -> List[str]:
+        completed = []
+        pieces = delta.split('\n')
+        self._partial.append(pieces[0])
+        for piece in pieces[1:]:
+            line = "".join(self._partial)
+            self._partial = [piece]
+            section = self._add_line(line)
+            if section:
+                completed.append(section)
+        return completed
+
+    def _add_line(self, line: str) -> Optional[str]:
+        section = None
+        if SECTION_HEADER_PATTERN.match(line) and "".join(self._lines).strip():
+            section = "\n".join(self._lines).strip()
+            self._lines = []
+        self._lines.append(line)
+        return section
+
+    def flush(self) -> Optional[str]:
+        if self._partial:
+            self._lines.append("".join(self._partial))
+            self._partial = []
+        section = "\n".join(self._lines).strip()
+        self._lines = []
+        return section or None
+
+
+def benchmark_extraction(sizes=(20_000, 200_000, 2_000_000), repeat: int = 20) -> List[Dict[str, Any]]:
+    # extract_json_from_text against the previous lazy-regex parser on synthetic responses whose
+    # decision block follows ``size`` characters of noisy reasoning; mean milliseconds per call
+    import time
+    import random
+
+    legacy_pattern = re.compile(r'```json\s*({[\s\S]*?})\s*```')
+
+    def legacy(text):
+        match = legacy_pattern.search(text)
+        if not match:
+            return None
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            return None
+
+    block = {
+        "position": 30, "cost_basis": "$61,250", "entry_price": "60000-62000", "stop_loss": 55000,
+        "portfolio": {"total_budget": 1000, "current_invested": 300},
+        "risks": ["a {brace} in \"string\"", "x\\"],
+    }
+    fenced = "TL;DR ...\n```json\n" + json.dumps(block, indent=2) + "\n```\n"
+    rng = random.Random(1)
+    noise = "".join(rng.choice("abcdefghij klmnop{}\"\n,.:") for _ in range(200_000))
+
+    def timed(func, text):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func(text)
+        return round((time.perf_counter() - started) / repeat * 1000, 3), (result or {}).get("position")
+
+    results = []
+    for size in sizes:
+        reasoning = (noise * (size // len(noise) + 1))[:size]
+        cases = {
+            "fenced": reasoning + "\n" + fenced,
+            "example block first": "```json\n{\"position\": number}\n```\n" + reasoning + "\n" + fenced,
+            "truncated fence": reasoning + "\n```json\n" + json.dumps(block, indent=2),
+            "unfenced": reasoning + "\nthe answer is " + json.dumps(block),
+        }
+        for case, text in cases.items():
+            legacy_ms, legacy_position = timed(legacy, text)
+            new_ms, new_position = timed(extract_json_from_text, text)
+            results.append({
+                "chars": size, "case": case,
+                "legacy_ms": legacy_ms, "legacy_position": legacy_position,
+                "new_ms": new_ms, "new_position": new_position,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    for result in benchmark_extraction():
+        print(result)
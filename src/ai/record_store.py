@@ -0,0 +1,123 @@
+import os
+import json
+import sqlite3
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    position REAL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp, id);
+CREATE INDEX IF NOT EXISTS records_date ON records (date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class InvestmentRecordStore:
+    # Investment records in one SQLite file, indexed by id, timestamp and date
+
+    def __init__(self, records_dir: str, filename: str = "records.sqlite3"):
+        self.records_dir = records_dir
+        os.makedirs(records_dir, exist_ok=True)
+        self.path = os.path.join(records_dir, filename)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate_json_files()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    @staticmethod
+    def _position(record: Dict[str, Any]) -> Optional[float]:
+        position = (record.get("advice_data") or {}).get("position")
+        try:
+            return float(position) if position is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def _row(self, record: Dict[str, Any]) -> tuple:
+        return (
+            record["id"],
+            record.get("timestamp", ""),
+            record.get("date", ""),
+            self._position(record),
+            json.dumps(record, ensure_ascii=False),
+        )
+
+    def save(self, record: Dict[str, Any]) -> None:
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", self._row(record))
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT body FROM records WHERE id = ?", (record_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT body FROM records ORDER BY timestamp DESC, id DESC LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def range(self, start_date: str = None, end_date: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        # Records with start_date <= date <= end_date, oldest first
+        query, params = self._range_query("body", start_date, end_date, limit)
+        return [json.loads(row[0]) for row in self._conn.execute(query, params)]
+
+    def position_history(self, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
+        query, params = self._range_query("id, timestamp, date, position", start_date, end_date)
+        return [
+            {"id": row[0], "timestamp": row[1], "date": row[2], "position": row[3]}
+            for row in self._conn.execute(query, params)
+        ]
+
+    def _range_query(self, columns: str, start_date: str = None, end_date: str = None, limit: int = None):
+        conditions, params = [], []
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        query = f"SELECT {columns} FROM records"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp, id"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return query, params
+
+    def _migrate_json_files(self) -> None:
+        # One-off import of the BTI-*.json files written before the store existed
+        if self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        rows = []
+        for filename in sorted(os.listdir(self.records_dir)):
+            if not (filename.startswith('BTI-') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.records_dir, filename), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                record.setdefault("id", filename[:-len('.json')])
+                rows.append(self._row(record))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable investment record {filename}: {str(e)}")
+
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', ?)", (str(len(rows)),))
+        if rows:
+            logger.info(f"Imported {len(rows)} investment records into {self.path}")
@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    # On-disk cache of model responses keyed by a hash of (model, temperature, prompt)
+
+    def __init__(self, cache_dir: str, ttl_seconds: float, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(model: str, temperature: Any, prompt: str) -> str:
+        material = json.dumps([model, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            self._remove(path)
+            return None
+
+        # Refresh the access time so size-based eviction drops the least recently used entries
+        os.utime(path, (time.time(), entry.get("created_at", time.time())))
+        return entry.get("content")
+
+    def put(self, key: str, content: str, **metadata) -> None:
+        path = self._path(key)
+        entry = {"created_at": time.time(), "content": content, "metadata": metadata}
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write cache entry {path}: {str(e)}")
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            stat = entry.stat()
+            # mtime is the creation time, atime the last hit
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -10,20 +10,22 @@ logger = logging.getLogger(__name__)
 
 class AHR999Collector(BaseDataCollector):
 
-    def __init__(self, data_dir="data"):
-        super().__init__(data_dir)
+    def __init__(self, data_dir="data", session=None):
+        super().__init__(data_dir, session)
         self.ahr999_history_file = "ahr999_history.json"
         self.api_url = MARKET_SENTIMENT['ahr999_url']
     
-    async def get_ahr999_history(self, days=365, keep_extra_data=False):
+    async def get_ahr999_history(self, days=365, keep_extra_data=False, max_age=None):
+        # max_age: seconds the newest cached point may be old before fetching again, one day by default
         logger.info("Fetching historical data for the AHR999 index...")
         
         ahr_data = self.load_from_json(self.ahr999_history_file)
-        if ahr_data and len(ahr_data) > 0:
+        # Simulated data from a failed fetch is never served as a cache hit
+        if ahr_data and len(ahr_data) > 0 and not any(item.get("mock") for item in ahr_data):
             try:
                 latest_time = max(item.get("timestamp", 0) for item in ahr_data if isinstance(item.get("timestamp"), (int, float)))
                 current_time = int(time.time())
-                if (current_time - latest_time) < 24 * 60 * 60:
+                if (current_time - latest_time) < (24 * 60 * 60 if max_age is None else max_age):
                     logger.info(f"Using cached historical data for the AHR999 index; latest data timestamp: {datetime.fromtimestamp(latest_time)}")
                     return ahr_data
                 else:
@@ -109,10 +111,12 @@ class AHR999Collector(BaseDataCollector):
             
             ahr999_value *= trend_factor
             
+            # Tagged so it is kept out of the persistent history and CSV files
             ahr999_history.append({
                 "timestamp": timestamp,
                 "date": date_str,
-                "ahr999": round(ahr999_value, 4)
+                "ahr999": round(ahr999_value, 4),
+                "mock": True
             })
         
         ahr999_history.sort(key=lambda x: x["timestamp"], reverse=True)
@@ -6,34 +6,62 @@ import traceback
 from datetime import datetime
 import time
 
-from config import PROXY
+from config import PROXY, HTTP_POOL
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class BaseDataCollector:
 
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", session=None):
         self.data_dir = data_dir
         os.makedirs(data_dir, exist_ok=True)
         
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+
+        # Shared session injected by the owner (see HistoricalDataCollector); the
+        # collector never closes it
+        self.session = session
     
-    async def fetch_data(self, url, params=None):            
+    def set_session(self, session):
+        self.session = session
+
+    async def fetch_data(self, url, params=None, max_retries=None, retry_delay=None):
+        # Imported here because the utils package itself imports the collectors
+        from utils.resilience import CircuitOpenError, call_with_retries
+
+        max_retries = max_retries if max_retries is not None else HTTP_POOL['max_retries']
+        retry_delay = retry_delay if retry_delay is not None else HTTP_POOL['retry_delay']
         try:
+            if self.session is not None and not self.session.closed:
+                return await call_with_retries(url, lambda: self._get_json(self.session, url, params),
+                                               max_retries, retry_delay, description="Data request")
+
             async with aiohttp.ClientSession(headers=self.headers) as session:
-                    async with session.get(url, params=params, proxy=PROXY, timeout=30) as response:
-                        if response.status == 200:
-                            return await response.json()
-                        else:
-                            logger.error(f"Request failed, status code: {response.status}, URL: {url}")
-                            return None
+                return await call_with_retries(url, lambda: self._get_json(session, url, params),
+                                               max_retries, retry_delay, description="Data request")
+        except CircuitOpenError as e:
+            logger.error(f"Skipping request to {url}: {str(e)}")
+            return None
         except Exception as e:
             logger.error(f"Error fetching data: {url}, Error: {str(e)}")
             logger.debug(traceback.format_exc())
             return None
+
+    async def _get_json(self, session, url, params=None):
+        from utils.resilience import RETRYABLE_STATUSES, RetryableError, parse_retry_after
+
+        timeout = aiohttp.ClientTimeout(total=HTTP_POOL['timeout'])
+        async with session.get(url, params=params, headers=self.headers, proxy=PROXY, timeout=timeout) as response:
+            if response.status == 200:
+                return await response.json()
+            if response.status in RETRYABLE_STATUSES:
+                raise RetryableError(f"status code {response.status}", status=response.status,
+                                     retry_after=parse_retry_after(response.headers.get("Retry-After")))
+            logger.error(f"Request failed, status code: {response.status}, URL: {url}")
+            return None
     
     def save_to_json(self, data, filename):
         file_path = os.path.join(self.data_dir, filename)
@@ -7,59 +7,89 @@ from config import MARKET_SENTIMENT
 
 logger = logging.getLogger(__name__)
 
+DAY_MS = 24 * 60 * 60 * 1000
+KLINES_PAGE_LIMIT = 1000
+
 class BTCPriceCollector(BaseDataCollector):
-    def __init__(self, data_dir="data"):
-        super().__init__(data_dir)
+    def __init__(self, data_dir="data", session=None):
+        super().__init__(data_dir, session)
         self.btc_history_file = "btc_price_history.json"
         self.api_url = MARKET_SENTIMENT['btc_price_url']
     
-    async def get_price_history(self, days=180):
+    async def get_price_history(self, days=180, max_age=None):
+        # max_age: seconds the newest cached candle may be old before it is re-fetched, one day by default
         logger.info(f"Fetching {days} days of BTC historical price data...")
         
         btc_data = self.load_from_json(self.btc_history_file)
+        current_time = int(time.time() * 1000)
         if btc_data and len(btc_data) > 0:
             latest_time = max(int(item.get("timestamp", 0)) for item in btc_data)
-            current_time = int(time.time() * 1000)
-            if (current_time - latest_time) < 24 * 60 * 60 * 1000:
+            if (current_time - latest_time) < (DAY_MS if max_age is None else max_age * 1000):
                 logger.info(f"Using cached BTC historical price data; latest data timestamp: {datetime.fromtimestamp(latest_time/1000)}")
                 return btc_data
             else:
                 logger.info(f"Cached data has expired; latest data timestamp: {datetime.fromtimestamp(latest_time/1000)}")
+            # The newest cached candle may have been stored while still open, so it is re-fetched
+            start_time = latest_time
+        else:
+            btc_data = []
+            start_time = current_time - days * DAY_MS
         
         try:
-            params = {
-                "symbol": "BTCUSDT",
-                "interval": "1d",
-                "limit": min(days, 1000)
-            }
-            
-            data = await self.fetch_data(self.api_url, params)
+            data = await self.fetch_klines(start_time, current_time)
             
-            if data and isinstance(data, list):
+            if data:
                 logger.info(f"Successfully retrieved {len(data)} entries of BTC historical price data")
                 
-                btc_history = []
+                btc_history = {int(item.get("timestamp", 0)): item for item in btc_data}
                 for item in data:
                     try:
                         timestamp = int(item[0])
                         close_price = float(item[4])
                         
-                        btc_history.append({
+                        btc_history[timestamp] = {
                             "timestamp": timestamp,
                             "date": datetime.fromtimestamp(timestamp/1000).strftime('%Y-%m-%d'),
                             "price": close_price
-                        })
+                        }
                     except (IndexError, ValueError) as e:
                         logger.error(f"Error parsing BTC price data: {str(e)}, Data: {item}")
                 
-                btc_history.sort(key=lambda x: x["timestamp"], reverse=True)
+                btc_history = sorted(btc_history.values(), key=lambda x: x["timestamp"], reverse=True)
                 
                 self.save_to_json(btc_history, self.btc_history_file)
                 
                 return btc_history
             else:
                 logger.error("Failed to retrieve BTC historical price data")
-                return self.load_from_json(self.btc_history_file) or []
+                return btc_data
         except Exception as e:
             logger.error(f"Exception occurred while fetching BTC historical price data: {str(e)}")
-            return self.load_from_json(self.btc_history_file) or [] 
\ No newline at end of file
+            return btc_data
+
+    async def fetch_klines(self, start_time, end_time):
+        # Binance returns at most 1000 candles per request, so walk forward page by page
+        klines = []
+        while start_time <= end_time:
+            params = {
+                "symbol": "BTCUSDT",
+                "interval": "1d",
+                "startTime": start_time,
+                "endTime": end_time,
+                "limit": KLINES_PAGE_LIMIT
+            }
+            
+            page = await self.fetch_data(self.api_url, params)
+            if not isinstance(page, list):
+                if not klines:
+                    return None
+                logger.warning(f"Stopped paginating BTC klines after {len(klines)} entries")
+                break
+            
+            klines.extend(page)
+            if len(page) < KLINES_PAGE_LIMIT:
+                break
+            
+            start_time = int(page[-1][0]) + 1
+        
+        return klines
@@ -1,58 +1,82 @@
 from collectors.base_collector import BaseDataCollector
 import logging
+import math
 from datetime import datetime, timedelta
 import time
 from config import MARKET_SENTIMENT
 logger = logging.getLogger(__name__)
 
+DAY_SECONDS = 24 * 60 * 60
+
 class FearGreedCollector(BaseDataCollector):
 
-    def __init__(self, data_dir="data"):
-        super().__init__(data_dir)
+    def __init__(self, data_dir="data", session=None):
+        super().__init__(data_dir, session)
         self.fng_history_file = "fng_history.json"
         self.api_url = MARKET_SENTIMENT['fear_greed_url']
-        
-        if "?" in self.api_url:
-            self.api_url += "&limit=0"
-        else:
-            self.api_url += "?limit=0"
     
-    async def get_fear_greed_history(self, days=180):   
+    async def get_fear_greed_history(self, days=180, max_age=None):
+        # max_age: seconds the newest cached point may be old before fetching again, one day by default
         fng_data = self.load_from_json(self.fng_history_file)
-        if fng_data and "data" in fng_data and len(fng_data["data"]) > 0:
-            try:
-                latest_time = int(fng_data["data"][0]["timestamp"])
-                current_time = int(time.time())
-                if (current_time - latest_time) < 24 * 60 * 60:
-                    logger.info(f"Using cached historical data for the Fear & Greed Index; latest data timestamp: {datetime.fromtimestamp(latest_time)}")
-                    return self.format_fng_data(fng_data, days)
-                else:
-                    logger.info(f"Cached data has expired. Fetching updated historical data for the Fear & Greed Index")
-            except (KeyError, IndexError, TypeError) as e:
-                logger.error(f"Failed to verify Fear & Greed (FNG) data timestamp: {str(e)}")
+        latest_time = self.get_latest_timestamp(fng_data)
+        if latest_time is not None:
+            current_time = int(time.time())
+            if (current_time - latest_time) < (DAY_SECONDS if max_age is None else max_age):
+                logger.info(f"Using cached historical data for the Fear & Greed Index; latest data timestamp: {datetime.fromtimestamp(latest_time)}")
+                return self.format_fng_data(fng_data, days)
+            else:
+                logger.info(f"Cached data has expired. Fetching updated historical data for the Fear & Greed Index")
+            # Ask for the missing days plus the newest cached one, which may have been revised since
+            limit = math.ceil((current_time - latest_time) / DAY_SECONDS) + 1
+        else:
+            logger.info("No usable Fear & Greed Index cache, downloading the full history")
+            fng_data = None
+            limit = 0
         
         try:
-            data = await self.fetch_data(self.api_url)
+            data = await self.fetch_data(self.api_url, {"limit": limit})
             
             if data and "data" in data:
                 logger.info(f"Successfully retrieved {len(data['data'])} entries of Fear & Greed Index historical data")
                 
+                if fng_data:
+                    data = self.merge_fng_data(fng_data, data)
+                
                 self.save_to_json(data, self.fng_history_file)
                 
                 return self.format_fng_data(data, days)
             else:
                 logger.error("Failed to retrieve Fear & Greed Index historical data")
-                raw_data = self.load_from_json(self.fng_history_file)
-                if raw_data:
-                    return self.format_fng_data(raw_data, days)
+                if fng_data:
+                    return self.format_fng_data(fng_data, days)
                 return []
         except Exception as e:
             logger.error(f"Exception occurred while fetching Fear & Greed Index historical data: {str(e)}")
             
-            raw_data = self.load_from_json(self.fng_history_file)
-            if raw_data:
-                return self.format_fng_data(raw_data, days)
+            if fng_data:
+                return self.format_fng_data(fng_data, days)
             return []
+
+    def get_latest_timestamp(self, data):
+        if not isinstance(data, dict) or not isinstance(data.get("data"), list) or not data["data"]:
+            return None
+        try:
+            return max(int(item["timestamp"]) for item in data["data"])
+        except (KeyError, ValueError, TypeError) as e:
+            logger.error(f"Failed to verify Fear & Greed (FNG) data timestamp: {str(e)}")
+            return None
+
+    def merge_fng_data(self, old_data, new_data):
+        entries = {str(item["timestamp"]): item for item in old_data["data"]}
+        for item in new_data.get("data", []):
+            if "timestamp" in item:
+                entries[str(item["timestamp"])] = item
+        
+        merged = dict(old_data)
+        merged.update({key: value for key, value in new_data.items() if key != "data"})
+        merged["data"] = sorted(entries.values(), key=lambda x: int(x["timestamp"]), reverse=True)
+        logger.info(f"Merged {len(new_data.get('data', []))} new Fear & Greed Index entries into {len(old_data['data'])} cached entries")
+        return merged
     
     def format_fng_data(self, data, days=180):
         if not data or "data" not in data:
@@ -78,4 +102,4 @@ class FearGreedCollector(BaseDataCollector):
                 logger.error(f"Error formatting Fear & Greed Index data: {str(e)}, Data: {item}")
         
         formatted_data.sort(key=lambda x: x["timestamp"], reverse=True)
-        return formatted_data 
\ No newline at end of file
+        return formatted_data
@@ -8,4 +8,6 @@ This package contains utility modules for data processing, storage, and manipula
 from utils.data_store import DataStore
 from utils.historical_data import HistoricalDataCollector
 from utils.data_reorganizer import reorganize_by_date, load_historical_data, save_daily_data
-from utils.trend_analyzer import TrendAnalyzer 
\ No newline at end of file
+from utils.trend_analyzer import TrendAnalyzer
+# Re-exported so callers importing through ``src.utils`` share the one writer thread
+from utils.artifact_sink import get_artifact_sink 
\ No newline at end of file
@@ -0,0 +1,199 @@
+import os
+import gzip
+import json
+import time
+import queue
+import atexit
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from config import ARTIFACTS, DATA_DIRS
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+_STOP = object()
+
+
+class ArtifactSink:
+    # Writes debug artifacts (prompts, raw responses, advice and report files) from a background
+    # thread, optionally compressed, and prunes each directory by age and total size
+
+    def __init__(self, background: bool = True, compression: Optional[str] = "gzip", compress_kinds=(),
+                 dedup_prompts: bool = True, max_age_days: Optional[float] = 30, max_mb: Optional[float] = 200,
+                 prune_interval: float = 60, queue_size: int = 256):
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, compressing artifacts with gzip instead")
+            compression = "gzip"
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {compression}, expected one of {tuple(COMPRESSION_SUFFIXES)}")
+
+        self.compression = compression
+        self.compress_kinds = set(compress_kinds)
+        self.dedup_prompts = dedup_prompts
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.max_bytes = max_mb * 1024 * 1024 if max_mb else None
+        self.prune_interval = prune_interval
+        self._last_pruned: Dict[str, float] = {}
+
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._run, name="artifact-sink", daemon=True)
+            self._thread.start()
+
+    def write(self, kind: str, prefix: str, content: Any, ext: str = ".txt", dedup: bool = False) -> str:
+        # Returns the final path right away; the file appears once the background thread gets to it
+        # (or never, if the queue was full when called from an event loop).
+        # Anything other than str/bytes is JSON-encoded on that thread, so it must not be mutated afterwards.
+        directory = DATA_DIRS[kind]
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        if dedup and not isinstance(data, bytes):
+            data = self._encode(data)
+        suffix = ext + (COMPRESSION_SUFFIXES[self.compression] if kind in self.compress_kinds else "")
+
+        if dedup:
+            # Identical content always maps to the same file, which is only written once
+            name = f"{prefix}_{hashlib.sha256(data).hexdigest()[:16]}{suffix}"
+        else:
+            name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{suffix}"
+        path = os.path.join(directory, name)
+
+        if self._queue is None:
+            self._write(path, data)
+            return path
+        try:
+            self._queue.put_nowait((path, data))
+        except queue.Full:
+            # Never wait on a slow disk from inside the event loop; other threads can afford an inline write
+            if _in_event_loop():
+                logger.warning(f"Artifact queue is full, dropping {path}")
+            else:
+                logger.warning(f"Artifact queue is full, writing {path} inline")
+                self._write(path, data)
+        return path
+
+    def flush(self) -> None:
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _encode(content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return json.dumps(content, ensure_ascii=False).encode('utf-8')
+
+    def _compress(self, path: str, data: bytes) -> bytes:
+        if path.endswith(".gz"):
+            return gzip.compress(data, compresslevel=6)
+        if path.endswith(".zst"):
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return data
+
+    def _write(self, path: str, data: Any) -> None:
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if os.path.exists(path):
+                # Deduplicated content: refresh the age instead of writing it again
+                os.utime(path)
+                logger.info(f"Artifact unchanged, reusing: {path}")
+            else:
+                temp_path = path + ".tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(self._compress(path, self._encode(data)))
+                os.replace(temp_path, path)
+                logger.info(f"Saved artifact to: {path}")
+        except Exception as e:
+            logger.error(f"Failed to save artifact {path}: {str(e)}")
+            return
+
+        if time.time() - self._last_pruned.get(directory, 0) >= self.prune_interval:
+            self.prune(directory)
+
+    def prune(self, directory: str) -> int:
+        self._last_pruned[directory] = time.time()
+        now = time.time()
+        removed = 0
+        entries = []
+        try:
+            for entry in os.scandir(directory):
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                if self.max_age_seconds and now - stat.st_mtime > self.max_age_seconds:
+                    removed += self._remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            logger.error(f"Failed to scan {directory} for retention: {str(e)}")
+            return removed
+
+        if self.max_bytes:
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                removed += self._remove(path)
+                total -= size
+
+        if removed:
+            logger.info(f"Removed {removed} old artifact(s) from {directory}")
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+_sink: Optional[ArtifactSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_artifact_sink() -> ArtifactSink:
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = ArtifactSink(**ARTIFACTS)
+            # Pending writes still land when the process exits normally
+            atexit.register(_sink.close)
+        return _sink
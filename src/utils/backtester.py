@@ -0,0 +1,325 @@
+import os
+import logging
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+
+from utils.historical_data import HistoricalDataCollector
+from utils.indicators import rate_of_change
+from utils.trend_analyzer import TrendAnalyzer
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Share of the total budget bought (positive) or sold (negative) for each advice action
+ACTION_ALLOCATION = {
+    "Buy aggressively": 0.25,
+    "Buy regularly": 0.10,
+    "Gradually buy": 0.10,
+    "Buy slightly": 0.05,
+    "Buy the dip (small position)": 0.05,
+    "Cautious small buy": 0.05,
+    "Hold": 0.0,
+    "Hold cautiously": 0.0,
+    "Cautious hold": 0.0,
+    "Wait and see": 0.0,
+    "Wait or slightly reduce position": -0.05,
+    "Slightly reduce position": -0.10,
+    "Consider reducing position": -0.10,
+    "Aggressively reduce position": -0.25,
+}
+
+
+class Backtester:
+
+    def __init__(self, analyzer: TrendAnalyzer = None, budget: float = 1000.0, warmup_days: int = 30,
+                 hit_horizon_days: int = 30, action_allocation: Dict[str, float] = None):
+        self.analyzer = analyzer or TrendAnalyzer()
+        self.budget = budget
+        self.warmup_days = warmup_days
+        self.hit_horizon_days = hit_horizon_days
+        self.action_allocation = action_allocation or ACTION_ALLOCATION
+
+    @staticmethod
+    def load_csv_history(csv_dir: str = "csv") -> Dict[str, Any]:
+        btc = HistoricalDataCollector.read_csv_history(os.path.join(csv_dir, "btc_price_history.csv"))
+        ahr = HistoricalDataCollector.read_csv_history(os.path.join(csv_dir, "ahr999_history.csv"))
+        fng = HistoricalDataCollector.read_csv_history(os.path.join(csv_dir, "fng_history.csv"))
+        if btc.empty:
+            return {}
+
+        btc = btc.iloc[::-1]
+        dates = btc["date"].astype(str).to_numpy()
+
+        return {
+            "dates": dates,
+            "prices": btc["price"].to_numpy(dtype=np.float64),
+            "ahr999": Backtester._as_of(dates, ahr, "ahr999"),
+            "fear_greed": Backtester._as_of(dates, fng, "value"),
+            "fear_greed_class": Backtester._as_of(dates, fng, "value_classification", fill=""),
+        }
+
+    @staticmethod
+    def _as_of(dates: np.ndarray, df, column: str, fill=np.nan) -> np.ndarray:
+        # Latest value on or before each trading date
+        if df.empty or column not in df:
+            return np.full(len(dates), fill, dtype=object if isinstance(fill, str) else np.float64)
+        df = df.iloc[::-1]
+        source_dates = df["date"].astype(str).to_numpy()
+        values = df[column].to_numpy()
+        index = np.searchsorted(source_dates, dates, side='right') - 1
+        if isinstance(fill, str):
+            result = np.where(index >= 0, values[np.clip(index, 0, None)], fill).astype(object)
+        else:
+            result = np.where(index >= 0, values[np.clip(index, 0, None)].astype(np.float64), fill)
+        return result
+
+    def run_csv(self, csv_dir: str = "csv") -> Dict[str, Any]:
+        history = self.load_csv_history(csv_dir)
+        if not history:
+            return {"status": "error", "message": f"No BTC price history found in {csv_dir}"}
+        return self.run(**history)
+
+    def run(self, dates: Sequence[str], prices: np.ndarray, ahr999: Optional[np.ndarray] = None,
+            fear_greed: Optional[np.ndarray] = None, fear_greed_class: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        prices = np.asarray(prices, dtype=np.float64)
+        count = len(prices)
+        if count <= self.warmup_days:
+            return {
+                "status": "error",
+                "message": f"Insufficient history for backtest: {count} days, need more than {self.warmup_days}"
+            }
+
+        # Every indicator the rules need, computed once for the whole history
+        change_7d = rate_of_change(prices, 6)
+        change_30d = rate_of_change(prices, 29)
+
+        actions = self.evaluate_actions(prices, change_7d, change_30d, ahr999, fear_greed, fear_greed_class)
+        return self.simulate(dates, prices, actions)
+
+    def evaluate_actions(self, prices, change_7d, change_30d, ahr999=None, fear_greed=None,
+                         fear_greed_class=None) -> List[Optional[str]]:
+        # Each rule only looks at a few categories per day (trend signs, the AHR999 band, the
+        # Fear & Greed mood), so the analyzer is asked once per category and its answers are
+        # mapped onto the indicator arrays. evaluate_actions_reference is the per-day form.
+        count = len(prices)
+        vocabulary: Dict[str, int] = {}
+        none = (np.zeros(count, dtype=np.int64), np.zeros(count), np.zeros(count, dtype=bool))
+        price = self._price_candidates(change_7d, change_30d, vocabulary)
+        ahr = self._ahr999_candidates(ahr999, vocabulary) if ahr999 is not None else none
+        fng = self._fear_greed_candidates(fear_greed, fear_greed_class, vocabulary) if fear_greed is not None else none
+
+        codes = np.stack([price[0], ahr[0], fng[0]])
+        # _get_overall_advice weighs the advice by list position, so without an AHR999 value the
+        # Fear & Greed advice takes the AHR999 slot and its weight of 0
+        weights = np.stack([price[1], ahr[1], np.where(ahr[2], fng[1], 0.0)])
+        present = np.stack([price[2], ahr[2], fng[2]])
+
+        # Weight of each candidate's action summed over the candidates agreeing with it; ties go to
+        # the earliest candidate, like max() over the analyzer's insertion-ordered dict
+        agree = codes[:, None, :] == codes[None, :, :]
+        totals = (agree * (weights * present)[None, :, :]).sum(axis=1)
+        winner = np.argmax(np.where(present, totals, -np.inf), axis=0)
+
+        names = np.array(list(vocabulary), dtype=object)
+        actions = names[codes[winner, np.arange(count)]]
+        actions[:self.warmup_days] = None
+        return actions.tolist()
+
+    def _rule_table(self, advices: List[Dict[str, Any]], vocabulary: Dict[str, int]):
+        levels = self.analyzer.params["confidence_levels"]
+        codes = np.array([vocabulary.setdefault(advice["action"], len(vocabulary)) for advice in advices], dtype=np.int64)
+        weights = np.array([levels.get(advice["confidence"], 2) for advice in advices], dtype=np.float64)
+        return codes, weights
+
+    def _price_candidates(self, change_7d, change_30d, vocabulary: Dict[str, int]):
+        change_7d = np.nan_to_num(np.asarray(change_7d, dtype=np.float64), nan=0.0)
+        change_30d = np.nan_to_num(np.asarray(change_30d, dtype=np.float64), nan=0.0)
+        # Bits: 30d up, 7d up, 7d above +10%, 30d below -20%
+        category = (change_30d > 0) * 8 + (change_7d > 0) * 4 + (change_7d > 10) * 2 + (change_30d < -20)
+        advices = []
+        for bits in range(16):
+            up_30, up_7, surge_7, crash_30 = bits & 8, bits & 4, bits & 2, bits & 1
+            change_7 = 11 if surge_7 else (1 if up_7 else -1)
+            change_30 = -21 if crash_30 else (1 if up_30 else -1)
+            advices.append(self.analyzer._get_price_based_advice({
+                "current_price": 0.0,
+                "price_change_7d": change_7,
+                "price_change_30d": change_30,
+                "trend_7d": "Increase" if up_7 else "Decrease",
+                "trend_30d": "Increase" if up_30 else "Decrease",
+            }))
+        codes, weights = self._rule_table(advices, vocabulary)
+        return codes[category], weights[category], np.ones(len(category), dtype=bool)
+
+    def _ahr999_candidates(self, ahr999, vocabulary: Dict[str, int]):
+        analyzer = self.analyzer
+        ahr999 = np.asarray(ahr999, dtype=np.float64)
+        present = ~np.isnan(ahr999)
+        bands = np.asarray(analyzer.params["ahr999_bands"], dtype=np.float64)
+        # Band k holds values from bands[k - 1] (inclusive) up to bands[k]
+        band = np.searchsorted(bands, np.where(present, ahr999, 0.0), side='right')
+        advices = [
+            analyzer._get_ahr999_based_advice({"current_value": value, "market_state": analyzer._classify_ahr999(value)})
+            for value in [bands[0] - 1] + list(bands)
+        ]
+        codes, weights = self._rule_table(advices, vocabulary)
+        return codes[band], weights[band], present
+
+    def _fear_greed_candidates(self, fear_greed, fear_greed_class, vocabulary: Dict[str, int]):
+        analyzer = self.analyzer
+        fear_greed = np.asarray(fear_greed, dtype=np.float64)
+        present = ~np.isnan(fear_greed)
+        classes = np.asarray(fear_greed_class if fear_greed_class is not None else [""] * len(fear_greed), dtype=object)
+        # The mood depends on the value and the index's own classification; there are only a few
+        # hundred distinct pairs, each classified once
+        values, value_index = np.unique(np.where(present, fear_greed, 0.0), return_inverse=True)
+        labels, label_index = np.unique(classes.astype(str), return_inverse=True)
+        pairs, pair_index = np.unique(value_index * len(labels) + label_index, return_inverse=True)
+        advices = []
+        for pair in pairs:
+            value, label = values[pair // len(labels)], labels[pair % len(labels)]
+            advices.append(analyzer._get_fear_greed_based_advice({
+                "current_value": int(value),
+                "market_mood": analyzer._classify_fear_greed(value, label),
+            }))
+        codes, weights = self._rule_table(advices, vocabulary)
+        return codes[pair_index], weights[pair_index], present
+
+    def evaluate_actions_reference(self, prices, change_7d, change_30d, ahr999=None, fear_greed=None,
+                         fear_greed_class=None) -> List[Optional[str]]:
+        # Plain per-day evaluation through the analyzer, the reference evaluate_actions() is checked against
+        analyzer = self.analyzer
+        actions: List[Optional[str]] = [None] * len(prices)
+        for i in range(self.warmup_days, len(prices)):
+            change_7 = 0 if np.isnan(change_7d[i]) else change_7d[i]
+            change_30 = 0 if np.isnan(change_30d[i]) else change_30d[i]
+            advice = {
+                "price_based": analyzer._get_price_based_advice({
+                    "current_price": prices[i],
+                    "price_change_7d": change_7,
+                    "price_change_30d": change_30,
+                    "trend_7d": "Increase" if change_7 > 0 else "Decrease",
+                    "trend_30d": "Increase" if change_30 > 0 else "Decrease",
+                })
+            }
+            if ahr999 is not None and not np.isnan(ahr999[i]):
+                advice["ahr999_based"] = analyzer._get_ahr999_based_advice({
+                    "current_value": ahr999[i],
+                    "market_state": analyzer._classify_ahr999(ahr999[i]),
+                })
+            if fear_greed is not None and not np.isnan(fear_greed[i]):
+                advice["fear_greed_based"] = analyzer._get_fear_greed_based_advice({
+                    "current_value": int(fear_greed[i]),
+                    "market_mood": analyzer._classify_fear_greed(
+                        fear_greed[i], fear_greed_class[i] if fear_greed_class is not None else ""
+                    ),
+                })
+            actions[i] = analyzer._get_overall_advice(advice)["action"]
+        return actions
+
+    def simulate(self, dates: Sequence[str], prices: np.ndarray, actions: List[Optional[str]]) -> Dict[str, Any]:
+        count = len(prices)
+        cash = self.budget
+        btc = 0.0
+        cash_curve = np.empty(count)
+        btc_curve = np.empty(count)
+        trades = []
+
+        for i in range(count):
+            allocation = self.action_allocation.get(actions[i], 0.0) if actions[i] else 0.0
+            price = float(prices[i])
+            if allocation > 0 and cash > 0:
+                amount = min(cash, allocation * self.budget)
+                cash -= amount
+                btc += amount / price
+                trades.append({"index": i, "date": str(dates[i]), "action": actions[i], "side": "buy",
+                               "amount": amount, "price": price})
+            elif allocation < 0 and btc > 0:
+                amount = min(btc * price, -allocation * self.budget)
+                cash += amount
+                btc -= amount / price
+                trades.append({"index": i, "date": str(dates[i]), "action": actions[i], "side": "sell",
+                               "amount": amount, "price": price})
+            cash_curve[i] = cash
+            btc_curve[i] = btc
+
+        equity = cash_curve + btc_curve * prices
+        peak = np.maximum.accumulate(equity)
+        drawdown = (equity / peak - 1) * 100
+
+        # A trade is a hit when the price moved its way after the horizon
+        hits = []
+        for trade in trades:
+            later = trade["index"] + self.hit_horizon_days
+            if later < count:
+                moved_up = bool(prices[later] > trade["price"])
+                hits.append(moved_up if trade["side"] == "buy" else not moved_up)
+                trade["hit"] = hits[-1]
+
+        final_equity = float(equity[-1])
+        return {
+            "status": "success",
+            "start_date": str(dates[0]),
+            "end_date": str(dates[-1]),
+            "days": count,
+            "budget": self.budget,
+            "final_equity": final_equity,
+            "return_pct": (final_equity / self.budget - 1) * 100,
+            "buy_and_hold_return_pct": float(prices[-1] / prices[self.warmup_days] - 1) * 100,
+            "max_drawdown_pct": float(drawdown.min()),
+            "trade_count": len(trades),
+            "hit_rate": (sum(hits) / len(hits) * 100) if hits else None,
+            "trades": trades,
+            "dates": list(dates),
+            "equity_curve": equity,
+            "drawdown": drawdown,
+            "btc_holdings": btc_curve,
+        }
+
+
+def benchmark_evaluation(sizes=(1_000, 10_000, 50_000), repeat: int = 3, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    # evaluate_actions() against the per-day reference on synthetic inputs with gaps: best-of-``repeat``
+    # timings and whether every action matches
+    import time
+    from utils.trend_analyzer import FEAR_GREED_MOODS
+
+    rng = np.random.default_rng(7)
+    backtester = Backtester(TrendAnalyzer(params=params))
+    results = []
+    for size in sizes:
+        prices = 30000 * np.exp(np.cumsum(rng.normal(0, 0.03, size)))
+        ahr999 = np.where(rng.random(size) < 0.05, np.nan, rng.uniform(0.3, 1.8, size))
+        fear_greed = np.where(rng.random(size) < 0.05, np.nan, rng.integers(0, 101, size).astype(np.float64))
+        fear_greed_class = rng.choice(list(FEAR_GREED_MOODS) + [""], size).astype(object)
+        inputs = (prices, rate_of_change(prices, 6), rate_of_change(prices, 29), ahr999, fear_greed, fear_greed_class)
+
+        timings = {}
+        for name, func in (("vectorized", backtester.evaluate_actions), ("loop", backtester.evaluate_actions_reference)):
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                output = func(*inputs)
+                best = min(best, time.perf_counter() - started)
+            timings[name] = (best, output)
+        # Without AHR999 values the Fear & Greed advice loses its weight, which is worth checking on its own
+        no_ahr999 = inputs[:3] + (None,) + inputs[4:]
+        results.append({
+            "days": size,
+            "vectorized_ms": round(timings["vectorized"][0] * 1000, 2),
+            "loop_ms": round(timings["loop"][0] * 1000, 2),
+            "speedup": round(timings["loop"][0] / timings["vectorized"][0], 1),
+            "same_actions": timings["vectorized"][1] == timings["loop"][1]
+                            and backtester.evaluate_actions(*no_ahr999) == backtester.evaluate_actions_reference(*no_ahr999),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = benchmark_evaluation()
+    results += benchmark_evaluation(sizes=(10_000,), params={"fear_greed_bands": (25, 45, 55, 75)})
+    for result in results:
+        print(result)
+    if not all(result["same_actions"] for result in results):
+        raise SystemExit("evaluate_actions() does not match the per-day reference")
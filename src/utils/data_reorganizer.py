@@ -1,12 +1,23 @@
 import os
 import json
+import heapq
 import logging
 from datetime import datetime
-from typing import Dict, Any, List
+from itertools import groupby
+from typing import Dict, Any, List, Iterable, Iterator, Union
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# (series key in historical data, value key in the series, field in the daily row, type)
+SERIES_FIELDS = [
+    ('btc_price', 'price', 'price', float),
+    ('ahr999', 'ahr999', 'ahr999', float),
+    ('fear_greed', 'value', 'fear_greed_value', int),
+]
+
+JOIN_MODES = ('outer', 'inner')
+
 def load_historical_data(file_path: str) -> Dict[str, Any]:
     try:
         if os.path.exists(file_path):
@@ -18,89 +29,106 @@ def load_historical_data(file_path: str) -> Dict[str, Any]:
     except Exception as e:
         return {}
 
-def reorganize_by_date(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+def _is_sorted(dates: List[str]) -> bool:
+    return all(dates[i] <= dates[i + 1] for i in range(len(dates) - 1))
+
+def _date_stream(items: List[Dict[str, Any]], value_key: str, field: str, cast) -> Iterator[tuple]:
+    # The collectors store series newest first, so usually this is just a reversed walk
+    items = [item for item in items if item.get('date')]
+    dates = [item['date'] for item in items]
+    if _is_sorted(dates):
+        ordered = items
+    elif _is_sorted(dates[::-1]):
+        ordered = reversed(items)
+    else:
+        logger.warning(f"Series '{field}' is not sorted by date, sorting it")
+        ordered = sorted(items, key=lambda x: x['date'])
+
+    for item in ordered:
+        value = item.get(value_key)
+        yield item['date'], field, cast(value) if value is not None else None
+
+def iter_daily_rows(data: Dict[str, Any], how: str = 'outer', forward_fill: bool = False) -> Iterator[Dict[str, Any]]:
+    if how not in JOIN_MODES:
+        raise ValueError(f"Unknown join mode: {how}, expected one of {JOIN_MODES}")
     if not data:
-        return {}
-    
-    btc_price_data = data.get('btc_price', [])
-    ahr999_data = data.get('ahr999', [])
-    fear_greed_data = data.get('fear_greed', [])
-    
-    daily_data = {}
-    
-    for item in btc_price_data:
-        date = item.get('date')
-        if not date:
-            continue
-            
-        if date not in daily_data:
-            daily_data[date] = {'date': date}
-            
-        daily_data[date]['price'] = item.get('price')
-        # daily_data[date]['market_cap'] = item.get('market_cap')
-        # daily_data[date]['volume'] = item.get('volume')
-        # daily_data[date]['btc_timestamp'] = item.get('timestamp')
-    
-    for item in ahr999_data:
-        date = item.get('date')
-        if not date:
-            continue
-            
-        if date not in daily_data:
-            daily_data[date] = {'date': date}
-            
-        daily_data[date]['ahr999'] = item.get('ahr999')
-        # for field in ['ma200', 'price_ma_ratio', 'ahr999_signal']:
-        #     if field in item:
-        #         daily_data[date][field] = item.get(field)
-        # daily_data[date]['ahr999_timestamp'] = item.get('timestamp')
-    
-    for item in fear_greed_data:
-        date = item.get('date')
-        if not date:
+        return
+
+    streams = [
+        _date_stream(data.get(series) or [], value_key, field, cast)
+        for series, value_key, field, cast in SERIES_FIELDS
+    ]
+    fields = [field for _, _, field, _ in SERIES_FIELDS]
+    last_values: Dict[str, Any] = {}
+
+    for date, entries in groupby(heapq.merge(*streams, key=lambda entry: entry[0]), key=lambda entry: entry[0]):
+        row = {'date': date}
+        for _, field, value in entries:
+            row[field] = value
+
+        if how == 'inner' and any(field not in row for field in fields):
             continue
-            
-        if date not in daily_data:
-            daily_data[date] = {'date': date}
-            
-        daily_data[date]['fear_greed_value'] = item.get('value')
-        # daily_data[date]['fear_greed_classification'] = item.get('classification')
-        # daily_data[date]['fear_greed_timestamp'] = item.get('timestamp')
-    
-    return daily_data
-
-def save_daily_data(daily_data: Dict[str, Dict[str, Any]], file_path: str) -> bool:
+
+        if forward_fill:
+            for field in fields:
+                if field in row:
+                    last_values[field] = row[field]
+                elif field in last_values:
+                    row[field] = last_values[field]
+
+        yield row
+
+def reorganize_by_date(data: Dict[str, Any], how: str = 'outer', forward_fill: bool = False) -> Dict[str, Dict[str, Any]]:
+    return {row['date']: row for row in iter_daily_rows(data, how=how, forward_fill=forward_fill)}
+
+def save_daily_data(daily_data: Union[Dict[str, Dict[str, Any]], Iterable[Dict[str, Any]]], file_path: str) -> bool:
     try:
-        data_list = list(daily_data.values())
-        data_list.sort(key=lambda x: x['date'])
-        
-        complete_data = {
-            "data": data_list,
-            "count": len(data_list),
-            # "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "description": "Daily combined BTC price, AHR999 index and Fear & Greed index data"
-        }
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(complete_data, f, indent=2, ensure_ascii=False)
+        if isinstance(daily_data, dict):
+            rows = list(daily_data.values())
+            if any(rows[i]['date'] > rows[i + 1]['date'] for i in range(len(rows) - 1)):
+                rows.sort(key=lambda x: x['date'])
+        else:
+            rows = daily_data
+
+        # Rows are written one per line as they arrive, so memory stays flat
+        temp_path = file_path + ".tmp"
+        count = 0
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('{\n  "data": [')
+            for row in rows:
+                f.write(',\n    ' if count else '\n    ')
+                f.write(json.dumps(row, ensure_ascii=False))
+                count += 1
+            f.write('\n  ],\n')
+            f.write(f'  "count": {count},\n')
+            f.write('  "description": "Daily combined BTC price, AHR999 index and Fear & Greed index data"\n}')
+        os.replace(temp_path, file_path)
         return True
     except Exception as e:
+        logger.error(f"Failed to save daily data: {str(e)}")
+        if os.path.exists(file_path + ".tmp"):
+            os.remove(file_path + ".tmp")
         return False
 
-def reorganize_data(input_file: str, output_file: str) -> bool:
+def reorganize_data(input_file: str, output_file: str, how: str = 'outer', forward_fill: bool = False) -> bool:
 
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
     historical_data = load_historical_data(input_file)
     if not historical_data:
         return False
-    
-    daily_data = reorganize_by_date(historical_data)
-    if not daily_data:
+
+    rows = iter_daily_rows(historical_data, how=how, forward_fill=forward_fill)
+    first_row = next(rows, None)
+    if first_row is None:
         return False
-    
-    success = save_daily_data(daily_data, output_file)
+
+    success = save_daily_data(_chain_first(first_row, rows), output_file)
     if success:
         return True
     else:
         return False
+
+def _chain_first(first_row: Dict[str, Any], rows: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first_row
+    yield from rows
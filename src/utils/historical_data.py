@@ -1,17 +1,29 @@
 import asyncio
+import aiohttp
+import csv
 import os
 import json
 import logging
 import time
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
 from collectors import BTCPriceCollector, AHR999Collector, FearGreedCollector
+from config import HTTP_POOL, STORAGE
+from utils.timeseries_store import TimeSeriesStore, FNG_CLASSES
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Columns kept in the columnar store for each series; BTC timestamps are in milliseconds
+SERIES_SPECS = {
+    "btc_price": {"columns": ("price",), "timestamp_scale": 1000},
+    "ahr999": {"columns": ("ahr999",), "timestamp_scale": 1},
+    "fear_greed": {"columns": ("value", "classification"), "timestamp_scale": 1},
+}
+
 
 class HistoricalDataCollector:
 
@@ -26,11 +38,72 @@ class HistoricalDataCollector:
 
         os.makedirs(data_dir, exist_ok=True)
 
+        store_dir = os.path.join(data_dir, STORAGE['store_dir'])
+        self.stores = {
+            name: TimeSeriesStore(os.path.join(store_dir, name), spec["columns"])
+            for name, spec in SERIES_SPECS.items()
+        }
+        self.json_export = STORAGE['json_export']
+        self.retention_days = STORAGE['retention_days']
+        self.load_days = STORAGE['load_days']
+        for name, store in self.stores.items():
+            if len(store) > 0 and not store.metadata.get("day_keyed"):
+                self._rekey_by_day(name, store)
+
         self.btc_collector = BTCPriceCollector(data_dir)
         self.ahr999_collector = AHR999Collector(data_dir)
         self.fng_collector = FearGreedCollector(data_dir)
 
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def collectors(self):
+        return [self.btc_collector, self.ahr999_collector, self.fng_collector]
+
+    async def open_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL['limit'],
+                limit_per_host=HTTP_POOL['limit_per_host'],
+                ttl_dns_cache=HTTP_POOL['ttl_dns_cache'],
+                keepalive_timeout=HTTP_POOL['keepalive_timeout']
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_POOL['timeout'])
+            )
+            for collector in self.collectors:
+                collector.set_session(self.session)
+            logger.info("Opened shared HTTP session for data collectors")
+        return self.session
+
+    async def close_session(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            logger.info("Closed shared HTTP session for data collectors")
+        self.session = None
+        for collector in self.collectors:
+            collector.set_session(None)
+
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_session()
+
     async def collect_historical_data(self, days=180) -> Dict[str, Any]:
+        # Outside of an ``async with`` block the session only lives for this cycle
+        owns_session = self.session is None or self.session.closed
+        if owns_session:
+            await self.open_session()
+        try:
+            return await self._collect_historical_data(days)
+        finally:
+            if owns_session:
+                await self.close_session()
+
+    async def _collect_historical_data(self, days=180) -> Dict[str, Any]:
 
         btc_task = asyncio.create_task(self.btc_collector.get_price_history(days))
         ahr_task = asyncio.create_task(self.ahr999_collector.get_ahr999_history(days))
@@ -52,47 +125,225 @@ class HistoricalDataCollector:
 
         return historical_data
 
-    def persist_csv_data(self, data: Dict[str, Any]) -> bool:
-        def save_new_csv_data(self, data, csv, path) -> None:
-            # Creating mask to check if there are new values from most recent data
-            new_df = data[~data['date'].isin(csv['date'])]
-            if new_df.empty:
-                logger.info(f"No new csv data to append for {path}")
-                pass
-            else:
-                # Concatenating, sorting and saving new data without overwriting past records
-                combined_df = pd.concat([csv, new_df])
-                combined_df = combined_df.sort_values("date", ascending=False)
-                combined_df.to_csv(path, index=False)
-                logger.info(f"Appended {len(new_df)} new rows to {path}")
-            pass
-
+    async def refresh_series(self, names=None, days=180, max_age=None) -> Dict[str, Any]:
+        # Fetches only the given series and merges them into the stored history,
+        # so each series can be refreshed on its own schedule. max_age (seconds) overrides
+        # the collectors' one-day cache check, 0 always fetches.
+        names = list(names or SERIES_SPECS)
+        fetchers = {
+            "btc_price": self.btc_collector.get_price_history,
+            "ahr999": self.ahr999_collector.get_ahr999_history,
+            "fear_greed": self.fng_collector.get_fear_greed_history,
+        }
+        owns_session = self.session is None or self.session.closed
+        if owns_session:
+            await self.open_session()
         try:
-            btc_csv = pd.read_csv(self.btc_csv_file)
-            ahr999_csv = pd.read_csv(self.ahr999_csv_file)
-            fng_csv = pd.read_csv(self.fng_csv_file)
+            results = await asyncio.gather(*(fetchers[name](days, max_age=max_age) for name in names))
+        finally:
+            if owns_session:
+                await self.close_session()
+
+        new_data = {name: result for name, result in zip(names, results) if result}
+        old_data = self.load_historical_data()
+        if old_data:
+            data = self.merge_historical_data(old_data, new_data)
+        else:
+            data = {**{name: [] for name in SERIES_SPECS}, **new_data, "last_updated": int(time.time())}
 
-            save_new_csv_data(self, pd.DataFrame(data['btc_price']), btc_csv, self.btc_csv_file)
-            save_new_csv_data(self, pd.DataFrame(data['ahr999']), ahr999_csv, self.ahr999_csv_file)
-            save_new_csv_data(self, pd.DataFrame(data['fear_greed']), fng_csv, self.fng_csv_file)
+        self.persist_csv_data(new_data)
+        self.save_historical_data(data)
+        logger.info(f"Refreshed {', '.join(names)}")
+        return data
+
+    def persist_csv_data(self, data: Dict[str, Any]) -> bool:
+        # The CSV files are append-only, so simulated rows would outlive the next good fetch
+        data = {name: self._real_records(data.get(name)) for name in SERIES_SPECS}
+        try:
+            self.append_csv_rows(data.get('btc_price') or [], self.btc_csv_file, ["timestamp", "date", "price"])
+            self.append_csv_rows(data.get('ahr999') or [], self.ahr999_csv_file, ["timestamp", "date", "ahr999"])
+            self.append_csv_rows(data.get('fear_greed') or [], self.fng_csv_file, ["timestamp", "date", "value", "value_classification"])
 
             return True
         except Exception as e:
+            logger.error(f"Failed to persist csv data: {str(e)}")
             return False
 
+    def append_csv_rows(self, records: List[Dict[str, Any]], path: str, default_fields: List[str]) -> int:
+        # Rows are only ever appended, so the file is not kept in date order;
+        # use read_csv_history to get a sorted view
+        last_date = self._last_persisted_date(path)
+        new_rows = sorted(
+            (item for item in records if item.get("date") and (last_date is None or item["date"] > last_date)),
+            key=lambda x: x["date"]
+        )
+        if not new_rows:
+            logger.info(f"No new csv data to append for {path}")
+            return 0
+
+        file_exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if file_exists:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                fieldnames = next(csv.reader(f), None) or default_fields
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            fieldnames = default_fields
+
+        with open(path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(new_rows)
+
+        self._write_csv_index(path, new_rows[-1]["date"])
+        logger.info(f"Appended {len(new_rows)} new rows to {path}")
+        return len(new_rows)
+
+    def _csv_index_file(self, path: str) -> str:
+        return path + ".idx"
+
+    def _last_persisted_date(self, path: str) -> Optional[str]:
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(self._csv_index_file(path), 'r', encoding='utf-8') as f:
+                return json.load(f)["last_date"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # No usable index yet: scan the file once and remember the result
+        last_date = None
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                date = row.get("date")
+                if date and (last_date is None or date > last_date):
+                    last_date = date
+        if last_date:
+            self._write_csv_index(path, last_date)
+        return last_date
+
+    def _write_csv_index(self, path: str, last_date: str) -> None:
+        with open(self._csv_index_file(path), 'w', encoding='utf-8') as f:
+            json.dump({"last_date": last_date}, f)
+
+    @staticmethod
+    def read_csv_history(path: str) -> pd.DataFrame:
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        df = pd.read_csv(path)
+        df = df.drop_duplicates(subset="date", keep="last")
+        return df.sort_values("date", ascending=False).reset_index(drop=True)
+
     def save_historical_data(self, data: Dict[str, Any]) -> bool:
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
+            last_updated = data.get("last_updated", int(time.time()))
+            for name, store in self.stores.items():
+                columns = self._records_to_columns(name, data.get(name) or [])
+                added = store.append(**columns)
+                dropped = store.trim(self.retention_days) if self.retention_days else 0
+                store.save_metadata(last_updated=last_updated, day_keyed=True)
+                logger.info(f"Stored {added} new rows for {name} ({len(store)} total, {dropped} past retention dropped)")
+
+            if self.json_export:
+                with open(self.data_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2)
             return True
         except Exception as e:
+            logger.error(f"Failed to save historical data: {str(e)}")
             return False
 
+    @staticmethod
+    def _real_records(records: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        # Drops the simulated rows a collector returns when its fetch fails
+        return [item for item in records or [] if not item.get("mock")]
+
+    @staticmethod
+    def _day_key(date: str, scale: int) -> int:
+        # Local midnight of the date, the same calendar the collectors derive dates with
+        return int(datetime.strptime(date, '%Y-%m-%d').timestamp()) * scale
+
+    def _records_to_columns(self, name: str, records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        # Rows are keyed by day rather than by the raw timestamp, which for AHR999 falls during the
+        # day, so a later reading for a date replaces the earlier one instead of adding a row.
+        # Sorted oldest first because the store keeps the last of several rows with one key.
+        scale = SERIES_SPECS[name]["timestamp_scale"]
+        records = sorted((item for item in self._real_records(records) if "timestamp" in item),
+                         key=lambda item: int(item["timestamp"]))
+        columns = {"timestamps": np.array([
+            self._day_key(item.get("date") or datetime.fromtimestamp(int(item["timestamp"]) / scale).strftime('%Y-%m-%d'), scale)
+            for item in records
+        ], dtype=np.int64)}
+        if name == "fear_greed":
+            columns["value"] = np.array([item.get("value", np.nan) for item in records], dtype=np.float64)
+            columns["classification"] = np.array(
+                [FNG_CLASSES.index(item.get("value_classification")) if item.get("value_classification") in FNG_CLASSES else -1
+                 for item in records],
+                dtype=np.float64
+            )
+        else:
+            column = SERIES_SPECS[name]["columns"][0]
+            columns[column] = np.array([item.get(column, np.nan) for item in records], dtype=np.float64)
+        return columns
+
+    def _rekey_by_day(self, name: str, store: TimeSeriesStore) -> None:
+        # Stores written before rows were keyed by day can hold several intraday rows for one date
+        scale = SERIES_SPECS[name]["timestamp_scale"]
+        columns = store.read_all()
+        timestamps = columns.pop("timestamp")
+        keys = [self._day_key(datetime.fromtimestamp(int(ts) / scale).strftime('%Y-%m-%d'), scale) for ts in timestamps]
+        kept = store.replace(keys, **columns)
+        store.save_metadata(day_keyed=True)
+        logger.info(f"Re-keyed {name} by day: {len(timestamps)} rows -> {kept}")
+
+    def _columns_to_records(self, name: str, columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+        scale = SERIES_SPECS[name]["timestamp_scale"]
+        records = []
+        # Newest first, matching what the collectors return
+        for i in range(len(columns["timestamp"]) - 1, -1, -1):
+            timestamp = int(columns["timestamp"][i])
+            record = {
+                "timestamp": timestamp,
+                "date": datetime.fromtimestamp(timestamp / scale).strftime('%Y-%m-%d')
+            }
+            if name == "fear_greed":
+                code = int(columns["classification"][i])
+                record["value"] = int(columns["value"][i])
+                record["value_classification"] = FNG_CLASSES[code] if code >= 0 else "Unknown"
+            else:
+                column = SERIES_SPECS[name]["columns"][0]
+                record[column] = float(columns[column][i])
+            records.append(record)
+        return records
+
+    def read_series(self, name: str, start: Optional[int] = None, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._columns_to_records(name, self.stores[name].read_range(start, end))
+
+    def read_latest(self, name: str, n: int) -> List[Dict[str, Any]]:
+        return self._columns_to_records(name, self.stores[name].latest(n))
+
     def load_historical_data(self) -> Optional[Dict[str, Any]]:
+        # The store keeps up to retention_days; callers get the same window the JSON file used to hold
+        if all(len(store) > 0 for store in self.stores.values()):
+            try:
+                data = {
+                    name: self._columns_to_records(name, store.latest(self.load_days) if self.load_days else store.read_all())
+                    for name, store in self.stores.items()
+                }
+                data["last_updated"] = self.stores["btc_price"].metadata.get("last_updated", 0)
+                return data
+            except Exception as e:
+                logger.error(f"Failed to load historical data from the store: {str(e)}")
+
         try:
             if os.path.exists(self.data_file):
                 with open(self.data_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
+                # One-off migration of the legacy JSON history into the store
+                for name, store in self.stores.items():
+                    if len(store) == 0 and data.get(name):
+                        store.append(**self._records_to_columns(name, data[name]))
+                        store.save_metadata(last_updated=data.get("last_updated", 0), day_keyed=True)
                 return data
             else:
                 return None
@@ -152,3 +403,85 @@ class HistoricalDataCollector:
             return self.merge_historical_data(old_data, new_data)
         else:
             return old_data
+
+
+async def benchmark_refresh_cycles(cycles: int = 5, days: int = 180) -> List[Dict[str, Any]]:
+    # Refresh cycles against a local aiohttp stub of the three APIs, with a one-off session per
+    # request (the collectors' fallback) and with the shared pool. Every cycle re-fetches all
+    # three series; "connections" counts the TCP connections the stub accepted.
+    import socket
+    import tempfile
+    from aiohttp import web
+    from config import RESILIENCE
+
+    now = int(time.time())
+    connections = set()
+
+    def respond(request, payload):
+        connections.add(request.transport.get_extra_info('peername'))
+        return web.json_response(payload)
+
+    async def klines(request):
+        return respond(request, [[(now - i * 86400) * 1000, 0, 0, 0, 30000.0 + i] for i in range(days)])
+
+    async def ahr999(request):
+        return respond(request, {"data": [[now - i * 86400, 1.0] for i in range(days)]})
+
+    async def fear_greed(request):
+        return respond(request, {"data": [
+            {"value": "50", "value_classification": "Neutral", "timestamp": str(now - i * 86400)} for i in range(days)
+        ]})
+
+    app = web.Application()
+    app.add_routes([web.get('/klines', klines), web.get('/ahr999', ahr999), web.get('/fng', fear_greed)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    await web.SockSite(runner, sock).start()
+    host = f"127.0.0.1:{sock.getsockname()[1]}"
+    # The stub is not rate limited, so neither is the measurement; the global config is restored afterwards
+    original_hosts = RESILIENCE['hosts']
+    RESILIENCE['hosts'] = {**original_hosts, host: {'rate': 1e6, 'burst': 10 ** 6}}
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            for pooled in (False, True):
+                connections.clear()
+                collector = HistoricalDataCollector(data_dir=data_dir, csv_dir=data_dir)
+                collector.btc_collector.api_url = f"http://{host}/klines"
+                collector.ahr999_collector.api_url = f"http://{host}/ahr999"
+                collector.fng_collector.api_url = f"http://{host}/fng"
+                if pooled:
+                    await collector.open_session()
+                timings = []
+                try:
+                    for _ in range(cycles):
+                        started = time.perf_counter()
+                        await asyncio.gather(
+                            collector.btc_collector.get_price_history(days, max_age=0),
+                            collector.ahr999_collector.get_ahr999_history(days, max_age=0),
+                            collector.fng_collector.get_fear_greed_history(days, max_age=0)
+                        )
+                        timings.append(time.perf_counter() - started)
+                finally:
+                    await collector.close_session()
+                results.append({
+                    "session": "shared pool" if pooled else "one per request",
+                    "cycles": cycles,
+                    "connections": len(connections),
+                    "first_cycle_ms": round(timings[0] * 1000, 2),
+                    "later_cycles_ms": round(float(np.mean(timings[1:] or timings)) * 1000, 2),
+                })
+    finally:
+        RESILIENCE['hosts'] = original_hosts
+        await runner.cleanup()
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for result in asyncio.run(benchmark_refresh_cycles()):
+        print(result)
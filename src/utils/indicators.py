@@ -0,0 +1,272 @@
+import time
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Dict, Any, List, Optional, Sequence
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# All functions take values in chronological order (oldest first) and return an
+# array of the same length, with NaN where the window is not yet filled.
+
+
+def _as_float_array(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def sma(values, window: int) -> np.ndarray:
+    values = _as_float_array(values)
+    result = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return result
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def rolling_std(values, window: int) -> np.ndarray:
+    # Population standard deviation, same as np.std on each window
+    values = _as_float_array(values)
+    result = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return result
+    result[window - 1:] = sliding_window_view(values, window).std(axis=1)
+    return result
+
+
+def volatility(values, window: int) -> np.ndarray:
+    # Standard deviation as a percentage of the mean over the window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return rolling_std(values, window) / sma(values, window) * 100
+
+
+def _exponential_filter(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    # y[i] = alpha * x[i] + (1 - alpha) * y[i - 1], with y[-1] = initial
+    if len(values) == 0:
+        return values.copy()
+    if lfilter is not None:
+        zi = np.array([(1 - alpha) * initial])
+        result, _ = lfilter([alpha], [1, -(1 - alpha)], values, zi=zi)
+        return result
+    result = np.empty_like(values)
+    previous = initial
+    for i, value in enumerate(values):
+        previous = alpha * value + (1 - alpha) * previous
+        result[i] = previous
+    return result
+
+
+def ema(values, span: Optional[int] = None, alpha: Optional[float] = None) -> np.ndarray:
+    # Exponential moving average seeded with the first value
+    values = _as_float_array(values)
+    if alpha is None:
+        alpha = 2.0 / (span + 1)
+    if len(values) == 0:
+        return values.copy()
+    return _exponential_filter(values, alpha, values[0])
+
+
+def wilder_average(values, window: int) -> np.ndarray:
+    # Wilder smoothing: seeded with the simple mean of the first ``window`` values,
+    # then avg[i] = avg[i - 1] + (x[i] - avg[i - 1]) / window
+    values = _as_float_array(values)
+    result = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return result
+    seed = values[:window].mean()
+    result[window - 1] = seed
+    result[window:] = _exponential_filter(values[window:], 1.0 / window, seed)
+    return result
+
+
+def rsi(values, window: int = 14) -> np.ndarray:
+    # Wilder's RSI over the whole series; the first value is at index ``window``
+    values = _as_float_array(values)
+    result = np.full(len(values), np.nan)
+    if len(values) < window + 1:
+        return result
+    deltas = np.diff(values)
+    avg_gain = wilder_average(np.where(deltas > 0, deltas, 0.0), window)
+    avg_loss = wilder_average(np.where(deltas < 0, -deltas, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        result[1:] = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + rs))
+    result[:window] = np.nan
+    return result
+
+
+def shift(values, lag: int) -> np.ndarray:
+    values = _as_float_array(values)
+    result = np.full(len(values), np.nan)
+    if 0 < lag < len(values):
+        result[lag:] = values[:-lag]
+    elif lag == 0:
+        result[:] = values
+    return result
+
+
+def rate_of_change(values, lag: int) -> np.ndarray:
+    # Percent change against the value ``lag`` points earlier
+    values = _as_float_array(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values / shift(values, lag) - 1) * 100
+
+
+def difference(values, lag: int) -> np.ndarray:
+    values = _as_float_array(values)
+    return values - shift(values, lag)
+
+
+def rolling_extrema(values, window: int):
+    # Trailing min/max over up to ``window`` points (shorter at the start)
+    values = _as_float_array(values)
+    if len(values) == 0:
+        return values.copy(), values.copy()
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = sliding_window_view(padded, window)
+    return np.nanmin(windows, axis=1), np.nanmax(windows, axis=1)
+
+
+def rolling_percentile(values, window: int) -> np.ndarray:
+    # Position of each value inside its trailing min-max range (0-100), 50 when flat
+    values = _as_float_array(values)
+    low, high = rolling_extrema(values, window)
+    span = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.where(span > 0, (values - low) / span * 100, 50.0)
+    return result
+
+
+class IndicatorEngine:
+
+    def __init__(self, timestamps, values, dates: Sequence[str] = None, records: List[Dict[str, Any]] = None,
+                 sma_windows=(7, 30, 90), ema_spans=(12, 26), volatility_windows=(7, 30),
+                 rsi_windows=(14,), change_lags=None, percentile_window: int = 180):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        order = np.argsort(timestamps, kind='stable')
+
+        self.timestamps = timestamps[order]
+        self.values = _as_float_array(values)[order]
+        self.dates = np.asarray(dates if dates is not None else [""] * len(order), dtype=object)[order]
+        self.records = [records[i] for i in order] if records is not None else None
+
+        # "7d change" compares with the value 6 rows back, i.e. a 7-day window including today
+        self.change_lags = change_lags or {"1d": 1, "7d": 6, "30d": 29}
+        self.percentile_window = percentile_window
+        self._date_index = None
+
+        self.series: Dict[str, np.ndarray] = {}
+        for window in sma_windows:
+            self.series[f"sma_{window}"] = sma(self.values, window)
+        for span in ema_spans:
+            self.series[f"ema_{span}"] = ema(self.values, span)
+        for window in volatility_windows:
+            self.series[f"volatility_{window}"] = volatility(self.values, window)
+        for window in rsi_windows:
+            self.series[f"rsi_{window}"] = rsi(self.values, window)
+        for label, lag in self.change_lags.items():
+            self.series[f"change_{label}"] = rate_of_change(self.values, lag)
+            self.series[f"diff_{label}"] = difference(self.values, lag)
+        low, high = rolling_extrema(self.values, percentile_window)
+        self.series["rolling_min"] = low
+        self.series["rolling_max"] = high
+        self.series["percentile"] = rolling_percentile(self.values, percentile_window)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], value_key: str, **kwargs) -> "IndicatorEngine":
+        records = [item for item in records or [] if value_key in item and item.get(value_key) is not None]
+        return cls(
+            [int(item.get("timestamp", 0)) for item in records],
+            [item[value_key] for item in records],
+            dates=[item.get("date", "") for item in records],
+            records=records,
+            **kwargs
+        )
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def add_series(self, name: str, values: np.ndarray) -> None:
+        self.series[name] = values
+
+    def latest(self, name: str, default=None):
+        return self.value_at(name, len(self.values) - 1, default)
+
+    def value_at(self, name: str, index: int, default=None):
+        array = self.values if name == "value" else self.series[name]
+        if len(array) == 0:
+            return default
+        value = array[index]
+        return default if np.isnan(value) else float(value)
+
+    def index_of(self, date: str) -> Optional[int]:
+        if self._date_index is None:
+            self._date_index = {date: i for i, date in enumerate(self.dates)}
+        return self._date_index.get(date)
+
+    def at(self, name: str, date: str, default=None):
+        index = self.index_of(date)
+        if index is None:
+            return default
+        return self.value_at(name, index, default)
+
+
+def rsi_reference(values, window: int = 14) -> List[float]:
+    # Plain per-day Wilder RSI loop, the reference rsi() is checked against
+    values = [float(value) for value in values]
+    result = [float('nan')] * len(values)
+    if len(values) < window + 1:
+        return result
+    gains = [max(b - a, 0.0) for a, b in zip(values, values[1:])]
+    losses = [max(a - b, 0.0) for a, b in zip(values, values[1:])]
+    avg_gain = sum(gains[:window]) / window
+    avg_loss = sum(losses[:window]) / window
+    for i in range(window, len(values)):
+        if i > window:
+            avg_gain = (avg_gain * (window - 1) + gains[i - 1]) / window
+            avg_loss = (avg_loss * (window - 1) + losses[i - 1]) / window
+        result[i] = 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+    return result
+
+
+def benchmark_rsi(sizes=(1_000, 10_000, 100_000), window: int = 14, repeat: int = 5) -> List[Dict[str, Any]]:
+    # rsi() against the reference loop on a random walk: best-of-``repeat`` timings and the largest difference
+    rng = np.random.default_rng(42)
+    results = []
+    for size in sizes:
+        prices = 30000 * np.exp(np.cumsum(rng.normal(0, 0.03, size)))
+        timings = {}
+        for name, func in (("vectorized", rsi), ("loop", rsi_reference)):
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                output = func(prices, window)
+                best = min(best, time.perf_counter() - started)
+            timings[name] = (best, np.asarray(output, dtype=np.float64))
+        expected, actual = timings["loop"][1], timings["vectorized"][1]
+        results.append({
+            "points": size,
+            "backend": "lfilter" if lfilter is not None else "numpy loop",
+            "vectorized_ms": round(timings["vectorized"][0] * 1000, 3),
+            "loop_ms": round(timings["loop"][0] * 1000, 3),
+            "speedup": round(timings["loop"][0] / timings["vectorized"][0], 1),
+            "same_nans": bool(np.array_equal(np.isnan(expected), np.isnan(actual))),
+            "max_abs_diff": float(np.nanmax(np.abs(expected - actual))),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    results = benchmark_rsi()
+    for result in results:
+        print(result)
+    if not all(result["same_nans"] and result["max_abs_diff"] < 1e-9 for result in results):
+        raise SystemExit("rsi() does not match the reference loop")
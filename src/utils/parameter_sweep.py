@@ -0,0 +1,131 @@
+import os
+import itertools
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional
+
+from utils.backtester import Backtester
+from utils.trend_analyzer import TrendAnalyzer, DEFAULT_ADVICE_PARAMS, FEAR_GREED_MOODS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Rows of the shared history block; Fear & Greed classes are stored as codes into FEAR_GREED_MOODS
+HISTORY_ROWS = ("day", "price", "ahr999", "fear_greed", "fear_greed_class")
+
+BACKTEST_PARAMS = ("budget", "warmup_days", "hit_horizon_days")
+
+RESULT_COLUMNS = ("return_pct", "max_drawdown_pct", "hit_rate", "trade_count", "final_equity")
+
+# Per-worker view of the shared history, set up once by _init_worker
+_worker_state: Dict[str, Any] = {}
+
+
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def _pack_history(history: Dict[str, Any]) -> np.ndarray:
+    count = len(history["prices"])
+    packed = np.full((len(HISTORY_ROWS), count), np.nan)
+    packed[0] = np.asarray(history["dates"], dtype='datetime64[D]').astype(np.int64)
+    packed[1] = history["prices"]
+    if history.get("ahr999") is not None:
+        packed[2] = history["ahr999"]
+    if history.get("fear_greed") is not None:
+        packed[3] = history["fear_greed"]
+    if history.get("fear_greed_class") is not None:
+        packed[4] = [FEAR_GREED_MOODS.index(c) if c in FEAR_GREED_MOODS else -1 for c in history["fear_greed_class"]]
+    return packed
+
+
+def _unpack_history(packed: np.ndarray) -> Dict[str, Any]:
+    codes = packed[4]
+    moods = np.array(FEAR_GREED_MOODS + ("",), dtype=object)
+    return {
+        "dates": packed[0].astype(np.int64).astype('datetime64[D]').astype(str),
+        "prices": packed[1],
+        "ahr999": packed[2],
+        "fear_greed": packed[3],
+        "fear_greed_class": moods[np.where(np.isnan(codes), -1, codes).astype(int)],
+    }
+
+
+def _init_worker(shm_name: str, shape) -> None:
+    shm = shared_memory.SharedMemory(name=shm_name)
+    packed = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker_state["shm"] = shm
+    _worker_state["history"] = _unpack_history(packed)
+
+
+def _evaluate(params: Dict[str, Any]) -> Dict[str, Any]:
+    return evaluate_params(_worker_state["history"], params)
+
+
+def evaluate_params(history: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    analyzer_params = {key: value for key, value in params.items() if key in DEFAULT_ADVICE_PARAMS}
+    backtest_params = {key: value for key, value in params.items() if key in BACKTEST_PARAMS}
+    backtester = Backtester(TrendAnalyzer(params=analyzer_params), **backtest_params)
+
+    result = backtester.run(**history)
+    row = dict(params)
+    if result["status"] != "success":
+        row.update({column: None for column in RESULT_COLUMNS})
+        row["error"] = result.get("message")
+        return row
+    row.update({column: result[column] for column in RESULT_COLUMNS})
+    return row
+
+
+class ParameterSweep:
+
+    def __init__(self, history: Dict[str, Any] = None, csv_dir: str = "csv", max_workers: Optional[int] = None,
+                 rank_by: str = "return_pct", ascending: bool = False, chunksize: int = 16):
+        self.history = history if history is not None else Backtester.load_csv_history(csv_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.rank_by = rank_by
+        self.ascending = ascending
+        self.chunksize = chunksize
+
+    def run(self, grid: Dict[str, List[Any]]) -> pd.DataFrame:
+        combinations = expand_grid(grid)
+        unknown = set(grid) - set(DEFAULT_ADVICE_PARAMS) - set(BACKTEST_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+        if not self.history:
+            raise ValueError("No history available for the parameter sweep")
+
+        logger.info(f"Sweeping {len(combinations)} parameter combinations on {self.max_workers} worker(s)")
+
+        if self.max_workers == 1:
+            history = _unpack_history(_pack_history(self.history))
+            rows = [evaluate_params(history, params) for params in combinations]
+        else:
+            rows = self._run_pool(combinations)
+
+        return self.rank(rows)
+
+    def _run_pool(self, combinations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        packed = _pack_history(self.history)
+        shm = shared_memory.SharedMemory(create=True, size=packed.nbytes)
+        try:
+            # Workers attach to this block once instead of receiving the arrays with every task
+            np.ndarray(packed.shape, dtype=packed.dtype, buffer=shm.buf)[:] = packed
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, packed.shape)) as executor:
+                return list(executor.map(_evaluate, combinations, chunksize=self.chunksize))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def rank(self, rows: List[Dict[str, Any]]) -> pd.DataFrame:
+        table = pd.DataFrame(rows)
+        if table.empty:
+            return table
+        table = table.sort_values(self.rank_by, ascending=self.ascending, na_position='last').reset_index(drop=True)
+        table.insert(0, "rank", range(1, len(table) + 1))
+        return table
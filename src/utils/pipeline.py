@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import pickle
+import asyncio
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+
+    def __init__(self, name: str, func: Callable, inputs: Iterable[str] = (), outputs: Iterable[str] = (),
+                 fingerprint: Optional[Callable[[Dict[str, Any]], Any]] = None, always: bool = False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.fingerprint = fingerprint
+        # Stages without inputs read the outside world, so they can never be skipped
+        self.always = always or not self.inputs
+
+
+class Pipeline:
+    # Stages declare the values they consume and produce; each stage starts as soon as its inputs
+    # exist, so independent branches run concurrently and values are handed over in memory.
+    # A stage receives its inputs as keyword arguments and returns its single output, or a dict
+    # for several. Plain functions run in a worker thread so they do not block the other branches.
+    # With only_changed, a stage whose inputs hash the same as on its last successful run is
+    # skipped and its outputs are loaded from state_dir instead.
+
+    def __init__(self, state_dir: Optional[str] = None):
+        self.state_dir = state_dir
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, float] = {}
+        self.status: Dict[str, str] = {}
+
+    def add_stage(self, name: str, func: Callable, inputs: Iterable[str] = (), outputs: Iterable[str] = (),
+                  fingerprint: Optional[Callable[[Dict[str, Any]], Any]] = None, always: bool = False) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        stage = Stage(name, func, inputs, outputs, fingerprint, always)
+        self.stages[name] = stage
+        return stage
+
+    def _producers(self, initial: Dict[str, Any]) -> Dict[str, str]:
+        producers = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers or output in initial:
+                    raise ValueError(f"Value {output} is produced more than once")
+                producers[output] = stage.name
+        for stage in self.stages.values():
+            for name in stage.inputs:
+                if name not in producers and name not in initial:
+                    raise ValueError(f"Stage {stage.name} needs {name}, which no stage produces")
+        return producers
+
+    def _order(self, producers: Dict[str, str]) -> List[Stage]:
+        order, done, visiting = [], set(), set()
+
+        def visit(stage: Stage) -> None:
+            if stage.name in done:
+                return
+            if stage.name in visiting:
+                raise ValueError(f"Stage {stage.name} is part of a dependency cycle")
+            visiting.add(stage.name)
+            for name in stage.inputs:
+                if name in producers:
+                    visit(self.stages[producers[name]])
+            visiting.discard(stage.name)
+            done.add(stage.name)
+            order.append(stage)
+
+        for stage in self.stages.values():
+            visit(stage)
+        return order
+
+    async def run(self, initial: Dict[str, Any] = None, only_changed: bool = False) -> Dict[str, Any]:
+        values = dict(initial or {})
+        producers = self._producers(values)
+        self.timings.clear()
+        self.status.clear()
+
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self._order(producers):
+            upstream = [tasks[producers[name]] for name in stage.inputs if name in producers]
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, upstream, values, only_changed))
+        await asyncio.gather(*tasks.values())
+
+        for name, status in self.status.items():
+            timing = f" in {self.timings[name]:.2f}s" if name in self.timings else ""
+            logger.info(f"Stage {name}: {status}{timing}")
+        return values
+
+    async def _run_stage(self, stage: Stage, upstream: List[asyncio.Task], values: Dict[str, Any],
+                         only_changed: bool) -> None:
+        if upstream:
+            await asyncio.gather(*upstream)
+        missing = [name for name in stage.inputs if name not in values]
+        if missing:
+            self.status[stage.name] = f"blocked (missing {', '.join(missing)})"
+            return
+
+        inputs = {name: values[name] for name in stage.inputs}
+        fingerprint = None
+        if only_changed and not stage.always:
+            fingerprint = self._fingerprint(stage, inputs)
+            cached = self._load_state(stage, fingerprint)
+            if cached is not None:
+                values.update(cached)
+                self.status[stage.name] = "skipped (inputs unchanged)"
+                return
+
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(stage.func):
+                result = await stage.func(**inputs)
+            else:
+                result = await asyncio.to_thread(stage.func, **inputs)
+        except Exception as e:
+            self.timings[stage.name] = time.perf_counter() - started
+            self.status[stage.name] = f"failed ({str(e)})"
+            logger.error(f"Stage {stage.name} failed: {str(e)}")
+            import traceback
+            logger.debug(traceback.format_exc())
+            return
+        self.timings[stage.name] = time.perf_counter() - started
+
+        outputs = self._outputs(stage, result)
+        values.update(outputs)
+        self.status[stage.name] = "ran"
+        if self.state_dir and not stage.always:
+            self._save_state(stage, fingerprint or self._fingerprint(stage, inputs), outputs)
+
+    @staticmethod
+    def _outputs(stage: Stage, result: Any) -> Dict[str, Any]:
+        if not stage.outputs:
+            return {}
+        if len(stage.outputs) == 1:
+            return {stage.outputs[0]: result}
+        return {name: result[name] for name in stage.outputs}
+
+    @staticmethod
+    def _fingerprint(stage: Stage, inputs: Dict[str, Any]) -> str:
+        data = stage.fingerprint(inputs) if stage.fingerprint else inputs
+        encoded = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def _state_path(self, stage: Stage) -> str:
+        return os.path.join(self.state_dir, f"{stage.name}.pkl")
+
+    def _load_state(self, stage: Stage, fingerprint: str) -> Optional[Dict[str, Any]]:
+        if not self.state_dir:
+            return None
+        try:
+            with open(self._state_path(stage), 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+        if state.get("fingerprint") != fingerprint:
+            return None
+        return state.get("outputs", {})
+
+    def _save_state(self, stage: Stage, fingerprint: str, outputs: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            path = self._state_path(stage)
+            with open(path + ".tmp", 'wb') as f:
+                pickle.dump({"fingerprint": fingerprint, "outputs": outputs}, f)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            logger.warning(f"Could not save the state of stage {stage.name}: {str(e)}")
@@ -0,0 +1,195 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import RESILIENCE
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean "the endpoint is struggling, back off and count it against the breaker"
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open, next probe in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class RetryableError(Exception):
+    # Raised by request attempts for failures worth retrying (429, 5xx, timeouts, dropped connections)
+
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    # Reservation-based bucket: callers take a token (possibly a future one) and sleep until it is due,
+    # so no lock is needed inside a single event loop. The rate halves on 429 and creeps back on success.
+
+    def __init__(self, rate: float, burst: int, min_rate: float = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    async def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def throttle(self) -> None:
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class CircuitBreaker:
+    # Opens after ``failure_threshold`` consecutive failures, then lets a single probe through
+    # every ``recovery_timeout`` seconds until one succeeds
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+
+    def before_call(self, host: str) -> None:
+        if self.state == "closed":
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if elapsed >= self.recovery_timeout:
+            # A probe that never reports back (e.g. cancelled) frees the slot after another timeout
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            logger.info(f"Probing {host} after {elapsed:.0f}s with the circuit open")
+            return
+        raise CircuitOpenError(host, max(self.recovery_timeout - elapsed, 0.0))
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self, host: str) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Opening the circuit for {host} after {self.failures} failure(s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class HostGuard:
+
+    def __init__(self, host: str, rate: float, burst: int, failure_threshold: int, recovery_timeout: float,
+                 max_retry_after: float):
+        self.host = host
+        self.limiter = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.max_retry_after = max_retry_after
+
+    async def before_request(self) -> None:
+        self.breaker.before_call(self.host)
+        await self.limiter.acquire()
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+        self.limiter.recover()
+
+    def record_failure(self, status: int = None, retry_after: float = None) -> None:
+        self.breaker.record_failure(self.host)
+        if status == 429:
+            self.limiter.throttle()
+        if retry_after:
+            self.limiter.pause(min(retry_after, self.max_retry_after))
+
+
+_guards: Dict[str, HostGuard] = {}
+
+
+def get_host_guard(url: str) -> HostGuard:
+    host = urlparse(url).netloc or url
+    if host not in _guards:
+        settings = {**RESILIENCE['default'], **RESILIENCE['hosts'].get(host, {})}
+        _guards[host] = HostGuard(host, **settings)
+    return _guards[host]
+
+
+def reset_host_guards() -> None:
+    _guards.clear()
+
+
+async def call_with_retries(url: str, attempt: Callable[[], Awaitable[Any]], max_retries: int = 2,
+                            retry_delay: float = 2.0, description: str = "request") -> Any:
+    # Runs ``attempt`` under the host's rate limit and circuit breaker. ``attempt`` returns the
+    # result (None for a definitive failure) or raises RetryableError; timeouts and aiohttp errors
+    # count as retryable too. Raises CircuitOpenError instead of waiting on an endpoint that keeps failing.
+    guard = get_host_guard(url)
+    error = None
+    for attempt_number in range(1, max_retries + 1):
+        await guard.before_request()
+        try:
+            try:
+                result = await attempt()
+            except asyncio.TimeoutError:
+                raise RetryableError("request timed out")
+            except aiohttp.ClientError as e:
+                raise RetryableError(str(e) or type(e).__name__)
+        except RetryableError as e:
+            guard.record_failure(e.status, e.retry_after)
+            error = e
+            logger.warning(f"{description} to {guard.host} failed ({e}), attempt {attempt_number}/{max_retries}")
+            if attempt_number < max_retries:
+                # A Retry-After pause is already held by the host's limiter, so the next acquire waits for it
+                wait_time = retry_delay * (2 ** attempt_number)
+                logger.info(f"Wait {wait_time} seconds before trying again...")
+                await asyncio.sleep(wait_time)
+            continue
+        # None is a definite failure such as a 4xx: it neither resets the breaker nor raises the rate
+        if result is not None:
+            guard.record_success()
+        return result
+
+    logger.error(f"The maximum number of retries has been reached for {description} to {guard.host}: {error}")
+    return None
@@ -0,0 +1,128 @@
+import time
+import random
+import signal
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob:
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], interval: float, jitter: float = 0.0,
+                 run_on_start: bool = True):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration: Optional[float] = None
+        now = time.monotonic()
+        # Jitter on the first run too, so jobs sharing an interval do not all fire together
+        self.next_run = now + random.uniform(0, jitter) + (0 if run_on_start else interval)
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def schedule_next(self, now: float) -> None:
+        self.next_run = now + self.interval + random.uniform(0, self.jitter)
+
+
+class Scheduler:
+    # Runs async jobs on fixed intervals inside one event loop. A job that is still running when it
+    # comes due again is skipped rather than started twice. stop() (or SIGTERM/SIGINT once the
+    # handlers are installed) lets running jobs finish for up to shutdown_timeout seconds.
+
+    def __init__(self, shutdown_timeout: float = 60):
+        self.shutdown_timeout = shutdown_timeout
+        self.jobs: List[ScheduledJob] = []
+        self._stop: Optional[asyncio.Event] = None
+
+    def add_job(self, name: str, func: Callable[[], Awaitable[Any]], interval: float, jitter: float = 0.0,
+                run_on_start: bool = True) -> ScheduledJob:
+        job = ScheduledJob(name, func, interval, jitter, run_on_start)
+        self.jobs.append(job)
+        logger.info(f"Scheduled {name} every {interval}s (jitter up to {jitter}s)")
+        return job
+
+    def stop(self) -> None:
+        if self._stop is not None and not self._stop.is_set():
+            logger.info("Stop requested, waiting for running jobs to finish")
+            self._stop.set()
+
+    def install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows event loops have no signal handlers; Ctrl+C still raises KeyboardInterrupt
+                pass
+
+    async def run(self) -> None:
+        self._stop = asyncio.Event()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if now < job.next_run:
+                    continue
+                if job.running:
+                    job.skipped += 1
+                    logger.warning(f"Skipping {job.name}: the previous run is still in progress")
+                else:
+                    job.task = asyncio.create_task(self._run_job(job), name=f"job-{job.name}")
+                job.schedule_next(now)
+
+            if not self.jobs:
+                await self._stop.wait()
+                break
+            wait = max(min(job.next_run for job in self.jobs) - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._stop.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+        await self._shutdown()
+
+    async def _run_job(self, job: ScheduledJob) -> None:
+        started = time.monotonic()
+        logger.info(f"Running {job.name}")
+        try:
+            await job.func()
+            job.runs += 1
+        except Exception as e:
+            job.failures += 1
+            logger.error(f"Job {job.name} failed: {str(e)}")
+            import traceback
+            logger.debug(traceback.format_exc())
+        finally:
+            job.last_duration = time.monotonic() - started
+            logger.info(f"{job.name} finished in {job.last_duration:.1f}s")
+
+    async def _shutdown(self) -> None:
+        running = [job.task for job in self.jobs if job.running]
+        if running:
+            done, pending = await asyncio.wait(running, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} job(s) still running after {self.shutdown_timeout}s")
+                await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("Scheduler stopped")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            job.name: {
+                "runs": job.runs,
+                "failures": job.failures,
+                "skipped": job.skipped,
+                "running": job.running,
+                "last_duration": job.last_duration,
+            }
+            for job in self.jobs
+        }
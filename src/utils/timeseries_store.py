@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from typing import Dict, Any, List, Optional, Sequence
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Fear & Greed classifications are stored as codes into this tuple (-1 when unknown)
+FNG_CLASSES = ("Extreme Fear", "Fear", "Neutral", "Greed", "Extreme Greed")
+
+TIMESTAMP_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+
+
+class TimeSeriesStore:
+    """Columnar store for one daily series.
+
+    Each column lives in its own raw little-endian file (``timestamp.i64`` plus
+    one ``<column>.f64`` per value column), kept sorted by timestamp, so new
+    rows are appended in O(new rows) and reads are plain array slices.
+    """
+
+    def __init__(self, path: str, columns: Sequence[str] = ("value",)):
+        self.path = path
+        self.columns = tuple(columns)
+        self.meta_file = os.path.join(path, "meta.json")
+        os.makedirs(path, exist_ok=True)
+        self.metadata = self._load_metadata()
+
+    def _timestamp_file(self) -> str:
+        return os.path.join(self.path, "timestamp.i64")
+
+    def _column_file(self, column: str) -> str:
+        return os.path.join(self.path, f"{column}.f64")
+
+    def _load_metadata(self) -> Dict[str, Any]:
+        try:
+            if os.path.exists(self.meta_file):
+                with open(self.meta_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load store metadata {self.meta_file}: {str(e)}")
+        return {}
+
+    def save_metadata(self, **values) -> None:
+        self.metadata.update(values)
+        self.metadata["columns"] = list(self.columns)
+        with open(self.meta_file, 'w', encoding='utf-8') as f:
+            json.dump(self.metadata, f)
+
+    def __len__(self) -> int:
+        # Timestamps are written last, so a partially written append is ignored
+        sizes = [self._file_rows(self._timestamp_file(), TIMESTAMP_DTYPE)]
+        sizes += [self._file_rows(self._column_file(column), VALUE_DTYPE) for column in self.columns]
+        return min(sizes)
+
+    @staticmethod
+    def _file_rows(path: str, dtype: np.dtype) -> int:
+        return os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+
+    def _read_column(self, path: str, dtype: np.dtype, start: int, stop: int) -> np.ndarray:
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        return np.fromfile(path, dtype=dtype, count=stop - start, offset=start * dtype.itemsize)
+
+    def timestamps(self) -> np.ndarray:
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE)
+        return np.memmap(self._timestamp_file(), dtype=TIMESTAMP_DTYPE, mode='r', shape=(count,))
+
+    def latest_timestamp(self) -> Optional[int]:
+        count = len(self)
+        if count == 0:
+            return None
+        return int(self._read_column(self._timestamp_file(), TIMESTAMP_DTYPE, count - 1, count)[0])
+
+    def _read_rows(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        result = {"timestamp": self._read_column(self._timestamp_file(), TIMESTAMP_DTYPE, start, stop)}
+        for column in self.columns:
+            result[column] = self._read_column(self._column_file(column), VALUE_DTYPE, start, stop)
+        return result
+
+    def read_all(self) -> Dict[str, np.ndarray]:
+        return self._read_rows(0, len(self))
+
+    def read_range(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        # Both bounds are inclusive timestamps
+        timestamps = self.timestamps()
+        first = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        last = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        return self._read_rows(first, last)
+
+    def latest(self, n: int) -> Dict[str, np.ndarray]:
+        count = len(self)
+        return self._read_rows(max(0, count - n), count)
+
+    def append(self, timestamps, **columns) -> int:
+        missing = set(self.columns) - set(columns)
+        if missing:
+            raise ValueError(f"Missing columns for append: {sorted(missing)}")
+
+        new = self._normalize(timestamps, columns)
+        if len(new["timestamp"]) == 0:
+            return 0
+
+        latest = self.latest_timestamp()
+        if latest is None or new["timestamp"][0] > latest:
+            self._write_tail(new)
+            return len(new["timestamp"])
+
+        stored = self.timestamps()
+        older = new["timestamp"][new["timestamp"] < latest]
+        # stored is sorted, so a binary search per incoming row avoids hashing the whole column
+        positions = np.searchsorted(stored, older)
+        if (stored[np.minimum(positions, len(stored) - 1)] == older).all():
+            # Common case: the incoming window overlaps the stored tail. Rows that
+            # are already stored are skipped, the newest row is refreshed in place
+            # and anything newer is appended.
+            count = len(stored)
+            del stored
+            same = new["timestamp"] == latest
+            if same.any():
+                index = int(np.flatnonzero(same)[-1])
+                self._overwrite_row(count - 1, {key: values[index] for key, values in new.items()})
+            newer = new["timestamp"] > latest
+            self._write_tail({key: values[newer] for key, values in new.items()})
+            return int(newer.sum())
+
+        # Backfill of rows older than the stored tail: merge and rewrite once
+        del stored
+        merged = self.read_all()
+        combined = {key: np.concatenate([merged[key], new[key]]) for key in new}
+        combined = self._normalize(combined.pop("timestamp"), combined)
+        added = len(combined["timestamp"]) - len(merged["timestamp"])
+        self._rewrite(combined)
+        return added
+
+    def replace(self, timestamps, **columns) -> int:
+        # Rewrites the whole series with the given rows, e.g. after re-keying them
+        missing = set(self.columns) - set(columns)
+        if missing:
+            raise ValueError(f"Missing columns for replace: {sorted(missing)}")
+        rows = self._normalize(timestamps, columns)
+        self._rewrite(rows)
+        return len(rows["timestamp"])
+
+    def trim(self, keep: int) -> int:
+        # Keeps the newest ``keep`` rows and returns how many were dropped
+        count = len(self)
+        if count <= keep:
+            return 0
+        self._rewrite(self.latest(keep))
+        return count - keep
+
+    def _normalize(self, timestamps, columns) -> Dict[str, np.ndarray]:
+        timestamps = np.asarray(timestamps, dtype=TIMESTAMP_DTYPE)
+        data = {column: np.asarray(columns[column], dtype=VALUE_DTYPE) for column in self.columns}
+        # Sort and drop duplicate timestamps, keeping the last occurrence
+        order = np.argsort(timestamps, kind='stable')[::-1]
+        _, unique = np.unique(timestamps[order], return_index=True)
+        keep = order[unique]
+        result = {"timestamp": timestamps[keep]}
+        for column, values in data.items():
+            result[column] = values[keep]
+        return result
+
+    def _write_tail(self, rows: Dict[str, np.ndarray]) -> None:
+        if len(rows["timestamp"]) == 0:
+            return
+        # Drop the orphan rows of an interrupted append first, otherwise every column would
+        # be shifted against the timestamps from here on
+        count = len(self)
+        for column in self.columns:
+            self._append_file(self._column_file(column), count, rows[column].astype(VALUE_DTYPE))
+        self._append_file(self._timestamp_file(), count, rows["timestamp"].astype(TIMESTAMP_DTYPE))
+
+    @staticmethod
+    def _append_file(path: str, count: int, values: np.ndarray) -> None:
+        with open(path, 'ab') as f:
+            f.truncate(count * values.dtype.itemsize)
+            values.tofile(f)
+
+    def _overwrite_row(self, index: int, row: Dict[str, Any]) -> None:
+        for column in self.columns:
+            with open(self._column_file(column), 'r+b') as f:
+                f.seek(index * VALUE_DTYPE.itemsize)
+                f.write(np.asarray([row[column]], dtype=VALUE_DTYPE).tobytes())
+
+    def _rewrite(self, rows: Dict[str, np.ndarray]) -> None:
+        for column in self.columns:
+            self._replace_file(self._column_file(column), rows[column].astype(VALUE_DTYPE))
+        self._replace_file(self._timestamp_file(), rows["timestamp"].astype(TIMESTAMP_DTYPE))
+
+    @staticmethod
+    def _replace_file(path: str, values: np.ndarray) -> None:
+        temp_path = path + ".tmp"
+        values.tofile(temp_path)
+        os.replace(temp_path, path)
+
+
+def benchmark_storage(years_list=(10, 100), repeat: int = 3) -> List[Dict[str, Any]]:
+    # Saving and loading the three daily series as the indent=2 historical_data.json against
+    # the columnar store, on synthetic data; best of ``repeat`` runs, in milliseconds
+    import tempfile
+
+    def best(func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return round(min(timings) * 1000, 2)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for years in years_list:
+            count = 365 * years
+            timestamps = 1262304000 + np.arange(count, dtype=np.int64) * 86400
+            prices = 30000 * np.exp(np.cumsum(np.random.default_rng(years).normal(0, 0.03, count)))
+            dates = [time.strftime('%Y-%m-%d', time.gmtime(int(ts))) for ts in timestamps]
+            history = {
+                "btc_price": [{"timestamp": int(ts) * 1000, "date": date, "price": float(price)}
+                              for ts, date, price in zip(timestamps, dates, prices)],
+                "ahr999": [{"timestamp": int(ts), "date": date, "ahr999": float(price) / 40000}
+                           for ts, date, price in zip(timestamps, dates, prices)],
+                "fear_greed": [{"timestamp": int(ts), "date": date, "value": int(ts) % 100,
+                                "value_classification": FNG_CLASSES[int(ts) % 5]}
+                               for ts, date in zip(timestamps, dates)],
+            }
+            columns = {
+                "btc_price": {"price": prices},
+                "ahr999": {"ahr999": prices / 40000},
+                "fear_greed": {"value": timestamps % 100, "classification": timestamps % 5},
+            }
+            json_file = os.path.join(directory, f"historical_data_{years}.json")
+
+            def save_json():
+                with open(json_file, 'w', encoding='utf-8') as f:
+                    json.dump(history, f, indent=2)
+
+            def load_json():
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    json.load(f)
+
+            def store(name):
+                return TimeSeriesStore(os.path.join(directory, f"store_{years}", name), tuple(columns[name]))
+
+            def save_store():
+                for name, values in columns.items():
+                    series = store(name)
+                    for path in [series._timestamp_file()] + [series._column_file(column) for column in series.columns]:
+                        if os.path.exists(path):
+                            os.remove(path)
+                    series.append(timestamps, **values)
+
+            def load_store():
+                for name in columns:
+                    store(name).read_all()
+
+            def append_day():
+                # A daily run: the newest row refreshed in place plus one new row
+                for name, values in columns.items():
+                    series = store(name)
+                    latest = series.latest_timestamp()
+                    series.append([latest, latest + 86400], **{column: [1.0, 2.0] for column in values})
+
+            results.append({
+                "years": years,
+                "rows_per_series": count,
+                "json_save_ms": best(save_json),
+                "json_load_ms": best(load_json),
+                "json_mb": round(os.path.getsize(json_file) / 1e6, 1),
+                "store_save_ms": best(save_store),
+                "store_load_ms": best(load_store),
+                "store_daily_append_ms": best(append_day),
+                "store_mb": round(sum(
+                    entry.stat().st_size
+                    for name in columns for entry in os.scandir(os.path.join(directory, f"store_{years}", name))
+                ) / 1e6, 1),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    for result in benchmark_storage():
+        print(result)
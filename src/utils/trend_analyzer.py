@@ -4,16 +4,45 @@ import numpy as np
 from datetime import datetime, timedelta
 import logging
 
+from utils.indicators import IndicatorEngine, rsi
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Tunable thresholds of the rule-based advice (see utils.parameter_sweep)
+DEFAULT_ADVICE_PARAMS = {
+    # Upper bounds of: extremely undervalued, undervalued, lower fair value, upper fair value, overvalued
+    "ahr999_bands": (0.45, 0.75, 1.0, 1.25, 1.5),
+    # Upper bounds of: extreme fear, fear, neutral, greed. None keeps the index's own classification
+    "fear_greed_bands": None,
+    "confidence_levels": {"Low": 1, "Medium": 2, "Medium-High": 3, "High": 4},
+    # Minimum combined weight for Medium, Medium-High and High overall confidence
+    "overall_confidence_thresholds": (3, 5, 7),
+}
+
+FEAR_GREED_MOODS = ("Extreme Fear", "Fear", "Neutral", "Greed", "Extreme Greed")
+
 class TrendAnalyzer:
-    def __init__(self, historical_data=None):
+    def __init__(self, historical_data=None, params=None):
         self.historical_data = historical_data
+        self.params = dict(DEFAULT_ADVICE_PARAMS)
+        self.params.update(params or {})
         self.analysis_period = 180
+        self.rsi_window = 14
+        self._engines = {}
     
     def set_historical_data(self, historical_data):
         self.historical_data = historical_data
+        self._engines = {}
+
+    def get_indicator_engine(self, series_key, value_key):
+        # Full rolling indicator series, computed once per dataset
+        if (series_key, value_key) not in self._engines:
+            records = (self.historical_data or {}).get(series_key) or []
+            self._engines[(series_key, value_key)] = IndicatorEngine.from_records(
+                records, value_key, percentile_window=self.analysis_period, rsi_windows=(self.rsi_window,)
+            )
+        return self._engines[(series_key, value_key)]
     
     def analyze_btc_price_trend(self):
 
@@ -23,54 +52,45 @@ class TrendAnalyzer:
                 "message": "No BTC historical price data available for analysis"
             }
         
-        btc_data = self.historical_data["btc_price"]
+        engine = self.get_indicator_engine("btc_price", "price")
         
-        btc_data = sorted(btc_data, key=lambda x: x.get("timestamp", 0), reverse=True)
-        
-        btc_data = btc_data[:self.analysis_period]
-        
-        if not btc_data:
+        if len(engine) == 0:
             return {
                 "status": "error",
                 "message": "BTC price data is empty"
             }
         
-        prices = [item.get("price", 0) for item in btc_data if "price" in item]
-        dates = [item.get("date", "") for item in btc_data if "date" in item]
-        
-        if len(prices) < 7:
+        if len(engine) < 7:
             return {
                 "status": "error",
-                "message": f"Insufficient BTC price data: only {len(prices)} days available; at least 7 days of data required"
+                "message": f"Insufficient BTC price data: only {len(engine)} days available; at least 7 days of data required"
             }
         
-        current_price = prices[0]
-        avg_7d = np.mean(prices[:7]) if len(prices) >= 7 else None
-        avg_30d = np.mean(prices[:30]) if len(prices) >= 30 else None
-        avg_90d = np.mean(prices[:90]) if len(prices) >= 90 else None
+        # Newest first, limited to the analysis period
+        prices = engine.values[::-1][:self.analysis_period]
         
-        price_change_1d = ((current_price / prices[1]) - 1) * 100 if len(prices) > 1 else 0
-        price_change_7d = ((current_price / prices[6]) - 1) * 100 if len(prices) > 6 else 0
-        price_change_30d = ((current_price / prices[29]) - 1) * 100 if len(prices) > 29 else 0
+        current_price = float(prices[0])
+        avg_7d = engine.latest("sma_7")
+        avg_30d = engine.latest("sma_30")
+        avg_90d = engine.latest("sma_90")
         
-        volatility_7d = (np.std(prices[:7]) / np.mean(prices[:7]) * 100) if len(prices) >= 7 else 0
-        volatility_30d = (np.std(prices[:30]) / np.mean(prices[:30]) * 100) if len(prices) >= 30 else 0
+        price_change_1d = engine.latest("change_1d", 0)
+        price_change_7d = engine.latest("change_7d", 0)
+        price_change_30d = engine.latest("change_30d", 0)
+        
+        volatility_7d = engine.latest("volatility_7", 0)
+        volatility_30d = engine.latest("volatility_30", 0)
         
         trend_7d = "Increase" if price_change_7d > 0 else "Decrease"
         trend_30d = "Increase" if price_change_30d > 0 else "Decrease"
         
-        rsi = self._calculate_rsi(prices, 14) if len(prices) >= 14 else None
-        
-        min_price = min(prices)
-        max_price = max(prices)
-        price_percentile = ((current_price - min_price) / (max_price - min_price) * 100) if max_price > min_price else 50
+        rsi = engine.latest(f"rsi_{self.rsi_window}")
         
-
-        recent_lows = sorted(prices[:30])[:5]
-        recent_highs = sorted(prices[:30], reverse=True)[:5]
+        price_percentile = engine.latest("percentile", 50)
         
-        support_level = sum(recent_lows) / len(recent_lows)
-        resistance_level = sum(recent_highs) / len(recent_highs)
+        recent_prices = np.sort(prices[:30])
+        support_level = float(np.mean(recent_prices[:5]))
+        resistance_level = float(np.mean(recent_prices[-5:]))
         
         return {
             "status": "success",
@@ -89,7 +109,7 @@ class TrendAnalyzer:
             "price_percentile": price_percentile,
             "support_level": support_level,
             "resistance_level": resistance_level,
-            "latest_date": dates[0] if dates else None
+            "latest_date": engine.dates[-1] or None
         }
     
     def analyze_sentiment_trends(self):
@@ -117,55 +137,34 @@ class TrendAnalyzer:
                 "message": "No historical data for the AHR999 index available for analysis"
             }
         
-        ahr_data = self.historical_data["ahr999"]
+        engine = self.get_indicator_engine("ahr999", "ahr999")
         
-        ahr_data = sorted(ahr_data, key=lambda x: x.get("timestamp", 0), reverse=True)
-        
-        ahr_data = ahr_data[:self.analysis_period]
-        
-        if not ahr_data:
+        if len(engine) == 0:
             return {
                 "status": "error",
                 "message": "AHR999 index data is empty"
             }
         
-        ahr_values = [item.get("ahr999", 0) for item in ahr_data if "ahr999" in item]
-        dates = [item.get("date", "") for item in ahr_data if "date" in item]
-        
-        if len(ahr_values) < 7:
+        if len(engine) < 7:
             return {
                 "status": "error",
-                "message": f"Insufficient AHR999 index data: only {len(ahr_values)} days available; at least 7 days of data required"
+                "message": f"Insufficient AHR999 index data: only {len(engine)} days available; at least 7 days of data required"
             }
         
-        current_ahr = ahr_values[0]
-        avg_7d = np.mean(ahr_values[:7]) if len(ahr_values) >= 7 else None
-        avg_30d = np.mean(ahr_values[:30]) if len(ahr_values) >= 30 else None
+        current_ahr = float(engine.values[-1])
+        avg_7d = engine.latest("sma_7")
+        avg_30d = engine.latest("sma_30")
         
-        ahr_change_1d = ((current_ahr / ahr_values[1]) - 1) * 100 if len(ahr_values) > 1 else 0
-        ahr_change_7d = ((current_ahr / ahr_values[6]) - 1) * 100 if len(ahr_values) > 6 else 0
-        ahr_change_30d = ((current_ahr / ahr_values[29]) - 1) * 100 if len(ahr_values) > 29 else 0
+        ahr_change_1d = engine.latest("change_1d", 0)
+        ahr_change_7d = engine.latest("change_7d", 0)
+        ahr_change_30d = engine.latest("change_30d", 0)
         
         trend_7d = "Increase" if ahr_change_7d > 0 else "Decrease"
         trend_30d = "Increase" if ahr_change_30d > 0 else "Decrease"
         
-        min_ahr = min(ahr_values)
-        max_ahr = max(ahr_values)
-        ahr_percentile = ((current_ahr - min_ahr) / (max_ahr - min_ahr) * 100) if max_ahr > min_ahr else 50
-        
-        market_state = "Unknown"
-        if current_ahr < 0.45:
-            market_state = "Extremely undervalued"
-        elif current_ahr < 0.75:
-            market_state = "Undervalued"
-        elif current_ahr < 1.0:
-            market_state = "Lower Bound of Fair Value Range"
-        elif current_ahr < 1.25:
-            market_state = "Upper Bound of Fair Value Range"
-        elif current_ahr < 1.5:
-            market_state = "Overvalued"
-        else:
-            market_state = "Extremely Overvalued"
+        ahr_percentile = engine.latest("percentile", 50)
+        
+        market_state = self._classify_ahr999(current_ahr)
         
         return {
             "status": "success",
@@ -179,9 +178,33 @@ class TrendAnalyzer:
             "trend_30d": trend_30d,
             "percentile": ahr_percentile,
             "market_state": market_state,
-            "latest_date": dates[0] if dates else None
+            "latest_date": engine.dates[-1] or None
         }
     
+    def _classify_ahr999(self, value):
+        extreme_low, low, fair_low, fair_high, high = self.params["ahr999_bands"]
+        if value < extreme_low:
+            return "Extremely Undervalued"
+        elif value < low:
+            return "Undervalued"
+        elif value < fair_low:
+            return "Lower Bound of Fair Value Range"
+        elif value < fair_high:
+            return "Upper Bound of Fair Value Range"
+        elif value < high:
+            return "Overvalued"
+        else:
+            return "Extremely Overvalued"
+    
+    def _classify_fear_greed(self, value, classification=None):
+        bands = self.params["fear_greed_bands"]
+        if bands is None:
+            return classification
+        for mood, upper in zip(FEAR_GREED_MOODS, bands):
+            if value < upper:
+                return mood
+        return FEAR_GREED_MOODS[-1]
+    
     def _analyze_fear_greed(self):
         if not self.historical_data or "fear_greed" not in self.historical_data:
             return {
@@ -189,41 +212,33 @@ class TrendAnalyzer:
                 "message": "No historical data for the Fear & Greed Index available for analysis"
             }
         
-        fg_data = self.historical_data["fear_greed"]
-        
-        fg_data = sorted(fg_data, key=lambda x: x.get("timestamp", 0), reverse=True)
-        
-        fg_data = fg_data[:self.analysis_period]
+        engine = self.get_indicator_engine("fear_greed", "value")
         
-        if not fg_data:
+        if len(engine) == 0:
             return {
                 "status": "error",
                 "message": "Fear & Greed Index data is empty"
             }
         
-        fg_values = [item.get("value", 0) for item in fg_data if "value" in item]
-        fg_classes = [item.get("value_classification", "") for item in fg_data if "value_classification" in item]
-        dates = [item.get("date", "") for item in fg_data if "date" in item]
-        
-        if len(fg_values) < 7:
+        if len(engine) < 7:
             return {
                 "status": "error",
-                "message": f"Insufficient Fear & Greed Index data: only {len(fg_values)} days available; at least 7 days of data required"
+                "message": f"Insufficient Fear & Greed Index data: only {len(engine)} days available; at least 7 days of data required"
             }
         
-        current_fg = fg_values[0]
-        current_class = fg_classes[0] if fg_classes else "未知"
-        avg_7d = np.mean(fg_values[:7]) if len(fg_values) >= 7 else None
-        avg_30d = np.mean(fg_values[:30]) if len(fg_values) >= 30 else None
+        current_fg = int(engine.values[-1])
+        current_class = engine.records[-1].get("value_classification") or "未知"
+        avg_7d = engine.latest("sma_7")
+        avg_30d = engine.latest("sma_30")
         
-        fg_change_1d = current_fg - fg_values[1] if len(fg_values) > 1 else 0
-        fg_change_7d = current_fg - fg_values[6] if len(fg_values) > 6 else 0
-        fg_change_30d = current_fg - fg_values[29] if len(fg_values) > 29 else 0
+        fg_change_1d = engine.latest("diff_1d", 0)
+        fg_change_7d = engine.latest("diff_7d", 0)
+        fg_change_30d = engine.latest("diff_30d", 0)
         
         trend_7d = "Increase" if fg_change_7d > 0 else "Decrease"
         trend_30d = "Increase" if fg_change_30d > 0 else "Decrease"
         
-        market_mood = current_class
+        market_mood = self._classify_fear_greed(current_fg, current_class)
         
         if fg_change_7d > 10:
             mood_change = "Significant improvement in sentiment"
@@ -249,29 +264,17 @@ class TrendAnalyzer:
             "trend_30d": trend_30d,
             "market_mood": market_mood,
             "mood_change": mood_change,
-            "latest_date": dates[0] if dates else None
+            "latest_date": engine.dates[-1] or None
         }
     
     def _calculate_rsi(self, prices, window=14):
+        # ``prices`` is newest first, as elsewhere in the analyzer
         if len(prices) < window + 1:
             return None
         
-        deltas = np.diff(prices[::-1])
-        
-        gains = np.where(deltas > 0, deltas, 0)
-        losses = np.where(deltas < 0, -deltas, 0)
-        
-        avg_gain = np.mean(gains[:window])
-        avg_loss = np.mean(losses[:window])
-
-        if avg_loss == 0:
-            return 100
-        
-        rs = avg_gain / avg_loss
-        
-        rsi = 100 - (100 / (1 + rs))
+        values = rsi(np.asarray(prices, dtype=float)[::-1], window)
         
-        return rsi
+        return None if np.isnan(values[-1]) else float(values[-1])
     
     def generate_investment_advice(self):
         
@@ -436,7 +439,7 @@ class TrendAnalyzer:
 
         actions = []
         reasons = []
-        confidence_levels = {"Low": 1, "Medium": 2, "Medium-High": 3, "High": 4}
+        confidence_levels = self.params["confidence_levels"]
         
         if "price_based" in advice_dict:
             actions.append(advice_dict["price_based"]["action"])
@@ -482,11 +485,12 @@ class TrendAnalyzer:
             final_reason = "Comprehensive analysis:" + "；".join(relevant_reasons)
             
             max_weight = max(action_weights.values())
-            if max_weight >= 7:
+            medium, medium_high, high = self.params["overall_confidence_thresholds"]
+            if max_weight >= high:
                 final_confidence = "High"
-            elif max_weight >= 5:
+            elif max_weight >= medium_high:
                 final_confidence = "Medium-High"
-            elif max_weight >= 3:
+            elif max_weight >= medium:
                 final_confidence = "Medium"
             else:
                 final_confidence = "Low"
@@ -1,82 +1,781 @@
+import os
+import re
+import time
+import sqlite3
 import aiohttp
 import asyncio
-from config import TELEGRAM
+from datetime import datetime
+from config import TELEGRAM, NOTIFY_QUEUE, NOTIFY_DESTINATIONS, WEBHOOK_URL
 
 print(TELEGRAM.get('token'), TELEGRAM.get('chat_id'))
-async def _send_single_message(session, content):
-    url = f"https://api.telegram.org/bot{TELEGRAM.get('token')}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM.get('chat_id'),
-        "text": content
-    }
 
-    try:
-        async with session.post(url, data=payload) as response:
-            if response.status == 200:
-                print(f"Message segment sent successfully! (Length: {len(content)})")
-                return True
-            else:
-                print(f"Message segment failed to send: {response.status}, {await response.text()}")
-                return False
-    except Exception as e:
-        print(f"Error occurred while sending message segment: {str(e)}")
-        return False
+# Telegram's limit for one message, in UTF-16 code units
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Room kept for the "[12/34]" numbering line
+SEGMENT_HEADER_RESERVE = 16
+
+# Preferred cut points, coarsest first: report sections, paragraphs, lines (then words, see _split_words)
+SEGMENT_BOUNDARIES = (
+    re.compile(r'\n(?=[ \t]*(?:【|#{1,6} |={5,}))'),
+    re.compile(r'\n[ \t]*\n'),
+    re.compile(r'\n'),
+)
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    method TEXT NOT NULL DEFAULT 'sendMessage',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, id);
+"""
+
+
+class TelegramOutbox:
+    # Message segments are stored in SQLite before sending and removed once Telegram accepts them,
+    # so anything undelivered (Telegram down, process killed) goes out on the next run.
+    # A single background task sends them in order over one session, pacing each chat adaptively.
+
+    def __init__(self, db_path, token, api_url='https://api.telegram.org', min_interval=0.5, max_interval=10,
+                 max_attempts=8, max_rate_limited=20, retry_delay=2.0, max_retry_delay=300, request_timeout=30,
+                 drain_timeout=120):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(OUTBOX_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        added = {'method': "TEXT NOT NULL DEFAULT 'sendMessage'", 'rate_limited': "INTEGER NOT NULL DEFAULT 0"}
+        for column, definition in added.items():
+            if column not in columns:
+                with self._conn:
+                    self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+        self.base_url = f"{api_url}/bot{token}"
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_attempts = max_attempts
+        self.max_rate_limited = max_rate_limited
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.request_timeout = request_timeout
+        self.drain_timeout = drain_timeout
+        # chat_id -> [current interval, monotonic time of the last send]
+        self._pacing = {}
+        self._loop = None
+        self._session = None
+        self._task = None
+        self._wakeup = None
+        self._changed = None
+
+    def enqueue(self, chat_id, segments, method='sendMessage'):
+        # Returns the ids of the stored segments; with method 'sendDocument' each one is uploaded as a file
+        now = time.time()
+        with self._conn:
+            ids = [
+                self._conn.execute(
+                    "INSERT INTO outbox (chat_id, text, method, created) VALUES (?, ?, ?, ?)",
+                    (str(chat_id), segment, method, now)
+                ).lastrowid
+                for segment in segments
+            ]
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return ids
+
+    def failed_count(self, ids):
+        return self._conn.execute(
+            f"SELECT COUNT(*) FROM outbox WHERE status = 'failed' AND id IN ({','.join('?' * len(ids))})", ids
+        ).fetchone()[0]
+
+    def pending_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def _pending_upto(self, last_id):
+        return self._conn.execute(
+            "SELECT 1 FROM outbox WHERE status = 'pending' AND id <= ? LIMIT 1", (last_id,)
+        ).fetchone() is not None
+
+    def _head(self):
+        return self._conn.execute(
+            "SELECT id, chat_id, text, method, attempts, rate_limited, next_attempt FROM outbox WHERE status = 'pending' "
+            "ORDER BY id LIMIT 1"
+        ).fetchone()
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Event loop objects cannot be shared across asyncio.run() calls
+            self._loop = loop
+            self._session = None
+            self._task = None
+            self._wakeup = asyncio.Event()
+            self._changed = asyncio.Condition()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        return self._session
+
+    async def wait_delivered(self, last_id, timeout=None):
+        # True once every segment up to last_id has been sent (or given up on)
+        self.start()
+        try:
+            async with self._changed:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: not self._pending_upto(last_id)),
+                    timeout if timeout is not None else self.drain_timeout
+                )
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def aclose(self, timeout=None):
+        # Gives the sender a chance to finish, then stops it; undelivered segments stay on disk
+        if self._loop is asyncio.get_running_loop():
+            if self._task is not None:
+                last = self._conn.execute("SELECT MAX(id) FROM outbox").fetchone()[0]
+                if last and not await self.wait_delivered(last, timeout):
+                    print(f"{self.pending_count()} message segment(s) remain queued for the next run")
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                self._task = None
+            if self._session is not None:
+                await self._session.close()
+                self._session = None
+
+    async def _run(self):
+        while True:
+            head = self._head()
+            if head is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            row_id, chat_id, text, method, attempts, rate_limited, next_attempt = head
+            interval, last_sent = self._pacing.get(chat_id, (self.min_interval, 0.0))
+            wait = max(next_attempt - time.time(), last_sent + interval - time.monotonic())
+            if wait > 0:
+                self._wakeup.clear()
+                try:
+                    # A new enqueue wakes the loop early, the head is then simply re-checked
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._send(row_id, chat_id, text, method, attempts, rate_limited, interval)
+            except Exception as e:
+                # Keeps the sender alive; the segment is retried like any other failed attempt
+                print(f"Unexpected error while sending message segment {row_id}: {str(e) or type(e).__name__}")
+                try:
+                    self._retry(row_id, attempts + 1, str(e) or type(e).__name__)
+                except Exception as e:
+                    print(f"Could not reschedule message segment {row_id}: {str(e)}")
+                    await asyncio.sleep(self.retry_delay)
+            async with self._changed:
+                self._changed.notify_all()
+
+    @staticmethod
+    def _document_form(chat_id, text):
+        form = aiohttp.FormData()
+        form.add_field("chat_id", chat_id)
+        # Captions are limited to 1024 UTF-16 units, the first line of the report is enough
+        caption = text.strip().split('\n', 1)[0]
+        form.add_field("caption", caption[:_fit(caption, 1024)])
+        form.add_field("document", text.encode('utf-8'), content_type="text/plain",
+                       filename=f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        return form
+
+    async def _send(self, row_id, chat_id, text, method, attempts, rate_limited, interval):
+        from utils.resilience import parse_retry_after
+
+        status, body, retry_after = None, "", None
+        if method == 'sendDocument':
+            data = self._document_form(chat_id, text)
+        else:
+            data = {"chat_id": chat_id, "text": text}
+        try:
+            session = await self._get_session()
+            async with session.post(f"{self.base_url}/{method}", data=data) as response:
+                status = response.status
+                body = await response.text()
+                if status == 429:
+                    try:
+                        retry_after = (await response.json(content_type=None)).get("parameters", {}).get("retry_after")
+                    except Exception:
+                        retry_after = None
+                    # The header may also be an HTTP date
+                    retry_after = parse_retry_after(str(retry_after or response.headers.get("Retry-After") or ""))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            body = str(e) or type(e).__name__
+        self._pacing[chat_id] = [interval, time.monotonic()]
+
+        if status == 200:
+            # Speed back up towards the configured pace after each success
+            self._pacing[chat_id][0] = max(self.min_interval, interval * 0.8)
+            with self._conn:
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            print(f"Message segment sent successfully! (Length: {len(text)})")
+            return
+
+        if status == 429:
+            # Not counted as an attempt, but a chat that is never let through must not block the queue forever
+            rate_limited += 1
+            self._pacing[chat_id][0] = min(self.max_interval, interval * 2)
+            if rate_limited >= self.max_rate_limited:
+                print(f"Giving up on message segment after {rate_limited} rate-limited attempts")
+                self._fail(row_id, attempts, f"429: {body}")
+                return
+            delay = retry_after or self.retry_delay
+            print(f"Telegram rate limit hit, retrying in {delay:.1f}s")
+            self._reschedule(row_id, attempts, delay, body, rate_limited)
+            return
+
+        if status is not None and 400 <= status < 500:
+            # Bad request, wrong chat or token: retrying will not help
+            print(f"Message segment failed to send: {status}, {body}")
+            self._fail(row_id, attempts + 1, f"{status}: {body}")
+            return
+
+        self._retry(row_id, attempts + 1, f"{status}: {body}" if status else body)
+
+    def _retry(self, row_id, attempts, error):
+        # Backs off exponentially, or gives up once max_attempts is reached
+        if attempts >= self.max_attempts:
+            print(f"Giving up on message segment after {attempts} attempts: {error}")
+            self._fail(row_id, attempts, error)
+            return
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        print(f"Error occurred while sending message segment ({error}), retrying in {delay:.1f}s")
+        self._reschedule(row_id, attempts, delay, error)
+
+    def _reschedule(self, row_id, attempts, delay, error, rate_limited=None):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = ?, rate_limited = COALESCE(?, rate_limited), next_attempt = ?, "
+                "last_error = ? WHERE id = ?",
+                (attempts, rate_limited, time.time() + delay, error[:500], row_id)
+            )
+
+    def _fail(self, row_id, attempts, error):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, error[:500], row_id)
+            )
 
-def split_message(message, max_length=1000):
-    if len(message) <= max_length:
+
+_outbox = None
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        _outbox = TelegramOutbox(token=TELEGRAM.get('token'), api_url=TELEGRAM.get('api_url', 'https://api.telegram.org'),
+                                 **NOTIFY_QUEUE)
+    return _outbox
+
+
+async def close_outbox(timeout=None):
+    if _outbox is not None:
+        await _outbox.aclose(timeout)
+
+def utf16_length(text):
+    # Telegram counts message length in UTF-16 code units, emoji and other astral characters take two
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _split_keep(text, pattern):
+    # Pieces that join back to text, each ending right after a boundary
+    pieces, start = [], 0
+    for match in pattern.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    pieces.append(text[start:])
+    return pieces
+
+
+def _fit(text, limit):
+    # Number of leading characters that fit in limit UTF-16 units, never splitting a surrogate pair
+    encoded = text[:limit].encode('utf-16-le')
+    if len(encoded) <= 2 * limit:
+        return min(limit, len(text))
+    cut = 2 * limit
+    if 0xD8 <= encoded[cut - 1] <= 0xDB:
+        cut -= 2
+    return len(encoded[:cut].decode('utf-16-le'))
+
+
+def _split_words(text, limit, segments):
+    # Cuts a single overlong line at the last space that fits, or mid-word only if there is none
+    text = text.strip()
+    start = 0
+    while start < len(text):
+        end = start + _fit(text[start:start + limit], limit)
+        if end < len(text):
+            space = max(text.rfind(' ', start, end + 1), text.rfind('\t', start, end + 1))
+            if space > start:
+                end = space
+        segments.append(text[start:end].rstrip())
+        start = end
+        while start < len(text) and text[start] in ' \t':
+            start += 1
+
+
+def _pack(text, limit, level, segments):
+    # Greedily fills segments with whole pieces of this level; only a piece that is too long on
+    # its own is broken down at the next, finer level. Every character is measured once per level.
+    if level == len(SEGMENT_BOUNDARIES):
+        _split_words(text, limit, segments)
+        return
+
+    current, size = [], 0
+
+    def flush():
+        segment = "".join(current).strip()
+        if segment:
+            segments.append(segment)
+        current.clear()
+
+    for piece in _split_keep(text, SEGMENT_BOUNDARIES[level]):
+        units = utf16_length(piece)
+        if units > limit:
+            flush()
+            size = 0
+            _pack(piece, limit, level + 1, segments)
+            continue
+        if size + units > limit:
+            flush()
+            size = 0
+        current.append(piece)
+        size += units
+    flush()
+
+
+def split_message(message, max_length=TELEGRAM_MESSAGE_LIMIT):
+    # Splits at report sections first, then paragraphs, lines and words, so numbers and words
+    # are never cut unless a single word is longer than a whole message
+    if utf16_length(message) <= max_length:
         return [message]
-    
+
     segments = []
-    lines = message.split('\n')
-    current_segment = ""
-    
-    for line in lines:
-
-        if len(current_segment) + len(line) + 1 > max_length:
-            if current_segment:
-                segments.append(current_segment.strip())
-                current_segment = ""
-            
-            if len(line) > max_length:
-                while line:
-                    segments.append(line[:max_length])
-                    line = line[max_length:]
-            else:
-                current_segment = line
-        else:
-            if current_segment:
-                current_segment += '\n'
-            current_segment += line
-    
-    if current_segment:
-        segments.append(current_segment.strip())
-    
+    _pack(message, max_length - SEGMENT_HEADER_RESERVE, 0, segments)
+
     total = len(segments)
     segments = [f"[{i+1}/{total}]\n{segment}" for i, segment in enumerate(segments)]
     
     return segments
 
-async def send_message_async(message_content):
-    segments = split_message(message_content)
+async def send_telegram_async(message_content, chat_id=None, wait=True, timeout=None):
+    # Queues the message and, unless wait is False, waits for it to be delivered.
+    # Returns False if it is still queued after timeout (NOTIFY_QUEUE['drain_timeout'] by default).
+    chat_id = chat_id or TELEGRAM.get('chat_id')
+    if not TELEGRAM.get('token') or not chat_id:
+        print("Telegram is not configured, message not sent")
+        return False
+
+    threshold = TELEGRAM.get('document_threshold')
+    if threshold and utf16_length(message_content) > threshold:
+        # One file upload instead of a long run of numbered messages
+        segments, method = [message_content], 'sendDocument'
+        print("The message will be sent as a document")
+    else:
+        segments, method = split_message(message_content), 'sendMessage'
     total_segments = len(segments)
     
     if total_segments > 1:
         print(f"The message will be sent in {total_segments} segments")
     
-    headers = {'Content-Type': 'application/json'}
+    outbox = get_outbox()
+    ids = outbox.enqueue(chat_id, segments, method)
+    outbox.start()
+    if not wait:
+        return True
     
-    async with aiohttp.ClientSession() as session:
-        for i, segment in enumerate(segments):
-            success = await _send_single_message(session, segment)
-            
-            if not success:
-                print(f"Segment {i+1}/{total_segments} Segment message sending failed")
-                return
-            
-            if i < total_segments - 1:
-                await asyncio.sleep(0.5)
+    if not await outbox.wait_delivered(ids[-1], timeout):
+        print("Message not delivered yet, it stays queued and will be retried")
+        return False
+    
+    failed = outbox.failed_count(ids)
+    if failed:
+        print(f"{failed}/{total_segments} message segment(s) could not be delivered")
+        return False
     
     if total_segments > 1:
         print(f"All {total_segments} segments sent")
     else:
-        print("Message sent successfully!")
\ No newline at end of file
+        print("Message sent successfully!")
+    return True
+
+
+class Destination:
+    # One place a report is pushed to. Deliveries to a destination run one at a time, in order,
+    # at most one per min_interval seconds, and each is cut off after timeout seconds.
+
+    kind = None
+    # Destinations whose _deliver already stops after self.timeout are not cut off a second time
+    enforces_timeout = False
+
+    def __init__(self, name=None, timeout=60, min_interval=0):
+        self.name = name or self.kind
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._last_sent = 0.0
+        self.metrics = {"sent": 0, "failed": 0, "timeouts": 0, "total_latency": 0.0, "max_latency": 0.0}
+
+    def is_configured(self):
+        return True
+
+    async def deliver(self, message, notifier):
+        async with self._lock:
+            wait = self._last_sent + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            started = time.monotonic()
+            try:
+                if self.enforces_timeout:
+                    success = await self._deliver(message, notifier)
+                else:
+                    success = await asyncio.wait_for(self._deliver(message, notifier), self.timeout)
+            except asyncio.TimeoutError:
+                print(f"Delivery to {self.name} timed out after {self.timeout}s")
+                self.metrics["timeouts"] += 1
+                success = False
+            except Exception as e:
+                print(f"Delivery to {self.name} failed: {str(e)}")
+                success = False
+            latency = time.monotonic() - started
+            self._last_sent = time.monotonic()
+
+        self.metrics["sent" if success else "failed"] += 1
+        self.metrics["total_latency"] += latency
+        self.metrics["max_latency"] = max(self.metrics["max_latency"], latency)
+        return success
+
+    async def _deliver(self, message, notifier):
+        raise NotImplementedError
+
+
+class TelegramDestination(Destination):
+    kind = "telegram"
+    enforces_timeout = True
+
+    def __init__(self, chat_id=None, **kwargs):
+        super().__init__(**kwargs)
+        self.chat_id = chat_id or TELEGRAM.get('chat_id')
+
+    def is_configured(self):
+        return bool(TELEGRAM.get('token') and self.chat_id)
+
+    async def _deliver(self, message, notifier):
+        # The outbox keeps the message if this times out, so it still goes out later
+        return await send_telegram_async(message, chat_id=self.chat_id, timeout=self.timeout)
+
+
+class JsonWebhookDestination(Destination):
+    kind = "webhook"
+
+    def __init__(self, url=None, headers=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url or WEBHOOK_URL
+        self.headers = headers or {}
+
+    def is_configured(self):
+        return bool(self.url)
+
+    async def _deliver(self, message, notifier):
+        session = await notifier.get_session()
+        payload = {"text": message, "timestamp": datetime.now().isoformat()}
+        async with session.post(self.url, json=payload, headers=self.headers) as response:
+            if 200 <= response.status < 300:
+                return True
+            print(f"Webhook {self.name} rejected the message: {response.status}, {await response.text()}")
+            return False
+
+
+class FileDestination(Destination):
+    kind = "file"
+
+    def __init__(self, path=os.path.join('reports', 'notifications.log'), **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def _append(self, message):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(f"===== {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} =====\n{message}\n\n")
+
+    async def _deliver(self, message, notifier):
+        await asyncio.to_thread(self._append, message)
+        return True
+
+
+class StdoutDestination(Destination):
+    kind = "stdout"
+
+    async def _deliver(self, message, notifier):
+        print(message)
+        return True
+
+
+DESTINATION_TYPES = {
+    cls.kind: cls for cls in (TelegramDestination, JsonWebhookDestination, FileDestination, StdoutDestination)
+}
+
+
+class Notifier:
+    # Delivers one rendered message to every destination concurrently; a slow or failing
+    # destination only costs its own timeout
+
+    def __init__(self, destinations):
+        self.destinations = [destination for destination in destinations if destination.is_configured()]
+        self._session = None
+        self._pending = set()
+
+    @classmethod
+    def from_config(cls, entries):
+        destinations = []
+        for entry in entries:
+            options = dict(entry)
+            kind = options.pop('type')
+            if kind not in DESTINATION_TYPES:
+                raise ValueError(f"Unknown notification destination type: {kind}")
+            destinations.append(DESTINATION_TYPES[kind](**options))
+        return cls(destinations)
+
+    async def get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def notify(self, message):
+        # Returns {destination name: delivered}
+        if not self.destinations:
+            print("No notification destination is configured, message not sent")
+            return {}
+        results = await asyncio.gather(*(destination.deliver(message, self) for destination in self.destinations))
+        return {destination.name: result for destination, result in zip(self.destinations, results)}
+
+    def notify_nowait(self, message):
+        task = asyncio.get_running_loop().create_task(self.notify(message))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return task
+
+    def get_metrics(self):
+        metrics = {}
+        for destination in self.destinations:
+            stats = dict(destination.metrics)
+            count = stats["sent"] + stats["failed"]
+            stats["avg_latency"] = stats["total_latency"] / count if count else 0.0
+            metrics[destination.name] = stats
+        return metrics
+
+    async def aclose(self):
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        for name, stats in self.get_metrics().items():
+            if stats["sent"] or stats["failed"]:
+                print(f"Notifications to {name}: {stats['sent']} delivered, {stats['failed']} failed "
+                      f"({stats['timeouts']} timed out), avg {stats['avg_latency']:.2f}s, max {stats['max_latency']:.2f}s")
+
+
+_notifier = None
+
+
+def get_notifier():
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier.from_config(NOTIFY_DESTINATIONS)
+    return _notifier
+
+
+async def send_message_async(message_content, wait=True):
+    # Pushes the message to every configured destination. With wait=False it returns at once
+    # and close_notifier() waits for the deliveries.
+    notifier = get_notifier()
+    if not wait:
+        notifier.notify_nowait(message_content)
+        return True
+    results = await notifier.notify(message_content)
+    return bool(results) and all(results.values())
+
+
+async def close_notifier():
+    if _notifier is not None:
+        await _notifier.aclose()
+    await close_outbox()
+
+
+def benchmark_split_message(size=100_000, repeat=20):
+    # split_message against the previous 1000-character splitter on synthetic LLM output of
+    # about size characters (markdown sections with CJK and emoji, and one long single line)
+    import random
+
+    def legacy_split(message, max_length=1000):
+        if len(message) <= max_length:
+            return [message]
+        segments, current = [], ""
+        for line in message.split('\n'):
+            if len(current) + len(line) + 1 > max_length:
+                if current:
+                    segments.append(current.strip())
+                    current = ""
+                if len(line) > max_length:
+                    segments.extend(line[i:i + max_length] for i in range(0, len(line), max_length))
+                else:
+                    current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            segments.append(current.strip())
+        return [f"[{i+1}/{len(segments)}]\n{segment}" for i, segment in enumerate(segments)]
+
+    rng = random.Random(1)
+    words = ["BTC", "价格", "$64,312.55", "AHR999", "0.8731", "📈", "support", "resistance", "accumulate",
+             "减仓", "volatility", "30-day"]
+    blocks, length = [], 0
+    while length < size:
+        heading = f"【💡 Section {len(blocks)}】" if rng.random() < 0.2 else f"## {len(blocks)}. Heading"
+        lines = [heading]
+        for _ in range(rng.randint(1, 6)):
+            lines.append(" ".join(rng.choice(words) for _ in range(rng.randint(5, 120))))
+            if rng.random() < 0.3:
+                lines.append("")
+        block = "\n".join(lines) + "\n"
+        blocks.append(block)
+        length += len(block)
+    cases = {
+        "markdown report": "\n".join(blocks)[:size],
+        "single long line": " ".join(rng.choice(words) for _ in range(size // 6))[:size],
+    }
+
+    results = []
+    for case, text in cases.items():
+        for name, split in (("legacy 1000 chars", legacy_split), ("split_message", split_message)):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                segments = split(text)
+            elapsed = (time.perf_counter() - started) / repeat
+            bodies = [re.sub(r'^\[\d+/\d+\]\n', '', segment) for segment in segments]
+            results.append({
+                "case": case,
+                "splitter": name,
+                "segments": len(segments),
+                "ms": round(elapsed * 1000, 2),
+                "over_limit": sum(utf16_length(segment) > TELEGRAM_MESSAGE_LIMIT for segment in segments),
+                "words_cut": text.split() != " ".join(bodies).split(),
+                "start_at_heading": sum(bool(re.match(r'(【|## )', body)) for body in bodies),
+            })
+    return results
+
+
+async def check_outbox_against_stub():
+    # TelegramOutbox against a local stub of the Bot API, one segment per behaviour: accepted at once,
+    # a 429 with an unparsable Retry-After, a 429 with retry_after in the body, a 502, a dropped
+    # connection, a 400, a chat that is always rate limited, and a document upload. Accepted segments
+    # must arrive once each and in order, the 400 and the capped chat must be given up on, and
+    # nothing may stay pending.
+    import socket
+    import tempfile
+    from aiohttp import web
+
+    calls = {}
+    delivered = []
+
+    async def handler(request):
+        form = await request.post()
+        if request.match_info['method'] == 'sendDocument':
+            key = "document"
+            valid = utf16_length(form.get("caption", "")) <= 1024 and "document" in form
+        else:
+            key, valid = form.get("text", ""), True
+        calls[key] = calls.get(key, 0) + 1
+        first = calls[key] == 1
+        if key == "retry-after-header" and first:
+            return web.json_response({"ok": False}, status=429, headers={"Retry-After": "soon"})
+        if key == "retry-after-body" and first:
+            return web.json_response({"ok": False, "parameters": {"retry_after": 0.05}}, status=429)
+        if key == "server-error" and first:
+            return web.Response(status=502, text="bad gateway")
+        if key == "dropped" and first:
+            request.transport.close()
+            return web.Response()
+        if key == "bad-request" or not valid:
+            return web.json_response({"ok": False, "description": "Bad Request"}, status=400)
+        if form.get("chat_id") == "busy":
+            return web.json_response({"ok": False}, status=429)
+        delivered.append(key)
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.add_routes([web.post('/botstub/{method}', handler)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    await web.SockSite(runner, sock).start()
+
+    texts = ["accepted", "retry-after-header", "retry-after-body", "server-error", "dropped", "bad-request"]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            outbox = TelegramOutbox(os.path.join(directory, "outbox.sqlite3"), "stub",
+                                    api_url=f"http://127.0.0.1:{sock.getsockname()[1]}", min_interval=0.01,
+                                    max_interval=0.05, max_attempts=3, max_rate_limited=3, retry_delay=0.01,
+                                    request_timeout=5, drain_timeout=10)
+            ids = outbox.enqueue("1", texts)
+            ids += outbox.enqueue("busy", ["capped"])
+            caption = "📈" * 600 + "\nbody"
+            ids += outbox.enqueue("1", [caption], method='sendDocument')
+            started = time.perf_counter()
+            drained = await outbox.wait_delivered(ids[-1])
+            elapsed = time.perf_counter() - started
+            failed = [row[0][:20] for row in outbox._conn.execute("SELECT text FROM outbox WHERE status = 'failed' ORDER BY id")]
+            pending = outbox.pending_count()
+            await outbox.aclose(timeout=1)
+            outbox._conn.close()
+    finally:
+        await runner.cleanup()
+
+    expected = ["accepted", "retry-after-header", "retry-after-body", "server-error", "dropped", "document"]
+    return {
+        "drained": drained,
+        "seconds": round(elapsed, 2),
+        "delivered": delivered,
+        "failed": failed,
+        "pending": pending,
+        "requests": calls,
+        "ok": drained and delivered == expected and failed == ["bad-request", "capped"] and pending == 0
+              and calls.get("bad-request") == 1,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    # The outbox imports utils.resilience lazily, which main.py otherwise puts on the path
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+    for result in benchmark_split_message():
+        print(result)
+
+    result = asyncio.run(check_outbox_against_stub())
+    print(result)
+    if not result["ok"]:
+        raise SystemExit("The outbox did not handle the stub responses as expected")